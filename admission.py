@@ -0,0 +1,170 @@
+import os
+import time
+import threading
+from collections import deque
+from flask import request, g, abort
+from models import DATABASE_POOL_SIZE, DATABASE_MAX_OVERFLOW, GEVENT_WORKERS
+import metrics
+
+
+# Shed the load of an overloaded worker (set ADMISSION_ENABLED=false to
+# disable)
+ADMISSION_ENABLED = os.environ.get(
+    'ADMISSION_ENABLED', 'true').lower() not in ('false', '0', 'no')
+# Requests served at once by a worker (default: the connections of its
+# database pool, 5 + 10 by default)
+ADMISSION_MAX_CONCURRENCY = int(os.environ.get(
+    'ADMISSION_MAX_CONCURRENCY',
+    int(DATABASE_POOL_SIZE or 5) + int(DATABASE_MAX_OVERFLOW or 10)))
+# Slots only the writes can use, so the reads never take all of them
+ADMISSION_WRITE_RESERVE = int(os.environ.get('ADMISSION_WRITE_RESERVE', 2))
+# Longest wait (in seconds) for a slot before answering 503
+ADMISSION_QUEUE_TIMEOUT = float(
+    os.environ.get('ADMISSION_QUEUE_TIMEOUT', 0.1))
+# The reads are shed while the average wait for a pool connection over
+# the last ADMISSION_WINDOW seconds is above this many seconds
+ADMISSION_POOL_WAIT_THRESHOLD = float(
+    os.environ.get('ADMISSION_POOL_WAIT_THRESHOLD', 0.5))
+ADMISSION_WINDOW = float(os.environ.get('ADMISSION_WINDOW', 1))
+# Retry-After (in seconds) of the 503 responses
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 1))
+# Cheap routes that are always served (and the change streams of the
+# gevent workers, which would hold a slot for minutes without using the
+# database; a sync worker ends them right away, see changes.py)
+ADMISSION_EXEMPT_PATHS = os.environ.get(
+    'ADMISSION_EXEMPT_PATHS',
+    '/,/metrics,/changes/stream' if GEVENT_WORKERS else '/,/metrics').split(
+        ',')
+
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+'''
+Admission control
+When the database slows down, the requests of a worker used to pile up
+waiting for a pool connection and the latency grew without limit for
+every client. Instead, a worker serves at most ADMISSION_MAX_CONCURRENCY
+requests at once, a request waits at most ADMISSION_QUEUE_TIMEOUT for a
+slot, and the reads are refused right away while the pool wait is above
+ADMISSION_POOL_WAIT_THRESHOLD. The refused requests get a 503 with a
+Retry-After header. The writes have priority: they can use the reserved
+slots, a read doesn't take a slot a write is waiting for, and they are
+still admitted while the reads are shed.
+'''
+
+
+class PoolWaitWindow:
+    # The pool waits of the last `window` seconds (fed by metrics.py)
+    def __init__(self, window=ADMISSION_WINDOW):
+        self.window = window
+        self._samples = deque()
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        while self._samples and self._samples[0][0] < now - self.window:
+            self._samples.popleft()
+
+    def add(self, seconds):
+        now = time.monotonic()
+        with self._lock:
+            self._samples.append((now, seconds))
+            self._prune(now)
+
+    def average(self):
+        # No recent checkout (e.g. every read was shed) counts as no wait,
+        # so the reads are admitted again
+        with self._lock:
+            self._prune(time.monotonic())
+            if not self._samples:
+                return 0.0
+            return sum(seconds for _, seconds in self._samples) / \
+                len(self._samples)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+
+
+class Limiter:
+    def __init__(self, limit=ADMISSION_MAX_CONCURRENCY,
+                 reserve=ADMISSION_WRITE_RESERVE):
+        self.limit = limit
+        # The reads can't use the last `reserve` slots
+        self.read_limit = max(limit - reserve, 1)
+        self.active = 0
+        self._waiting_writes = 0
+        self._condition = threading.Condition()
+
+    def _full(self, write):
+        if write:
+            return self.active >= self.limit
+        return self.active >= self.read_limit or self._waiting_writes > 0
+
+    def acquire(self, write, timeout=ADMISSION_QUEUE_TIMEOUT):
+        # Take a slot, waiting at most timeout seconds. Return whether
+        # the request got one
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            if write:
+                self._waiting_writes += 1
+            try:
+                while self._full(write):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._condition.wait(remaining)
+                self.active += 1
+                return True
+            finally:
+                if write:
+                    self._waiting_writes -= 1
+                    # The reads blocked by this write can check again
+                    self._condition.notify_all()
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+
+pool_waits = PoolWaitWindow()
+limiter = Limiter()
+
+
+def overloaded():
+    return pool_waits.average() > ADMISSION_POOL_WAIT_THRESHOLD
+
+
+def _reject(reason):
+    metrics.SHED_REQUESTS.labels(reason).inc()
+    # Answered by the 503 error handler (with the Retry-After header)
+    abort(503)
+
+
+def admit():
+    if request.method == 'OPTIONS' or \
+            request.path in ADMISSION_EXEMPT_PATHS:
+        return
+    write = request.method in WRITE_METHODS
+    if not write and overloaded():
+        _reject('overloaded')
+    if not limiter.acquire(write):
+        _reject('queue_timeout')
+    g.admitted = True
+
+
+def release(error=None):
+    if g.pop('admitted', False):
+        limiter.release()
+
+
+def init_app(app):
+    if 'admission' in app.extensions or not ADMISSION_ENABLED:
+        return
+    app.extensions['admission'] = True
+    app.before_request(admit)
+    # Runs once the response is sent (streamed ones included)
+    app.teardown_request(release)
+
+
+metrics.pool_wait_listeners.append(pool_waits.add)
@@ -1,10 +1,33 @@
 import os
-from flask import Flask, render_template, request, abort, jsonify
+import click
+from flask import Flask, render_template, request, abort
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from models import setup_db, Movie, Actor
-from auth import AuthError, requires_auth
-import json
+from models import setup_db, db, Movie, Actor, Casting, missing_ids, \
+    get_stats, rebuild_stats, stamp_changes
+from auth import AuthError, requires_auth, token_cache
+from pagination import wants_pagination, get_page_size, paginate, ordered
+from sync import get_since, changes_since
+from streaming import wants_stream, stream_rows
+from projection import get_fields, project, row_formatter
+from filters import get_sort, filter_movies, filter_actors, \
+    MOVIE_SORTS, ACTOR_SORTS
+from conditional import conditional
+from cache import cached, response_cache
+import metrics
+import profiler
+import compression
+import search
+import export
+import importer
+import admission
+import changes
+from bulk import read_rows, validate_rows, validate_movie, validate_actor, \
+    validate_casting, read_pairs, read_selection, read_columns, \
+    MOVIE_FIELDS, ACTOR_FIELDS
+from serializers import respond
+from includes import get_includes, rows_formatter, movie_cast, \
+    actor_movies, MOVIE_INCLUDES, ACTOR_INCLUDES
 
 
 def create_app(test_config=None):
@@ -12,6 +35,17 @@ def create_app(test_config=None):
     app = Flask(__name__)
     setup_db(app)  # to setup the database
     CORS(app)
+    # Collect the latency, auth and database metrics of every request
+    metrics.init_app(app)
+    # Answer 503 instead of queueing when the worker is overloaded
+    admission.init_app(app)
+    # Server-Timing header and SQL profile of the requests that ask for it
+    profiler.init_app(app)
+    # Compress the large responses (gzip, brotli or zstd)
+    compression.init_app(app)
+    # Search with the full-text indexes of GET /search (if the database
+    # has them)
+    search.init_app(app)
 
     '''
   Use the after_request decorator to set Access-Control-Allow
@@ -20,40 +54,176 @@ def create_app(test_config=None):
     def after_request(response):
         response.headers.add(
             'Access-Control-Allow-Headers',
-            'Content-Type,Authorization,true')
+            'Content-Type,Authorization,X-Profile,Last-Event-ID,true')
         response.headers.add('Access-Control-Allow-Methods',
                              'GET,PUT,POST,DELETE,OPTIONS')
+        response.headers.add('Access-Control-Expose-Headers',
+                             'ETag,Last-Modified,Server-Timing,'
+                             'X-Query-Count,Retry-After')
         return response
 
+    # Recompute the catalogue statistics from the tables
+    # (flask rebuild-stats), e.g. after rows were changed outside the app
+    @app.cli.command('rebuild-stats')
+    def rebuild_stats_command():
+        deltas = rebuild_stats()
+        print('Rebuilt %d statistics' % len(deltas))
+
+    # Stamp the rows written outside the app (flask stamp-changes), so
+    # the delta syncs return them
+    @app.cli.command('stamp-changes')
+    def stamp_changes_command():
+        tables = stamp_changes()
+        print('Stamped the new rows of %d tables' % len(tables))
+
+    # Delete the change events and the tombstones older than the
+    # retention now (flask prune-changes --days 30), the workers also do
+    # it every hour
+    @app.cli.command('prune-changes')
+    @click.option('--days', default=changes.CHANGES_RETENTION_DAYS)
+    def prune_changes_command(days):
+        with db.engine.begin() as connection:
+            events = changes.prune_changes(connection, days)
+        print('Deleted %d change events' % events)
+
+    # Dump the tables (all of them by default) to <table>.<format>[.gz]
+    # files, e.g. flask export movies --format jsonl --gzip
+    @app.cli.command('export')
+    @click.argument('tables', nargs=-1,
+                    type=click.Choice(sorted(export.EXPORT_TABLES)))
+    @click.option('--format', 'fmt', default='csv',
+                  type=click.Choice(sorted(export.EXPORT_FORMATS)))
+    @click.option('--output-dir', default='.',
+                  type=click.Path(file_okay=False, writable=True))
+    @click.option('--gzip', 'compress', is_flag=True)
+    @click.option('--batch-size', default=export.EXPORT_BATCH_SIZE)
+    def export_command(tables, fmt, output_dir, compress, batch_size):
+        for path, rows in export.export_files(
+                tables or list(export.EXPORT_TABLES), fmt, output_dir,
+                compress, batch_size):
+            print('Exported %d rows to %s' % (rows, path))
+
+    # Load a CSV or JSONL file (gzipped or not) into a table, e.g.
+    # flask import movies movies.csv.gz --rejects rejects.jsonl
+    @app.cli.command('import')
+    @click.argument('table', type=click.Choice(sorted(importer.IMPORT_TABLES)))
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']),
+                  help='Default: from the extension of the file')
+    @click.option('--batch-size', default=importer.IMPORT_BATCH_SIZE)
+    @click.option('--rejects', type=click.Path(dir_okay=False),
+                  help='JSONL file of the rows that fail the validation')
+    @click.option('--checkpoint', type=click.Path(dir_okay=False),
+                  help='Progress file, to resume an interrupted import')
+    @click.option('--defer-indexes', is_flag=True,
+                  help='Drop the indexes during the load, build them after')
+    @click.option('--keep-ids', is_flag=True,
+                  help='Insert the ids of the file (e.g. a flask export)')
+    def import_command(table, path, fmt, batch_size, rejects, checkpoint,
+                       defer_indexes, keep_ids):
+        state = importer.import_file(
+            table, path, fmt, batch_size, rejects, checkpoint,
+            defer_indexes, keep_ids, progress=click.echo)
+        print('Imported %d rows into %s (%d rejected)' % (
+            state['imported'], table, state['rejected']))
+
     # This endpoint shows a welcome message
     @app.route('/')
     def index():
-        return jsonify({
+        return respond({
             'message': 'Welcome to our Casting Agency!'
         }), 200
         # return render_template('home.html')
 
+    # This endpoint exposes the metrics in the Prometheus text format
+    @app.route('/metrics')
+    def get_metrics():
+        return metrics.metrics_response()
+
+    # The tables a list response is built from: the includes add the
+    # castings and the other side of them
+    def movie_tables():
+        if request.args.get('include'):
+            return ('movies', 'castings', 'actors')
+        return 'movies'
+
+    def actor_tables():
+        if request.args.get('include'):
+            return ('actors', 'castings', 'movies')
+        return 'actors'
+
     # This endpoint RETRIEVES all movies
     @app.route('/movies')  # The default method is GET
     # Require the 'get:movies' permission
     @requires_auth('get:movies')
+    # Answer 304 Not Modified if the movies didn't change
+    @conditional(movie_tables)
+    # Serve the response from the cache if it was already built
+    @cached(movie_tables)
     # Because of calling the 'requires_auth', we need to
     # take the payload as it returns it
     def get_movies(payload):
-        # Retrieve all movies from the database
-        movies = Movie.query.all()
-        moviesList = []
-        for movie in movies:
-          # Add the movie to the list
-            moviesList.append({"id": movie.id,
-                               "title": movie.title,
-                               "release_date": movie.release_date})
+        # Select only the requested fields (?fields=), or all of them
+        fields = get_fields(request.args, Movie)
+
+        # Return only the movies written and deleted after the client's
+        # watermark (?since=), and the next watermark
+        if 'since' in request.args:
+            movies, deleted, watermark, more, reset = changes_since(
+                Movie, get_since(request.args), get_page_size(request.args),
+                fields)
+            return respond({
+                'success': True,
+                'movies': movies,
+                'deleted': deleted,
+                'watermark': watermark,
+                'more': more,
+                'reset': reset
+            }), 200
+
+        # Get the sort (?sort=) and keep only the movies matching the
+        # filters
+        sort_column, descending = get_sort(request.args, Movie, MOVIE_SORTS)
+        query = filter_movies(
+            project(Movie, fields, [sort_column.key]), request.args, Movie)
+        # Load the related rows (?include=) of all the rows at once
+        format_movies = rows_formatter(
+            row_formatter(fields), get_includes(request.args, MOVIE_INCLUDES))
+
+        # Stream the whole table (NDJSON or chunked JSON) if the
+        # client asked for it
+        stream = wants_stream(request)
+        if stream:
+            return stream_rows(
+                stream, ordered(query, sort_column, Movie.id, descending),
+                'movies', format_rows=format_movies)
+
+        # Return the whole table only if the deployment allows it
+        # and the client didn't ask for a page
+        if not wants_pagination(request.args):
+            # Retrieve all movies from the database
+            movies = ordered(query, sort_column, Movie.id, descending).all()
+            moviesList = format_movies(movies)
+
+            return respond({
+                'success': True,
+                'movies': moviesList
+            }), 200
+
+        # Retrieve one page of movies from the database, starting
+        # after the cursor (if any)
+        movies, next_cursor = paginate(
+            query, sort_column, Movie.id,
+            get_page_size(request.args),
+            request.args.get('cursor'), descending)
 
         # Return a status code 200 and json of movie's
-        # details and set the success message to true
-        return jsonify({
+        # details, the next page's cursor and set the success
+        # message to true
+        return respond({
             'success': True,
-            'movies': moviesList
+            'movies': format_movies(movies),
+            'next_cursor': next_cursor
         }), 200
         # return render_template('show_movies.html',
         # movies=moviesList)
@@ -63,28 +233,208 @@ def create_app(test_config=None):
     @app.route('/actors')  # The default method is GET
     # Require the 'get:actors' permission
     @requires_auth('get:actors')
+    # Answer 304 Not Modified if the actors didn't change
+    @conditional(actor_tables)
+    # Serve the response from the cache if it was already built
+    @cached(actor_tables)
     # Because of calling the 'requires_auth', we need to
     # take the payload as it returns it
     def get_actors(payload):
-        # Retrieve all actors from the database
-        actors = Actor.query.all()
-        actorsList = []
-        for actor in actors:
-          # Add the actor to the list
-            actorsList.append({"id": actor.id,
-                               "name": actor.name,
-                               "age": actor.age,
-                               "gender": actor.gender})
+        # Select only the requested fields (?fields=), or all of them
+        fields = get_fields(request.args, Actor)
+
+        # Return only the actors written and deleted after the client's
+        # watermark (?since=), and the next watermark
+        if 'since' in request.args:
+            actors, deleted, watermark, more, reset = changes_since(
+                Actor, get_since(request.args), get_page_size(request.args),
+                fields)
+            return respond({
+                'success': True,
+                'actors': actors,
+                'deleted': deleted,
+                'watermark': watermark,
+                'more': more,
+                'reset': reset
+            }), 200
+
+        # Get the sort (?sort=) and keep only the actors matching the
+        # filters
+        sort_column, descending = get_sort(request.args, Actor, ACTOR_SORTS)
+        query = filter_actors(
+            project(Actor, fields, [sort_column.key]), request.args, Actor)
+        # Load the related rows (?include=) of all the rows at once
+        format_actors = rows_formatter(
+            row_formatter(fields), get_includes(request.args, ACTOR_INCLUDES))
+
+        # Stream the whole table (NDJSON or chunked JSON) if the
+        # client asked for it
+        stream = wants_stream(request)
+        if stream:
+            return stream_rows(
+                stream, ordered(query, sort_column, Actor.id, descending),
+                'actors', nested=True, format_rows=format_actors)
+
+        # Return the whole table only if the deployment allows it
+        # and the client didn't ask for a page
+        if not wants_pagination(request.args):
+            # Retrieve all actors from the database
+            actors = ordered(query, sort_column, Actor.id, descending).all()
+            actorsList = format_actors(actors)
+
+            return respond({
+                'success': True,
+                'actors': [actorsList]
+            }), 200
+
+        # Retrieve one page of actors from the database, starting
+        # after the cursor (if any)
+        actors, next_cursor = paginate(
+            query, sort_column, Actor.id,
+            get_page_size(request.args),
+            request.args.get('cursor'), descending)
 
         # Return a status code 200 and json of actor's
-        # details and set the success message to true
-        return jsonify({
+        # details, the next page's cursor and set the success
+        # message to true
+        return respond({
             'success': True,
-            'actors': [actorsList]
+            'actors': [format_actors(actors)],
+            'next_cursor': next_cursor
         }), 200
         # return render_template('show_actors.html',
         # actors=actorsList)
 
+    # This endpoint RETRIEVES the cast of a movie (the actors and
+    # their roles)
+    @app.route('/movies/<int:id>/cast')
+    # Require the 'get:actors' permission
+    @requires_auth('get:actors')
+    # Because of calling the 'requires_auth', we need to
+    # take the payload as it returns it
+    def get_movie_cast(payload, id):
+        # If the movie doesn't exist, send an error (not found - 404)
+        if Movie.query.get(id) is None:
+            abort(404)
+
+        return respond({
+            'success': True,
+            'movie_id': id,
+            'cast': movie_cast([id])[id]
+        }), 200
+
+    # This endpoint RETRIEVES the movies of an actor (with the actor's
+    # role in each of them)
+    @app.route('/actors/<int:id>/movies')
+    # Require the 'get:movies' permission
+    @requires_auth('get:movies')
+    # Because of calling the 'requires_auth', we need to
+    # take the payload as it returns it
+    def get_actor_movies(payload, id):
+        # If the actor doesn't exist, send an error (not found - 404)
+        if Actor.query.get(id) is None:
+            abort(404)
+
+        return respond({
+            'success': True,
+            'actor_id': id,
+            'movies': actor_movies([id])[id]
+        }), 200
+
+    # The types GET /search returns (?type=), each needs its 'get:'
+    # permission
+    def search_tables():
+        return search.get_types(request.args)
+
+    def search_permissions():
+        return ['get:' + name for name in search_tables()]
+
+    # This endpoint SEARCHES the movie titles and the actor names
+    @app.route('/search')
+    # Require the 'get:movies' and/or 'get:actors' permissions
+    @requires_auth(search_permissions)
+    # Answer 304 Not Modified if the searched tables didn't change
+    @conditional(search_tables)
+    # Serve the response from the cache if it was already built
+    @cached(search_tables)
+    # Because of calling the 'requires_auth', we need to
+    # take the payload as it returns it
+    def search_catalogue(payload):
+        # Check the client sent the words to search (?q=)
+        q = request.args.get('q', '').strip()
+        if not q:
+            # If not, send an error (bad request - 400)
+            abort(400)
+        # At most ?limit= results of each type
+        limit = get_page_size(request.args)
+
+        body = {'success': True, 'query': q}
+        for name in search_tables():
+            # The most relevant first, with their score
+            body[name] = [
+                dict(row.format(), score=round(float(rank), 4))
+                for row, rank in search.search(
+                    app.extensions['search'], name, q, limit)]
+        return respond(body), 200
+
+    # This endpoint EXPORTS a whole table (?table=movies or actors) as
+    # CSV or JSONL (?format=), gzipped if ?gzip=true
+    @app.route('/export')
+    # Require the 'get:' permission of the table
+    @requires_auth(lambda: ['get:' + export.get_table(request.args)])
+    # Because of calling the 'requires_auth', we need to
+    # take the payload as it returns it
+    def export_table(payload):
+        table = export.get_table(request.args)
+        fmt = export.get_format(request.args)
+        compress = request.args.get('gzip', '').lower() in ('true', '1')
+        # Streamed from a server-side cursor, in one snapshot
+        return export.export_response(table, fmt, compress)
+
+    # This endpoint STREAMS the changes of the movies and the actors
+    # (?tables=) as Server-Sent Events, from the Last-Event-ID header if
+    # the client reconnects
+    @app.route('/changes/stream')
+    # Require the 'get:' permission of every streamed table
+    @requires_auth(lambda: [
+        'get:' + name for name in changes.get_tables(request.args)])
+    # Because of calling the 'requires_auth', we need to
+    # take the payload as it returns it
+    def stream_changes(payload):
+        return changes.stream_changes(
+            app, changes.get_tables(request.args),
+            request.headers.get('Last-Event-ID'),
+            changes.get_duration(request.args))
+
+    # This endpoint RETRIEVES the statistics of the catalogue (the actors
+    # per gender and age range, the movies per release year)
+    @app.route('/stats')
+    # Require the 'get:movies' permission
+    @requires_auth('get:movies')
+    # Answer 304 Not Modified if the movies and the actors didn't change
+    @conditional(('movies', 'actors'))
+    # Serve the response from the cache if it was already built
+    @cached(('movies', 'actors'))
+    # Because of calling the 'requires_auth', we need to
+    # take the payload as it returns it
+    def get_catalogue_stats(payload):
+        # The counts are kept up to date by the writes (see models.py),
+        # so this doesn't scan the tables
+        return respond(dict(get_stats(), success=True)), 200
+
+    # This endpoint RETRIEVES the statistics of the in-process caches
+    @app.route('/cache/stats')
+    # Require the 'get:movies' permission
+    @requires_auth('get:movies')
+    # Because of calling the 'requires_auth', we need to
+    # take the payload as it returns it
+    def get_cache_stats(payload):
+        return respond({
+            'success': True,
+            'responses': response_cache.stats(),
+            'tokens': token_cache.stats()
+        }), 200
+
     """
     # This endpoint redirects the user to the new movie form
     @app.route('/movies/create', methods=['GET'])
@@ -136,7 +486,7 @@ def create_app(test_config=None):
 
             # Return a status code 200 and json of movie's
             # details and set the success message to true
-            return jsonify({
+            return respond({
                 'success': True,
                 'movie': movie.format()
             }), 200
@@ -202,7 +552,7 @@ def create_app(test_config=None):
 
             # Return a status code 200 and json of actor's
             # details and set the success message to true
-            return jsonify({
+            return respond({
                 'success': True,
                 'actor': actor.format()
             }), 200
@@ -213,6 +563,271 @@ def create_app(test_config=None):
             # INSERT, send an error (unprocessable - 422)
             abort(422)
 
+    # This endpoint CREATES many movies at once (a JSON array or
+    # NDJSON body) in a single transaction
+    @app.route('/movies/bulk', methods=['POST'])
+    # Require the 'post:movies' permission
+    @requires_auth('post:movies')
+    # Because of calling the 'requires_auth', we need to
+    # take the payload as it returns it
+    def add_movies_bulk(payload):
+        rows = read_rows(request)
+        # Validate all the movies before inserting any of them
+        movies, errors = validate_rows(rows, validate_movie)
+        if errors:
+            # If at least one movie is invalid, nothing is inserted and
+            # the errors of each row are sent (unprocessable - 422)
+            return respond({
+                'success': False,
+                'error': 422,
+                'message': 'Not Processable',
+                'results': errors
+            }), 422
+
+        try:
+            # Insert all the movies to the database
+            ids = Movie.bulk_insert(movies)
+        except BaseException:
+            db.session.rollback()
+            # If an error occured while proccessing the
+            # INSERT, send an error (unprocessable - 422)
+            abort(422)
+
+        # Return a status code 200 and the id of each created movie
+        return respond({
+            'success': True,
+            'created': len(ids),
+            'results': [{'index': index, 'id': id}
+                        for index, id in enumerate(ids)]
+        }), 200
+
+    # This endpoint CREATES many actors at once (a JSON array or
+    # NDJSON body) in a single transaction
+    @app.route('/actors/bulk', methods=['POST'])
+    # Require the 'post:actors' permission
+    @requires_auth('post:actors')
+    # Because of calling the 'requires_auth', we need to
+    # take the payload as it returns it
+    def add_actors_bulk(payload):
+        rows = read_rows(request)
+        # Validate all the actors before inserting any of them
+        actors, errors = validate_rows(rows, validate_actor)
+        if errors:
+            # If at least one actor is invalid, nothing is inserted and
+            # the errors of each row are sent (unprocessable - 422)
+            return respond({
+                'success': False,
+                'error': 422,
+                'message': 'Not Processable',
+                'results': errors
+            }), 422
+
+        try:
+            # Insert all the actors to the database
+            ids = Actor.bulk_insert(actors)
+        except BaseException:
+            db.session.rollback()
+            # If an error occured while proccessing the
+            # INSERT, send an error (unprocessable - 422)
+            abort(422)
+
+        # Return a status code 200 and the id of each created actor
+        return respond({
+            'success': True,
+            'created': len(ids),
+            'results': [{'index': index, 'id': id}
+                        for index, id in enumerate(ids)]
+        }), 200
+
+    # This endpoint CASTS many actors in movies at once (a JSON array or
+    # NDJSON body of {movie_id, actor_id, role}) in a single transaction
+    @app.route('/castings/bulk', methods=['POST'])
+    # Require the 'patch:movies' permission
+    @requires_auth('patch:movies')
+    # Because of calling the 'requires_auth', we need to
+    # take the payload as it returns it
+    def assign_castings_bulk(payload):
+        rows = read_rows(request)
+        # Validate all the castings before saving any of them
+        castings, errors = validate_rows(rows, validate_casting)
+        if not errors:
+            # Check the movies and the actors exist (one query each)
+            missing_movies = missing_ids(
+                Movie, [casting['movie_id'] for casting in castings])
+            missing_actors = missing_ids(
+                Actor, [casting['actor_id'] for casting in castings])
+            for index, casting in enumerate(castings):
+                row_errors = []
+                if casting['movie_id'] in missing_movies:
+                    row_errors.append('movie not found')
+                if casting['actor_id'] in missing_actors:
+                    row_errors.append('actor not found')
+                if row_errors:
+                    errors.append({'index': index, 'errors': row_errors})
+        if errors:
+            # If at least one casting is invalid, nothing is saved and
+            # the errors of each row are sent (unprocessable - 422)
+            return respond({
+                'success': False,
+                'error': 422,
+                'message': 'Not Processable',
+                'results': errors
+            }), 422
+
+        try:
+            # Save all the castings to the database
+            assigned = Casting.assign(castings)
+        except BaseException:
+            db.session.rollback()
+            # If an error occured while proccessing the
+            # INSERT, send an error (unprocessable - 422)
+            abort(422)
+
+        return respond({
+            'success': True,
+            'assigned': assigned
+        }), 200
+
+    # This endpoint REMOVES many actors from movies at once
+    # ({"pairs": [[movie_id, actor_id], ...]})
+    @app.route('/castings/bulk', methods=['DELETE'])
+    # Require the 'patch:movies' permission
+    @requires_auth('patch:movies')
+    # Because of calling the 'requires_auth', we need to
+    # take the payload as it returns it
+    def unassign_castings_bulk(payload):
+        pairs = read_pairs(request.get_json(silent=True))
+
+        try:
+            unassigned, not_found = Casting.unassign(pairs)
+        except BaseException:
+            db.session.rollback()
+            # If an error occured while proccessing the
+            # DELETE, send an error (unprocessable - 422)
+            abort(422)
+
+        return respond({
+            'success': True,
+            'unassigned': unassigned,
+            'not_found': not_found
+        }), 200
+
+    # This endpoint UPDATES many movies at once, selected by their
+    # ids and/or a filter, with a single UPDATE statement
+    @app.route('/movies/bulk', methods=['PATCH'])
+    # Require the 'patch:movies' permission
+    @requires_auth('patch:movies')
+    # Because of calling the 'requires_auth', we need to
+    # take the payload as it returns it
+    def update_movies_bulk(payload):
+        body = request.get_json(silent=True)
+        ids, filters = read_selection(body, MOVIE_FIELDS)
+        # Get the new values of the movies
+        values = read_columns(body.get('changes'), MOVIE_FIELDS)
+
+        try:
+            # Update the selected movies in the database
+            updated, not_found = Movie.bulk_update(values, ids, filters)
+        except BaseException:
+            db.session.rollback()
+            # If an error occured while proccessing the
+            # UPDATE, send an error (unprocessable - 422)
+            abort(422)
+
+        # Return a status code 200, the number of updated movies and
+        # the ids that don't exist
+        return respond({
+            'success': True,
+            'updated': updated,
+            'not_found': not_found
+        }), 200
+
+    # This endpoint DELETES many movies at once, selected by their
+    # ids and/or a filter, with a single DELETE statement
+    @app.route('/movies/bulk', methods=['DELETE'])
+    # Require the 'delete:movies' permission
+    @requires_auth('delete:movies')
+    # Because of calling the 'requires_auth', we need to
+    # take the payload as it returns it
+    def delete_movies_bulk(payload):
+        body = request.get_json(silent=True)
+        ids, filters = read_selection(body, MOVIE_FIELDS)
+
+        try:
+            # Delete the selected movies from the database
+            deleted, not_found = Movie.bulk_delete(ids, filters)
+        except BaseException:
+            db.session.rollback()
+            # If an error occured while proccessing the
+            # DELETE, send an error (unprocessable - 422)
+            abort(422)
+
+        # Return a status code 200, the number of deleted movies and
+        # the ids that don't exist
+        return respond({
+            'success': True,
+            'deleted': deleted,
+            'not_found': not_found
+        }), 200
+
+    # This endpoint UPDATES many actors at once, selected by their
+    # ids and/or a filter, with a single UPDATE statement
+    @app.route('/actors/bulk', methods=['PATCH'])
+    # Require the 'patch:actors' permission
+    @requires_auth('patch:actors')
+    # Because of calling the 'requires_auth', we need to
+    # take the payload as it returns it
+    def update_actors_bulk(payload):
+        body = request.get_json(silent=True)
+        ids, filters = read_selection(body, ACTOR_FIELDS)
+        # Get the new values of the actors
+        values = read_columns(body.get('changes'), ACTOR_FIELDS)
+
+        try:
+            # Update the selected actors in the database
+            updated, not_found = Actor.bulk_update(values, ids, filters)
+        except BaseException:
+            db.session.rollback()
+            # If an error occured while proccessing the
+            # UPDATE, send an error (unprocessable - 422)
+            abort(422)
+
+        # Return a status code 200, the number of updated actors and
+        # the ids that don't exist
+        return respond({
+            'success': True,
+            'updated': updated,
+            'not_found': not_found
+        }), 200
+
+    # This endpoint DELETES many actors at once, selected by their
+    # ids and/or a filter, with a single DELETE statement
+    @app.route('/actors/bulk', methods=['DELETE'])
+    # Require the 'delete:actors' permission
+    @requires_auth('delete:actors')
+    # Because of calling the 'requires_auth', we need to
+    # take the payload as it returns it
+    def delete_actors_bulk(payload):
+        body = request.get_json(silent=True)
+        ids, filters = read_selection(body, ACTOR_FIELDS)
+
+        try:
+            # Delete the selected actors from the database
+            deleted, not_found = Actor.bulk_delete(ids, filters)
+        except BaseException:
+            db.session.rollback()
+            # If an error occured while proccessing the
+            # DELETE, send an error (unprocessable - 422)
+            abort(422)
+
+        # Return a status code 200, the number of deleted actors and
+        # the ids that don't exist
+        return respond({
+            'success': True,
+            'deleted': deleted,
+            'not_found': not_found
+        }), 200
+
     # This endpoint UPDATES a specified movie
     @app.route('/movies/<int:id>', methods=['PATCH'])
     # Require the 'patch:movies' permission
@@ -228,7 +843,7 @@ def create_app(test_config=None):
         if movie is None:
             # If the actor doesn't exist, add a message into
             # json with error (not found - 404)
-            return json.dumps({
+            return respond({
                 'success': False,
                 'error': 'Movie #' + id + ' not found to be edited'
             }), 404
@@ -269,7 +884,7 @@ def create_app(test_config=None):
 
             # Return a status code 200 and json of movie's
             # details and set the success message to true
-            return jsonify({
+            return respond({
                 'success': True,
                 'movie': movie.format()
             }), 200
@@ -294,7 +909,7 @@ def create_app(test_config=None):
         if actor is None:
             # If the actor doesn't exist, add a message into
             # json with error (not found - 404)
-            return json.dumps({
+            return respond({
                 'success': False,
                 'error': 'Actor #' + id + ' not found to be edited'
             }), 404
@@ -339,7 +954,7 @@ def create_app(test_config=None):
 
             # Return a status code 200 and json of actor's
             # details and set the success message to true
-            return jsonify({
+            return respond({
                 'success': True,
                 'actor': actor.format()
             }), 200
@@ -377,7 +992,7 @@ def create_app(test_config=None):
 
             # Return a status code 200 and json of the
             # movie's id and set the success message to true
-            return jsonify({
+            return respond({
                 'success': True,
                 # Return the deleted movie's id
                 'deleted': id
@@ -416,7 +1031,7 @@ def create_app(test_config=None):
 
             # Return a status code 200 and json of the
             # actor's id and set the success message to true
-            return jsonify({
+            return respond({
                 'success': True,
                 # Return the deleted actor's id
                 'deleted': id
@@ -431,16 +1046,25 @@ def create_app(test_config=None):
 
     @app.errorhandler(422)
     def unprocessable(error):
-        return jsonify({
+        return respond({
             "success": False,
             "error": 422,
             "message": "Not Processable"
         }), 422
 
+    # Error Handler for (401 - Unauthorized)
+    @app.errorhandler(401)
+    def unauthorized(error):
+        return respond({
+            'success': False,
+            'error': 401,
+            'message': 'Unauthorized'
+        }), 401
+
     # Error Handler for (404 - Not Found)
     @app.errorhandler(404)
     def not_found(error):
-        return jsonify({
+        return respond({
             'success': False,
             'error': 404,
             'message': 'Resource Not Found'
@@ -449,7 +1073,7 @@ def create_app(test_config=None):
     # Error Handler for (400 - Bad Request)
     @app.errorhandler(400)
     def bad_request(error):
-        return jsonify({
+        return respond({
             'success': False,
             'error': 400,
             'message': 'Bad Request'
@@ -458,7 +1082,7 @@ def create_app(test_config=None):
     # Error Handler for (500 - Internal Server Error)
     @app.errorhandler(500)
     def internal_server_error(error):
-        return jsonify({
+        return respond({
             'success': False,
             'error': 500,
             'message': 'Internal Server Error'
@@ -467,15 +1091,35 @@ def create_app(test_config=None):
     # Error Handler for (405 - Method Not Allowed)
     @app.errorhandler(405)
     def method_not_allowed(error):
-        return jsonify({
+        return respond({
             'success': False,
             'error': 405,
             'message': 'Method Not Allowed'
         }), 405
 
+    # Error Handler for (413 - Payload Too Large)
+    @app.errorhandler(413)
+    def payload_too_large(error):
+        return respond({
+            'success': False,
+            'error': 413,
+            'message': 'Payload Too Large'
+        }), 413
+
+    @app.errorhandler(503)
+    def service_unavailable(error):
+        # Sent by the admission control (see admission.py)
+        response = respond({
+            'success': False,
+            'error': 503,
+            'message': 'Service Unavailable'
+        }, 503)
+        response.headers['Retry-After'] = str(admission.ADMISSION_RETRY_AFTER)
+        return response
+
     @app.errorhandler(AuthError)
     def auth_error(e):
-        return jsonify({
+        return respond({
             'success': False,
             'error': e.status_code,
             'message': e.error['description']
@@ -1,8 +1,14 @@
 import os
 import json
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from flask import request, _request_ctx_stack
 from functools import wraps
-from jose import jwt
+from jose import jwt, jwk
 from urllib.request import urlopen
 
 
@@ -10,6 +16,40 @@ AUTH0_DOMAIN=os.environ.get('AUTH0_DOMAIN')
 ALGORITHMS=os.environ.get('ALGORITHMS')
 API_AUDIENCE=os.environ.get('API_AUDIENCE')
 
+# Where to load the JWKS document from (a URL or a local file path).
+# Defaults to the Auth0 tenant's well-known endpoint.
+JWKS_URL=os.environ.get('JWKS_URL')
+# How long (in seconds) the downloaded keys are trusted before a refresh
+JWKS_CACHE_TTL=int(os.environ.get('JWKS_CACHE_TTL', 3600))
+# Minimum number of seconds between two refreshes caused by an unknown 'kid'
+JWKS_MIN_REFRESH_INTERVAL=int(os.environ.get('JWKS_MIN_REFRESH_INTERVAL', 30))
+# Refresh in the background when the keys are this close (in seconds) to expiring
+JWKS_REFRESH_MARGIN=int(os.environ.get('JWKS_REFRESH_MARGIN', 300))
+
+# Cache of the already verified tokens (set TOKEN_CACHE_ENABLED=false to disable)
+TOKEN_CACHE_ENABLED=os.environ.get(
+    'TOKEN_CACHE_ENABLED', 'true').lower() not in ('false', '0', 'no')
+# Maximum number of tokens kept in the cache
+TOKEN_CACHE_SIZE=int(os.environ.get('TOKEN_CACHE_SIZE', 1024))
+
+logger = logging.getLogger(__name__)
+
+# Functions called with (phase, seconds) for every phase of requires_auth
+phase_listeners = []
+
+
+@contextmanager
+def timed(phase):
+    # Report how long a phase of requires_auth took
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        for listener in phase_listeners:
+            listener(phase, elapsed)
+
+
 ## AuthError Exception
 '''
 AuthError Exception
@@ -21,6 +61,205 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+## JWKS Key Store
+'''
+JWKSKeyStore
+A process-wide cache of the identity provider's public keys. The JWKS
+document is downloaded once, the keys are parsed once and then reused
+for every request until the TTL runs out.
+'''
+class JWKSKeyStore:
+    def __init__(self, source=None, ttl=JWKS_CACHE_TTL,
+                 min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL,
+                 refresh_margin=JWKS_REFRESH_MARGIN):
+        self.source = source
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.refresh_margin = refresh_margin
+        # kid -> parsed public key
+        self._keys = {}
+        self._expires_at = 0
+        self._last_fetch = 0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        # Number of times the JWKS document has been downloaded
+        self.fetches = 0
+
+    def get_source(self):
+        # Use the configured source, or the Auth0 tenant by default
+        return self.source or f'https://{AUTH0_DOMAIN}/.well-known/jwks.json'
+
+    def load(self, source):
+        # Point the store to another JWKS document (a local file or a
+        # URL, e.g. a local stand-in for benchmarks and tests) and load it
+        self.source = source
+        self.refresh()
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._expires_at = 0
+            self._last_fetch = 0
+
+    def _download(self):
+        source = self.get_source()
+        if '://' in source:
+            with urlopen(source, timeout=10) as jsonurl:
+                return json.loads(jsonurl.read())
+        with open(source) as jwks_file:
+            return json.load(jwks_file)
+
+    def _parse(self, jwks):
+        keys = {}
+        for key in jwks.get('keys', []):
+            if 'kid' not in key or key.get('kty') != 'RSA':
+                continue
+            try:
+                keys[key['kid']] = jwk.construct(
+                    key, key.get('alg', 'RS256'))
+            except Exception:
+                logger.warning('Skipping unusable JWKS key %s', key['kid'])
+        return keys
+
+    def refresh(self, since=None):
+        # Download and parse the keys, then swap them in at once
+        with self._lock:
+            # Another thread already refreshed while we were waiting
+            if since is not None and self._last_fetch >= since:
+                self._refreshing = False
+                return
+            self._last_fetch = time.time()
+            try:
+                self.fetches += 1
+                keys = self._parse(self._download())
+            except Exception:
+                # Retry after the minimum interval, not on every request
+                if self._keys:
+                    self._expires_at = (
+                        time.time() + self.min_refresh_interval)
+                raise
+            finally:
+                self._refreshing = False
+            self._keys = keys
+            self._expires_at = time.time() + self.ttl
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception('Background JWKS refresh failed')
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get_key(self, kid):
+        now = time.time()
+        if now >= self._expires_at:
+            try:
+                self.refresh(since=now)
+            except Exception:
+                # Keep serving the old keys if the identity provider
+                # is down, and fail only if there is nothing cached
+                if not self._keys:
+                    raise
+                logger.exception('JWKS refresh failed, using cached keys')
+        elif now >= self._expires_at - self.refresh_margin:
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is None and (
+                time.time() - self._last_fetch >= self.min_refresh_interval):
+            # The key may have been rotated, refresh (rate-limited) and
+            # look it up again
+            try:
+                self.refresh(since=now)
+            except Exception:
+                logger.exception('JWKS refresh failed')
+            key = self._keys.get(kid)
+        return key
+
+
+jwks_store = JWKSKeyStore(JWKS_URL)
+
+
+## Verified Token Cache
+'''
+TokenCache
+A bounded LRU cache of the tokens whose signature was already verified.
+It maps a hash of the token to its decoded payload and its permissions,
+and every entry expires at the token's 'exp' claim.
+'''
+class TokenCache:
+    def __init__(self, maxsize=TOKEN_CACHE_SIZE, enabled=TOKEN_CACHE_ENABLED):
+        self.maxsize = maxsize
+        self.enabled = enabled
+        # token hash -> (payload, permissions, expires at)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(token):
+        # Never keep the raw token in memory longer than needed
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token):
+        # Return (payload, permissions) for a cached token, or None
+        if not self.enabled:
+            return None
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], entry[1]
+            if entry is not None:
+                # The token expired, it has to be verified (and rejected) again
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, token, payload):
+        # Tokens without an expiry are never cached
+        if not self.enabled or 'exp' not in payload:
+            return
+        permissions = None
+        if 'permissions' in payload:
+            permissions = frozenset(payload['permissions'])
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (payload, permissions, payload['exp'])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+token_cache = TokenCache()
+
+
 ## Auth Header
 def get_token_auth_header():
     """
@@ -66,21 +305,24 @@ def get_token_auth_header():
     # Return the token part of the header
     return header_parts[1]
 
-def check_permissions(permission, payload):
+def check_permissions(permission, payload, permissions=None):
     """
     Reference:
     - Identity and Access Management course's videos
     - https://github.com/udacity/FSND/tree/master/BasicFlaskAuth
     """
+    # Use the payload's permissions if they were not given as a set
+    if permissions is None and 'permissions' in payload:
+        permissions = frozenset(payload['permissions'])
     # Check if the permissions included in the payload
-    if 'permissions' not in payload:
+    if permissions is None:
         # if not, raise an AuthError (permissions are not included in the payload)
         raise AuthError({
             'code': 'invalid_claims',
             'description': 'Permissions not included in JWT.'
         }, 400)
     # Check if the requested permission string is in the payload permissions array
-    if permission not in payload['permissions']:
+    if permission not in permissions:
         # if not, raise an AuthError (the requested permission string is not in the payload permissions array)
         raise AuthError({
             'code': 'unauthorized',
@@ -96,34 +338,26 @@ def verify_decode_jwt(token):
     - Identity and Access Management course's videos
     - https://github.com/udacity/FSND/tree/master/BasicFlaskAuth
     """
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    # Get the (already parsed) public key from the cached key store
+    with timed('jwks'):
+        rsa_key = jwks_store.get_key(unverified_header['kid'])
     if rsa_key:
         try:
-            payload = jwt.decode(
-                token,
-                rsa_key,
-                algorithms=ALGORITHMS,
-                audience=API_AUDIENCE,
-                issuer='https://' + AUTH0_DOMAIN + '/'
-            )
+            with timed('decode'):
+                payload = jwt.decode(
+                    token,
+                    rsa_key,
+                    algorithms=ALGORITHMS,
+                    audience=API_AUDIENCE,
+                    issuer='https://' + AUTH0_DOMAIN + '/'
+                )
 
             return payload
 
@@ -148,13 +382,34 @@ def verify_decode_jwt(token):
                 'description': 'Unable to find the appropriate key.'
             }, 400)
 
+def verify_token(token):
+    # Return the payload and permissions of the token, verifying its
+    # signature only if it is not in the cache yet
+    with timed('cache'):
+        cached = token_cache.get(token)
+    if cached is not None:
+        return cached
+    payload = verify_decode_jwt(token)
+    token_cache.set(token, payload)
+    permissions = None
+    if 'permissions' in payload:
+        permissions = frozenset(payload['permissions'])
+    return payload, permissions
+
 def requires_auth(permission=''):
+    # permission may also be a function returning the permissions the
+    # request needs (e.g. one per requested type of GET /search)
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            with timed('header'):
+                token = get_token_auth_header()
+            payload, permissions = verify_token(token)
+            with timed('permissions'):
+                required = permission() if callable(permission) \
+                    else [permission]
+                for name in required:
+                    check_permissions(name, payload, permissions)
             return f(payload, *args, **kwargs)
 
         return wrapper
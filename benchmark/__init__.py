@@ -0,0 +1,9 @@
+'''
+Benchmark suite of the Casting Agency API
+Runs offline: a local identity provider stand-in signs the tokens, a data
+generator seeds the database, and a driver measures the throughput and the
+latency percentiles of every route at several concurrency levels.
+
+    python -m benchmark run --rows 10000 --concurrency 1,8,32 -o results.json
+    python -m benchmark compare baseline.json results.json
+'''
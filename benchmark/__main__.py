@@ -0,0 +1,170 @@
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import argparse
+import threading
+import subprocess
+from benchmark import compare as comparison
+from benchmark.driver import Client, default_scenarios, run, \
+    uncovered_routes
+from benchmark.identity import LocalIdentityProvider, ROLES
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).decode('ascii').strip()
+    except Exception:
+        return None
+
+
+def _start_app(rows, random_seed):
+    # Import the app only now: auth.py and models.py read the environment
+    # when they are imported
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    from app import create_app
+    from benchmark.seed import seed
+
+    class QuietHandler(WSGIRequestHandler):
+        # Logging every request would slow the server down
+        def log_request(self, *args, **kwargs):
+            pass
+
+    app = create_app()
+    if rows:
+        with app.app_context():
+            seed(rows, random_seed=random_seed)
+    server = make_server('127.0.0.1', 0, app, threaded=True,
+                         request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return app, server
+
+
+def run_command(args):
+    provider = LocalIdentityProvider(args.keys_dir)
+    tokens = {role: provider.token(role, lifetime=24 * 3600)
+              for role in ROLES}
+    scenarios = default_scenarios()
+    concurrency = [int(level) for level in args.concurrency.split(',')]
+
+    app = server = None
+    if args.url:
+        # A server started separately (e.g. gunicorn), which must trust
+        # the keys (see `python -m benchmark env`)
+        base_url = args.url
+    else:
+        if args.jwks_over_http:
+            provider.serve()
+        os.environ.update(provider.environment())
+        os.environ['DATABASE_URL'] = args.database_url or \
+            os.environ.get('DATABASE_URL') or 'sqlite:///%s' % os.path.join(
+                tempfile.mkdtemp(prefix='casting-benchmark-'), 'bench.db')
+        app, server = _start_app(args.rows, args.seed)
+        base_url = 'http://127.0.0.1:%d' % server.server_port
+        for route in uncovered_routes(app, scenarios):
+            print('warning: no scenario for %s' % route, file=sys.stderr)
+
+    client = Client(base_url, tokens)
+    started_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    try:
+        results = run(client, scenarios, concurrency, args.requests,
+                      args.rows, random_seed=args.seed,
+                      only=args.scenario)
+    finally:
+        if server is not None:
+            server.shutdown()
+        provider.shutdown()
+
+    document = {
+        'meta': {
+            'started_at': started_at,
+            'git_commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'target': args.url or 'in-process',
+            'database': None if args.url else
+            os.environ['DATABASE_URL'].split(':', 1)[0],
+            'rows': args.rows,
+            'requests': args.requests,
+            'concurrency': concurrency,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(document, output_file, indent=2)
+    else:
+        json.dump(document, sys.stdout, indent=2)
+    return 0
+
+
+def compare_command(args):
+    rows = comparison.compare(comparison.load(args.baseline),
+                              comparison.load(args.current),
+                              args.threshold)
+    regressed = comparison.report(rows)
+    return 1 if regressed else 0
+
+
+def env_command(args):
+    # The settings to start a separate server with, e.g.
+    # eval "$(python -m benchmark env)" && gunicorn app:app
+    provider = LocalIdentityProvider(args.keys_dir)
+    for name, value in provider.environment().items():
+        print('export %s=%s' % (name, value))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmark')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run_parser = commands.add_parser(
+        'run', help='measure every route and write the results')
+    run_parser.add_argument('--rows', type=int, default=10000,
+                            help='movies and actors to seed (0 to skip)')
+    run_parser.add_argument('--requests', type=int, default=200,
+                            help='requests per scenario and level')
+    run_parser.add_argument('--concurrency', default='1,8,32',
+                            help='comma-separated concurrency levels')
+    run_parser.add_argument('--scenario', action='append',
+                            help='only run this scenario (repeatable)')
+    run_parser.add_argument('--seed', type=int, default=42)
+    run_parser.add_argument('--database-url',
+                            help='default: $DATABASE_URL or a temporary '
+                                 'SQLite file')
+    run_parser.add_argument('--url', help='benchmark a running server '
+                                          'instead of an in-process one')
+    run_parser.add_argument('--jwks-over-http', action='store_true',
+                            help='serve the JWKS over HTTP instead of '
+                                 'from a file')
+    run_parser.add_argument('--keys-dir', default='.benchmark-keys')
+    run_parser.add_argument('-o', '--output',
+                            help='results file (default: stdout)')
+    run_parser.set_defaults(handler=run_command)
+
+    compare_parser = commands.add_parser(
+        'compare', help='compare two results files')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float,
+                                default=comparison.DEFAULT_THRESHOLD)
+    compare_parser.set_defaults(handler=compare_command)
+
+    env_parser = commands.add_parser(
+        'env', help='print the settings that make a server trust the keys')
+    env_parser.add_argument('--keys-dir', default='.benchmark-keys')
+    env_parser.set_defaults(handler=env_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
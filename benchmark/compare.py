@@ -0,0 +1,82 @@
+import json
+
+
+'''
+Comparison of two result files
+A scenario regresses when its p95 or p99 latency grows, or its throughput
+drops, by more than the threshold (10% by default) at the same
+concurrency level.
+'''
+
+DEFAULT_THRESHOLD = 0.10
+
+
+def load(path):
+    with open(path) as results_file:
+        return json.load(results_file)
+
+
+def _index(results):
+    return {(result['scenario'], result['concurrency']): result
+            for result in results['results']}
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    '''
+    Return one row per (scenario, concurrency) found in both files, with
+    the relative change of each measure and the measures that regressed
+    '''
+    before = _index(baseline)
+    after = _index(current)
+    rows = []
+    for key in sorted(set(before) & set(after)):
+        old, new = before[key], after[key]
+        changes = {}
+        for percentile in ('p50', 'p95', 'p99'):
+            changes[percentile] = _change(old['latency_ms'][percentile],
+                                          new['latency_ms'][percentile])
+        changes['throughput'] = _change(old['throughput_rps'],
+                                        new['throughput_rps'])
+        regressions = [name for name in ('p95', 'p99')
+                       if changes[name] is not None and
+                       changes[name] > threshold]
+        if changes['throughput'] is not None and \
+                changes['throughput'] < -threshold:
+            regressions.append('throughput')
+        if new['errors'] > old['errors']:
+            regressions.append('errors')
+        rows.append({
+            'scenario': key[0],
+            'concurrency': key[1],
+            'changes': changes,
+            'regressions': regressions,
+        })
+    return rows
+
+
+def _change(old, new):
+    if not old or new is None:
+        return None
+    return (new - old) / float(old)
+
+
+def _percent(change):
+    return '     n/a' if change is None else '%+7.1f%%' % (change * 100)
+
+
+def report(rows, log=print):
+    # Print the comparison and return the number of regressions
+    log('%-28s %5s %9s %9s %9s %11s' % (
+        'scenario', 'conc', 'p50', 'p95', 'p99', 'throughput'))
+    regressed = 0
+    for row in rows:
+        changes = row['changes']
+        log('%-28s %5d %9s %9s %9s %11s %s' % (
+            row['scenario'], row['concurrency'], _percent(changes['p50']),
+            _percent(changes['p95']), _percent(changes['p99']),
+            _percent(changes['throughput']),
+            'REGRESSION (%s)' % ', '.join(row['regressions'])
+            if row['regressions'] else ''))
+        if row['regressions']:
+            regressed += 1
+    return regressed
@@ -0,0 +1,329 @@
+import sys
+import json
+import time
+import random
+import threading
+import http.client
+from urllib.parse import urlsplit
+from benchmark.seed import WORDS
+
+
+'''
+Load driver
+Sends the requests of every scenario (one or more per route of app.py)
+from N threads at once, for each concurrency level, and measures the
+throughput and the latency percentiles.
+'''
+
+
+class Scenario:
+    def __init__(self, name, method, rule, path, role='producer', body=None,
+                 setup=None):
+        self.name = name
+        self.method = method
+        # The URL rule of app.py the scenario covers
+        self.rule = rule
+        # path(context) and body(context) build each request
+        self.path = path
+        self.role = role
+        self.body = body
+        # setup(client, count) runs before a level (e.g. rows to delete)
+        self.setup = setup
+
+
+def _new_movie(context):
+    return {'title': 'Benchmark Movie %d' % context.rng.randint(1, 10 ** 6),
+            'release-date': '2021-04-01'}
+
+
+def _new_actor(context):
+    return {'name': 'Benchmark Actor %d' % context.rng.randint(1, 10 ** 6),
+            'age': context.rng.randint(5, 90), 'gender': 'Female'}
+
+
+def _existing_id(context):
+    return context.rng.randint(1, max(context.rows, 1))
+
+
+def _search_path(context):
+    # The prefix of a word of the seeded titles
+    return '/search?q=%s&limit=20' % context.rng.choice(WORDS)[:4].lower()
+
+
+def _created_ids(resource, rows_per_request):
+    # Create the rows that the requests of a level will delete
+    def setup(client, context, count):
+        make = _new_movie if resource == 'movies' else _new_actor
+        ids = []
+        needed = count * rows_per_request
+        while len(ids) < needed:
+            batch = [make(context) for _ in range(min(needed - len(ids),
+                                                      1000))]
+            status, body = client.request(
+                'POST', '/%s/bulk' % resource, 'producer', batch)
+            if status != 200:
+                raise RuntimeError(
+                    'Setup of %s failed: %s' % (resource, status))
+            ids += [result['id'] for result in json.loads(body)['results']]
+        context.pools[resource] = ids
+    return setup
+
+
+def _casting(context):
+    return {'movie_id': _existing_id(context),
+            'actor_id': _existing_id(context), 'role': 'Lead'}
+
+
+def _assigned_pairs(pairs_per_request):
+    # Cast the pairs that the requests of a level will remove
+    def setup(client, context, count):
+        castings = {}
+        while len(castings) < count * pairs_per_request:
+            casting = _casting(context)
+            castings[casting['movie_id'], casting['actor_id']] = casting
+        castings = list(castings.values())
+        for start in range(0, len(castings), 1000):
+            status, _ = client.request('POST', '/castings/bulk', 'producer',
+                                       castings[start:start + 1000])
+            if status != 200:
+                raise RuntimeError('Setup of castings failed: %s' % status)
+        context.pools['castings'] = [
+            [casting['movie_id'], casting['actor_id']]
+            for casting in castings]
+    return setup
+
+
+def _pop_ids(context, resource, count):
+    with context.lock:
+        ids = context.pools[resource][:count]
+        del context.pools[resource][:count]
+    return ids
+
+
+def default_scenarios():
+    scenarios = [
+        Scenario('index', 'GET', '/', lambda c: '/', role=None),
+        Scenario('metrics', 'GET', '/metrics', lambda c: '/metrics',
+                 role=None),
+        Scenario('cache_stats', 'GET', '/cache/stats',
+                 lambda c: '/cache/stats', role='assistant'),
+        Scenario('stats', 'GET', '/stats', lambda c: '/stats',
+                 role='assistant'),
+        Scenario('search', 'GET', '/search', _search_path,
+                 role='assistant'),
+        # Connects and reads the events already there
+        Scenario('change_stream', 'GET', '/changes/stream',
+                 lambda c: '/changes/stream?duration=0', role='assistant'),
+        Scenario('export_movies', 'GET', '/export',
+                 lambda c: '/export?table=movies&format=jsonl',
+                 role='assistant'),
+        Scenario('list_movies', 'GET', '/movies',
+                 lambda c: '/movies?limit=50', role='assistant'),
+        Scenario('list_movies_fields_sorted', 'GET', '/movies',
+                 lambda c: '/movies?fields=id,title&sort=-release_date'
+                           '&limit=200', role='assistant'),
+        # The first page of a full delta sync (?since=0)
+        Scenario('sync_actors', 'GET', '/actors',
+                 lambda c: '/actors?limit=200&since=0', role='assistant'),
+        Scenario('list_movies_ndjson', 'GET', '/movies',
+                 lambda c: '/movies?format=ndjson', role='assistant'),
+        Scenario('list_movies_with_cast', 'GET', '/movies',
+                 lambda c: '/movies?include=cast&limit=50', role='assistant'),
+        Scenario('movie_cast', 'GET', '/movies/<int:id>/cast',
+                 lambda c: '/movies/%d/cast' % _existing_id(c),
+                 role='assistant'),
+        Scenario('actor_movies', 'GET', '/actors/<int:id>/movies',
+                 lambda c: '/actors/%d/movies' % _existing_id(c),
+                 role='assistant'),
+        Scenario('list_actors', 'GET', '/actors',
+                 lambda c: '/actors?limit=50', role='assistant'),
+        Scenario('list_actors_filtered', 'GET', '/actors',
+                 lambda c: '/actors?gender=Female&min_age=25&max_age=35'
+                           '&limit=50', role='assistant'),
+        Scenario('create_movie', 'POST', '/movies', lambda c: '/movies',
+                 body=_new_movie),
+        Scenario('create_actor', 'POST', '/actors', lambda c: '/actors',
+                 role='director', body=_new_actor),
+        Scenario('bulk_create_movies', 'POST', '/movies/bulk',
+                 lambda c: '/movies/bulk',
+                 body=lambda c: [_new_movie(c) for _ in range(100)]),
+        Scenario('bulk_create_actors', 'POST', '/actors/bulk',
+                 lambda c: '/actors/bulk',
+                 body=lambda c: [_new_actor(c) for _ in range(100)]),
+        Scenario('assign_castings', 'POST', '/castings/bulk',
+                 lambda c: '/castings/bulk',
+                 body=lambda c: [_casting(c) for _ in range(100)]),
+        Scenario('unassign_castings', 'DELETE', '/castings/bulk',
+                 lambda c: '/castings/bulk',
+                 body=lambda c: {'pairs': _pop_ids(c, 'castings', 50)},
+                 setup=_assigned_pairs(50)),
+        Scenario('update_movie', 'PATCH', '/movies/<int:id>',
+                 lambda c: '/movies/%d' % _existing_id(c),
+                 body=lambda c: {'title': 'Updated Movie'}),
+        Scenario('update_actor', 'PATCH', '/actors/<int:id>',
+                 lambda c: '/actors/%d' % _existing_id(c), role='director',
+                 body=_new_actor),
+        Scenario('bulk_update_movies', 'PATCH', '/movies/bulk',
+                 lambda c: '/movies/bulk',
+                 body=lambda c: {'ids': [_existing_id(c) for _ in range(100)],
+                                 'changes': {'title': 'Updated Movie'}}),
+        Scenario('bulk_update_actors', 'PATCH', '/actors/bulk',
+                 lambda c: '/actors/bulk',
+                 body=lambda c: {'ids': [_existing_id(c) for _ in range(100)],
+                                 'changes': {'age': 30}}),
+        Scenario('delete_movie', 'DELETE', '/movies/<int:id>',
+                 lambda c: '/movies/%d' % _pop_ids(c, 'movies', 1)[0],
+                 setup=_created_ids('movies', 1)),
+        Scenario('delete_actor', 'DELETE', '/actors/<int:id>',
+                 lambda c: '/actors/%d' % _pop_ids(c, 'actors', 1)[0],
+                 role='director', setup=_created_ids('actors', 1)),
+        Scenario('bulk_delete_movies', 'DELETE', '/movies/bulk',
+                 lambda c: '/movies/bulk',
+                 body=lambda c: {'ids': _pop_ids(c, 'movies', 50)},
+                 setup=_created_ids('movies', 50)),
+        Scenario('bulk_delete_actors', 'DELETE', '/actors/bulk',
+                 lambda c: '/actors/bulk',
+                 body=lambda c: {'ids': _pop_ids(c, 'actors', 50)},
+                 setup=_created_ids('actors', 50)),
+    ]
+    return scenarios
+
+
+class Client:
+    def __init__(self, base_url, tokens, timeout=60):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.tokens = tokens
+        self.timeout = timeout
+
+    def request(self, method, path, role=None, body=None):
+        headers = {}
+        if role is not None:
+            headers['Authorization'] = 'Bearer ' + self.tokens[role]
+        data = None
+        if body is not None:
+            data = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        connection = http.client.HTTPConnection(self.host, self.port,
+                                                timeout=self.timeout)
+        try:
+            connection.request(method, path, data, headers)
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+
+class Context:
+    def __init__(self, rows, random_seed):
+        self.rows = rows
+        self.rng = random.Random(random_seed)
+        self.lock = threading.Lock()
+        self.pools = {}
+
+
+def percentile(values, percent):
+    # Nearest-rank percentile of a sorted list
+    if not values:
+        return None
+    rank = max(int(round(percent / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def run_level(client, scenario, context, concurrency, requests):
+    if scenario.setup is not None:
+        scenario.setup(client, context, requests)
+
+    latencies = []
+    statuses = {}
+    errors = [0]
+    remaining = [requests]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+                # Random is not thread-safe, build the request under the lock
+                path = scenario.path(context)
+                body = scenario.body(context) if scenario.body else None
+            start = time.perf_counter()
+            try:
+                status, _ = client.request(scenario.method, path,
+                                           scenario.role, body)
+            except Exception:
+                status = 'error'
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if status == 'error' or status >= 400:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'scenario': scenario.name,
+        'method': scenario.method,
+        'route': scenario.rule,
+        'concurrency': concurrency,
+        'requests': requests,
+        'errors': errors[0],
+        'status_codes': statuses,
+        'duration_s': round(duration, 4),
+        'throughput_rps': round(requests / duration, 2) if duration else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50) * 1000, 3),
+            'p95': round(percentile(latencies, 95) * 1000, 3),
+            'p99': round(percentile(latencies, 99) * 1000, 3),
+            'mean': round(sum(latencies) / len(latencies) * 1000, 3),
+            'max': round(latencies[-1] * 1000, 3),
+        },
+    }
+
+
+def uncovered_routes(app, scenarios):
+    # The routes of the app that no scenario measures
+    covered = {(scenario.method, scenario.rule) for scenario in scenarios}
+    missing = []
+    for rule in app.url_map.iter_rules():
+        if rule.endpoint == 'static':
+            continue
+        for method in sorted(rule.methods - {'HEAD', 'OPTIONS'}):
+            if (method, rule.rule) not in covered:
+                missing.append('%s %s' % (method, rule.rule))
+    return missing
+
+
+def _log(message):
+    # The progress goes to stderr, stdout is kept for the JSON results
+    print(message, file=sys.stderr)
+
+
+def run(client, scenarios, concurrency_levels, requests, rows,
+        random_seed=42, only=None, log=_log):
+    context = Context(rows, random_seed)
+    results = []
+    for scenario in scenarios:
+        if only and scenario.name not in only:
+            continue
+        for concurrency in concurrency_levels:
+            result = run_level(client, scenario, context, concurrency,
+                               requests)
+            log('%-28s c=%-4d %8.1f req/s  p50 %8.2f ms  p95 %8.2f ms  '
+                'p99 %8.2f ms  errors %d' % (
+                    scenario.name, concurrency, result['throughput_rps'],
+                    result['latency_ms']['p50'], result['latency_ms']['p95'],
+                    result['latency_ms']['p99'], result['errors']))
+            results.append(result)
+    return results
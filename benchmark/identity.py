@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import rsa
+from jose import jwk, jwt
+
+
+'''
+Local identity provider stand-in
+An RSA key pair, the JWKS document auth.py loads (JWKS_URL can point to
+the file or to the small HTTP server below) and tokens signed like the
+Auth0 ones, with the permissions of each role.
+'''
+
+KID = 'benchmark-key'
+DOMAIN = 'benchmark.local'
+AUDIENCE = 'casting-agency'
+
+ROLES = {
+    'assistant': ['get:movies', 'get:actors'],
+    'director': ['get:movies', 'get:actors', 'post:actors',
+                 'patch:movies', 'patch:actors', 'delete:actors'],
+    'producer': ['get:movies', 'get:actors', 'post:movies', 'post:actors',
+                 'patch:movies', 'patch:actors', 'delete:movies',
+                 'delete:actors'],
+}
+
+
+class LocalIdentityProvider:
+    def __init__(self, directory, bits=2048):
+        # Reuse the key pair of the directory (if any), so a server started
+        # separately keeps trusting the tokens of the next runs
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        private_path = os.path.join(self.directory, 'private.pem')
+        if os.path.exists(private_path):
+            with open(private_path) as private_file:
+                self.private_pem = private_file.read()
+        else:
+            _, private_key = rsa.newkeys(bits)
+            self.private_pem = private_key.save_pkcs1().decode('ascii')
+            with open(private_path, 'w') as private_file:
+                private_file.write(self.private_pem)
+        public_jwk = jwk.construct(self.private_pem, 'RS256') \
+            .public_key().to_dict()
+        public_jwk.update({'kid': KID, 'use': 'sig'})
+        self.jwks = {'keys': [public_jwk]}
+        self.jwks_path = os.path.join(self.directory, 'jwks.json')
+        with open(self.jwks_path, 'w') as jwks_file:
+            json.dump(self.jwks, jwks_file)
+        self._server = None
+
+    def environment(self):
+        # The settings auth.py needs to trust this provider
+        return {
+            'AUTH0_DOMAIN': DOMAIN,
+            'API_AUDIENCE': AUDIENCE,
+            'ALGORITHMS': 'RS256',
+            'JWKS_URL': self.jwks_url or self.jwks_path,
+        }
+
+    @property
+    def jwks_url(self):
+        if self._server is None:
+            return None
+        return 'http://127.0.0.1:%d/.well-known/jwks.json' % \
+            self._server.server_port
+
+    def token(self, role, lifetime=3600):
+        now = int(time.time())
+        claims = {
+            'iss': 'https://%s/' % DOMAIN,
+            'sub': 'benchmark|%s' % role,
+            'aud': AUDIENCE,
+            'iat': now,
+            'exp': now + lifetime,
+            'permissions': ROLES[role],
+        }
+        return jwt.encode(claims, self.private_pem, algorithm='RS256',
+                          headers={'kid': KID})
+
+    def serve(self, port=0):
+        # Serve the JWKS document over HTTP, like the Auth0 tenant does
+        body = json.dumps(self.jwks).encode('utf-8')
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = HTTPServer(('127.0.0.1', port), Handler)
+        threading.Thread(target=self._server.serve_forever,
+                         daemon=True).start()
+        return self.jwks_url
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
@@ -0,0 +1,71 @@
+import random
+import datetime
+
+
+'''
+Data generator
+Seeds the database with N movies and N actors (always the same ones for
+the same seed, so runs can be compared).
+'''
+
+WORDS = ['Silent', 'Last', 'Red', 'Night', 'Quiet', 'Place', 'Bad', 'Boys',
+         'Time', 'Heroes', 'River', 'City', 'Dark', 'Summer', 'Lost', 'Star']
+FIRST_NAMES = ['James', 'Will', 'Tati', 'Lea', 'Taylor', 'Emily', 'John',
+               'Maria', 'Omar', 'Yuki', 'Ana', 'Lama', 'Noah', 'Sara']
+LAST_NAMES = ['McAvoy', 'Smith', 'Gabrielle', 'Seydoux', 'Dooley', 'Blunt',
+              'Krasinski', 'Garcia', 'Haddad', 'Tanaka', 'Silva', 'Chen']
+GENDERS = ['Female', 'Male']
+
+
+def movie_rows(count, rng):
+    start = datetime.date(1980, 1, 1)
+    for _ in range(count):
+        yield {
+            'title': ' '.join(rng.sample(WORDS, rng.randint(1, 4))),
+            'release_date': start + datetime.timedelta(
+                days=rng.randint(0, 16000)),
+        }
+
+
+def actor_rows(count, rng):
+    for _ in range(count):
+        yield {
+            'name': '%s %s' % (rng.choice(FIRST_NAMES),
+                               rng.choice(LAST_NAMES)),
+            'age': rng.randint(5, 90),
+            'gender': rng.choice(GENDERS),
+        }
+
+
+def casting_rows(movie_ids, actor_ids, rng, per_movie=3):
+    for movie_id in movie_ids:
+        for actor_id in rng.sample(actor_ids, min(per_movie, len(actor_ids))):
+            yield {'movie_id': movie_id, 'actor_id': actor_id,
+                   'role': rng.choice(WORDS)}
+
+
+def seed(count, batch_size=5000, random_seed=42):
+    # Insert the rows in batches through the models' bulk insert, and
+    # cast a few actors in every movie
+    from models import Movie, Actor, Casting
+    rng = random.Random(random_seed)
+    ids = {}
+    for model, rows in ((Movie, movie_rows(count, rng)),
+                        (Actor, actor_rows(count, rng))):
+        ids[model] = []
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                ids[model] += model.bulk_insert(batch)
+                batch = []
+        ids[model] += model.bulk_insert(batch)
+
+    batch = []
+    for row in casting_rows(ids[Movie], ids[Actor], rng):
+        batch.append(row)
+        if len(batch) == batch_size:
+            Casting.assign(batch)
+            batch = []
+    if batch:
+        Casting.assign(batch)
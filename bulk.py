@@ -0,0 +1,191 @@
+import os
+import json
+import datetime
+from flask import abort
+
+
+# Largest number of rows accepted in one bulk request
+MAX_BULK_ROWS = int(os.environ.get('MAX_BULK_ROWS', 10000))
+
+
+def read_rows(request):
+    '''
+    Read the rows of a bulk request: a JSON array, or NDJSON (one JSON
+    object per line) when the Content-Type is application/x-ndjson
+    '''
+    try:
+        if request.mimetype == 'application/x-ndjson':
+            rows = [json.loads(line)
+                    for line in request.get_data(as_text=True).splitlines()
+                    if line.strip()]
+        else:
+            rows = json.loads(request.get_data(as_text=True))
+    except ValueError:
+        # If the body can't be read, send an error (bad request - 400)
+        abort(400)
+    if not isinstance(rows, list) or not rows:
+        abort(400)
+    # If there are too many rows, send an error (too large - 413)
+    if len(rows) > MAX_BULK_ROWS:
+        abort(413)
+    return rows
+
+
+def _parse_date(value):
+    return datetime.date.fromisoformat(str(value))
+
+
+def _parse_text(value):
+    if not isinstance(value, str) or not value:
+        raise ValueError(value)
+    return value
+
+
+# The fields a bulk update or a filter can use:
+# request field -> (column, parser)
+MOVIE_FIELDS = {
+    'title': ('title', _parse_text),
+    'release-date': ('release_date', _parse_date)
+}
+ACTOR_FIELDS = {
+    'name': ('name', _parse_text),
+    'age': ('age', int),
+    'gender': ('gender', _parse_text)
+}
+
+
+def read_ids(body):
+    # Return the list of ids of a bulk request (None if there is none)
+    if 'ids' not in body:
+        return None
+    ids = body['ids']
+    if not isinstance(ids, list) or not ids or len(ids) > MAX_BULK_ROWS:
+        abort(422)
+    try:
+        return [int(id) for id in ids]
+    except (TypeError, ValueError):
+        abort(422)
+
+
+def read_columns(data, fields):
+    '''
+    Turn {request field: value} into {column: value}. Send an error
+    (unprocessable - 422) if a field is unknown or a value is invalid
+    '''
+    if not isinstance(data, dict) or not data:
+        abort(422)
+    columns = {}
+    for field, value in data.items():
+        if field not in fields:
+            abort(422)
+        column, parse = fields[field]
+        try:
+            columns[column] = parse(value)
+        except (TypeError, ValueError):
+            abort(422)
+    return columns
+
+
+def read_selection(body, fields):
+    '''
+    Return the ids and the filter ({column: value}) of a bulk PATCH or
+    DELETE. One of them is required, so a request can't touch the whole
+    table by mistake
+    '''
+    if not isinstance(body, dict):
+        abort(400)
+    ids = read_ids(body)
+    filters = None
+    if 'filter' in body:
+        filters = read_columns(body['filter'], fields)
+    if ids is None and filters is None:
+        abort(422)
+    return ids, filters
+
+
+def validate_movie(data):
+    # Return the movie's columns and the list of errors (if any), using
+    # the same fields as POST /movies
+    errors = []
+    title = data.get('title')
+    release_date = data.get('release-date')
+    if not title:
+        errors.append('title is required')
+    if not release_date:
+        errors.append('release-date is required')
+    else:
+        try:
+            release_date = _parse_date(release_date)
+        except ValueError:
+            errors.append('release-date must be a date (YYYY-MM-DD)')
+    return {'title': title, 'release_date': release_date}, errors
+
+
+def validate_actor(data):
+    # Return the actor's columns and the list of errors (if any), using
+    # the same fields as POST /actors
+    errors = []
+    name = data.get('name')
+    age = data.get('age')
+    gender = data.get('gender')
+    if not name:
+        errors.append('name is required')
+    if not age:
+        errors.append('age is required')
+    else:
+        try:
+            age = int(age)
+        except (TypeError, ValueError):
+            errors.append('age must be a number')
+    if not gender:
+        errors.append('gender is required')
+    return {'name': name, 'age': age, 'gender': gender}, errors
+
+
+def validate_casting(data):
+    # Return the casting's columns and the list of errors (if any)
+    errors = []
+    columns = {'role': data.get('role')}
+    for field in ('movie_id', 'actor_id'):
+        try:
+            columns[field] = int(data[field])
+        except KeyError:
+            errors.append(field + ' is required')
+        except (TypeError, ValueError):
+            errors.append(field + ' must be a number')
+    if columns['role'] is not None and not isinstance(columns['role'], str):
+        errors.append('role must be a string')
+    return columns, errors
+
+
+def read_pairs(body):
+    # Return the [movie_id, actor_id] pairs of a bulk unassign request
+    if not isinstance(body, dict):
+        abort(400)
+    pairs = body.get('pairs')
+    if not isinstance(pairs, list) or not pairs or \
+            len(pairs) > MAX_BULK_ROWS:
+        abort(422)
+    try:
+        return [(int(movie_id), int(actor_id)) for movie_id, actor_id in pairs]
+    except (TypeError, ValueError):
+        abort(422)
+
+
+def validate_rows(rows, validate):
+    '''
+    Validate every row up front. Return the rows' columns and the
+    per-row errors (an empty list if all the rows are valid)
+    '''
+    mappings = []
+    errors = []
+    for index, data in enumerate(rows):
+        if not isinstance(data, dict):
+            errors.append({'index': index,
+                           'errors': ['row must be an object']})
+            continue
+        mapping, row_errors = validate(data)
+        if row_errors:
+            errors.append({'index': index, 'errors': row_errors})
+        mappings.append(mapping)
+    return mappings, errors
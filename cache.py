@@ -0,0 +1,195 @@
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import request, g, make_response, Response
+from models import change_listeners
+from conditional import resolve_tables, table_versions
+
+
+# In-process cache of the list endpoints' responses
+# (set RESPONSE_CACHE_ENABLED=false to disable)
+RESPONSE_CACHE_ENABLED = os.environ.get(
+    'RESPONSE_CACHE_ENABLED', 'true').lower() not in ('false', '0', 'no')
+# Maximum number of responses kept per worker
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 256))
+# Maximum total size (in bytes) of the responses kept per worker
+RESPONSE_CACHE_MAX_BYTES = int(
+    os.environ.get('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# How long (in seconds) identical requests wait for the one that is
+# already querying the database
+RESPONSE_CACHE_WAIT = float(os.environ.get('RESPONSE_CACHE_WAIT', 10))
+
+
+class CachedResponse:
+    def __init__(self, body, mimetype):
+        self.body = body
+        self.mimetype = mimetype
+        # encoding -> compressed body (see compression.py). There is at
+        # most one per encoding and each is smaller than the body, they
+        # aren't counted in RESPONSE_CACHE_MAX_BYTES.
+        self.compressed = {}
+
+    def encoded(self, encoding, compress):
+        # Compress the body once per encoding
+        data = self.compressed.get(encoding)
+        if data is None:
+            data = self.compressed[encoding] = compress(self.body, encoding)
+        return data
+
+
+'''
+ResponseCache
+A bounded LRU cache of serialized responses, keyed by the tables they
+are built from, their versions and the request's query parameters.
+Writes to a table drop its responses, and a miss shared by a burst of
+identical requests runs the database query only once (single-flight).
+'''
+
+
+class ResponseCache:
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE,
+                 max_bytes=RESPONSE_CACHE_MAX_BYTES,
+                 enabled=RESPONSE_CACHE_ENABLED, wait=RESPONSE_CACHE_WAIT):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.wait = wait
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # key -> Event set when the request computing it is done
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        size = len(entry.body)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.body)
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.maxsize or \
+                    self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+                self.evictions += 1
+
+    def invalidate(self, table):
+        # Drop every response built from the table
+        with self._lock:
+            for key in [key for key in self._entries if table in key[0]]:
+                self._bytes -= len(self._entries.pop(key).body)
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def get_or_compute(self, key, compute):
+        '''
+        Return the cached entry of the key, or call compute() once for
+        all the concurrent requests of the same key. compute() returns
+        (entry to cache or None, response)
+        '''
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry, None
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = threading.Event()
+
+        if not leader:
+            # Another request is already querying the database
+            flight.wait(self.wait)
+            entry = self.get(key)
+            if entry is not None:
+                self.coalesced += 1
+                return entry, None
+            self.misses += 1
+            return compute()
+
+        self.misses += 1
+        try:
+            entry, response = compute()
+            if entry is not None:
+                self.set(key, entry)
+            return entry, response
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.set()
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'size': len(self._entries),
+            'bytes': self._bytes,
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
+
+
+response_cache = ResponseCache()
+# Drop a table's responses as soon as a write to it is committed
+change_listeners.append(response_cache.invalidate)
+
+
+def cached(table):
+    def cached_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not response_cache.enabled:
+                return f(*args, **kwargs)
+
+            # Reuse the versions already read by the conditional GET
+            tables = resolve_tables(table)
+            key = (tables, tuple(version for version, _ in
+                                 table_versions(tables)),
+                   tuple(sorted(request.args.items(multi=True))),
+                   request.headers.get('Accept', ''))
+
+            def compute():
+                response = make_response(f(*args, **kwargs))
+                # Only complete, successful responses are cached
+                if response.status_code != 200 or response.is_streamed:
+                    return None, response
+                return CachedResponse(
+                    response.get_data(), response.mimetype), response
+
+            entry, response = response_cache.get_or_compute(key, compute)
+            # Let the compression reuse the entry's compressed bytes
+            g.cached_response = entry
+            if response is None:
+                response = Response(entry.body, mimetype=entry.mimetype)
+                response.vary.add('Accept')
+                response.headers['X-Cache'] = 'HIT'
+            else:
+                response.headers['X-Cache'] = 'MISS'
+            return response
+
+        return wrapper
+    return cached_decorator
@@ -0,0 +1,344 @@
+import os
+import json
+import time
+import select
+import logging
+import datetime
+import threading
+from collections import deque, namedtuple
+from flask import Response, abort, stream_with_context
+from sqlalchemy import sql, func, create_engine
+from sqlalchemy.pool import NullPool
+from models import db, ChangeEvent, Tombstone, CHANGES_CHANNEL, \
+    change_listeners, GEVENT_WORKERS
+from serializers import dumps
+
+
+# The tables streamed by GET /changes/stream (each needs its 'get:'
+# permission)
+CHANGE_TABLES = ('movies', 'actors')
+# Events kept in memory by each worker for the clients that are behind
+CHANGES_BUFFER_SIZE = int(os.environ.get('CHANGES_BUFFER_SIZE', 10000))
+# Seconds between two checks for new events when nothing wakes the
+# worker up (the other processes' writes on SQLite, a lost NOTIFY)
+CHANGES_POLL_INTERVAL = float(os.environ.get('CHANGES_POLL_INTERVAL', 5))
+# Seconds between two keep-alive comments on an idle stream
+CHANGES_HEARTBEAT = float(os.environ.get('CHANGES_HEARTBEAT', 15))
+# A stream ends after this many seconds, the client reconnects (with
+# Last-Event-ID) on its own. A sync worker would be held (and unable to
+# serve anything else) for the whole stream, so by default it only sends
+# the pending events and ends: the client polls every 3 seconds
+CHANGES_MAX_DURATION = float(os.environ.get(
+    'CHANGES_MAX_DURATION', 300 if GEVENT_WORKERS else 0))
+# Events and tombstones older than this many days are deleted (a client
+# that was away longer has to load the tables again)
+CHANGES_RETENTION_DAYS = float(os.environ.get('CHANGES_RETENTION_DAYS', 7))
+# Most events read from the database at once for a client that resumes
+CHANGES_REPLAY_BATCH = 1000
+# Seconds between two deletions of the old events by a worker
+CHANGES_PRUNE_INTERVAL = 3600
+
+logger = logging.getLogger(__name__)
+
+
+'''
+Change stream
+GET /changes/stream sends the create/update/delete events of the movies
+and the actors as Server-Sent Events. Each worker has one hub: a thread
+that reads the new events from change_events once, when a NOTIFY (or a
+write of the worker itself) says there are some, and keeps the last
+CHANGES_BUFFER_SIZE of them in memory for all its streams. A client that
+is further behind (it resumed with an old Last-Event-ID) reads its
+events from the database first.
+
+The ids of the events are in the order of their commits (see
+record_change), so the id of the last event a client received is where
+it resumes (the Last-Event-ID header). When the events after it were
+deleted already, the stream starts with a 'reset' event: the client
+loads the tables again.
+'''
+
+
+Event = namedtuple('Event', 'id table action ids created_at')
+
+
+def _events(connection, after, tables=None, limit=None):
+    # The events after the id `after` (of the tables, if given)
+    table = ChangeEvent.__table__
+    query = table.select().where(table.c.id > after).order_by(table.c.id)
+    if tables is not None:
+        query = query.where(table.c.table_name.in_(tables))
+    if limit:
+        query = query.limit(limit)
+    return [Event(row.id, row.table_name, row.action,
+                  None if row.row_ids is None else json.loads(row.row_ids),
+                  row.created_at)
+            for row in connection.execute(query)]
+
+
+def _last_id(connection):
+    return connection.execute(sql.select(
+        [func.max(ChangeEvent.__table__.c.id)])).scalar() or 0
+
+
+def prune_changes(connection, days=CHANGES_RETENTION_DAYS):
+    '''
+    Delete the change events older than `days` and the tombstones of the
+    deleted events. Return the number of events deleted
+    '''
+    events = ChangeEvent.__table__
+    tombstones = Tombstone.__table__
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    # The last event is kept, so a client can tell whether it missed
+    # some (see expired and sync.changes_since)
+    last = _last_id(connection)
+    deleted = connection.execute(events.delete().where(
+        (events.c.created_at < cutoff) & (events.c.id < last))).rowcount
+    oldest = connection.execute(sql.select(
+        [func.min(events.c.id)])).scalar()
+    if oldest is not None:
+        connection.execute(tombstones.delete().where(
+            tombstones.c.change_seq < oldest))
+    return deleted
+
+
+class ChangeHub:
+    def __init__(self, size=CHANGES_BUFFER_SIZE):
+        self.size = size
+        self._condition = threading.Condition()
+        self._buffer = deque()
+        # The buffer has every event after the floor, up to the last one
+        self._floor = 0
+        self._last = 0
+        # Incremented each time new events arrive
+        self.generation = 0
+        self._wake = threading.Event()
+        self._thread = None
+        self._app = None
+        self._pruned_at = 0
+
+    def start(self, app):
+        # Started by the first stream of the worker (after the fork)
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._app = app
+            with db.engine.connect() as connection:
+                self._last = self._floor = _last_id(connection)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def position(self):
+        # The id of the last event
+        with self._condition:
+            return self._last
+
+    def wake(self, name=None):
+        # A write of this worker was committed
+        self._wake.set()
+
+    def _listen_postgresql(self, engine):
+        # The LISTEN connection stays open for the life of the worker:
+        # open it outside the app's pool, so it doesn't hold one of the
+        # connections of the requests
+        listener = create_engine(engine.url, poolclass=NullPool)
+        connection = listener.raw_connection()
+        try:
+            dbapi_connection = connection.connection
+            dbapi_connection.autocommit = True
+            cursor = dbapi_connection.cursor()
+            cursor.execute('LISTEN %s' % CHANGES_CHANNEL)
+            while True:
+                self.fetch(engine)
+                readable, _, _ = select.select(
+                    [dbapi_connection], [], [], CHANGES_POLL_INTERVAL)
+                if readable:
+                    dbapi_connection.poll()
+                    # One fetch for all the pending notifications
+                    del dbapi_connection.notifies[:]
+        finally:
+            connection.close()
+            listener.dispose()
+
+    def _poll(self, engine):
+        while True:
+            self.fetch(engine)
+            self._wake.wait(CHANGES_POLL_INTERVAL)
+            self._wake.clear()
+
+    def _run(self):
+        while True:
+            try:
+                with self._app.app_context():
+                    engine = db.engine
+                if engine.dialect.name == 'postgresql':
+                    self._listen_postgresql(engine)
+                else:
+                    self._poll(engine)
+            except Exception:
+                logger.exception('The change stream lost the database')
+                time.sleep(CHANGES_POLL_INTERVAL)
+
+    def fetch(self, engine):
+        # Add the new events to the buffer and wake up the streams
+        with engine.connect() as connection:
+            events = _events(connection, self.position())
+            self._prune(connection)
+        if not events:
+            return
+        with self._condition:
+            for event in events:
+                if event.id <= self._last:
+                    continue
+                self._buffer.append(event)
+                self._last = event.id
+                if len(self._buffer) > self.size:
+                    self._floor = self._buffer.popleft().id
+            self.generation += 1
+            self._condition.notify_all()
+
+    def _prune(self, connection):
+        if time.time() - self._pruned_at < CHANGES_PRUNE_INTERVAL:
+            return
+        self._pruned_at = time.time()
+        prune_changes(connection)
+
+    def events_after(self, after):
+        '''
+        The buffered events after the id, or None if the buffer doesn't
+        go back that far (read them from the database)
+        '''
+        with self._condition:
+            if after < self._floor:
+                return None
+            return [event for event in self._buffer if event.id > after]
+
+    def wait(self, generation, timeout):
+        # Wait for events newer than the generation. Return whether some
+        # arrived
+        with self._condition:
+            if self.generation == generation:
+                self._condition.wait(timeout)
+            return self.generation != generation
+
+
+hub = ChangeHub()
+change_listeners.append(hub.wake)
+
+
+def get_last_event_id(value):
+    # Read a Last-Event-ID, or send an error (bad request - 400)
+    try:
+        last_event_id = int(value)
+    except ValueError:
+        abort(400)
+    if last_event_id < 0:
+        abort(400)
+    return last_event_id
+
+
+def get_duration(args):
+    # Seconds before the stream ends (?duration=, at most
+    # CHANGES_MAX_DURATION)
+    try:
+        duration = float(args.get('duration', CHANGES_MAX_DURATION))
+    except ValueError:
+        abort(400)
+    if duration < 0:
+        abort(400)
+    return min(duration, CHANGES_MAX_DURATION)
+
+
+def get_tables(args):
+    # The streamed tables (?tables=movies,actors), or send an error (bad
+    # request - 400) if one of them doesn't exist
+    requested = args.get('tables')
+    if not requested:
+        return CHANGE_TABLES
+    tables = tuple(name.strip() for name in requested.split(',')
+                   if name.strip())
+    if not tables or any(name not in CHANGE_TABLES for name in tables):
+        abort(400)
+    return tables
+
+
+def _message(event):
+    data = dumps({
+        'id': event.id,
+        'table': event.table,
+        'action': event.action,
+        'ids': event.ids,
+        'at': event.created_at.isoformat() + 'Z',
+    })
+    return ('id: %d\nevent: change\ndata: ' % event.id).encode('ascii') + \
+        data + b'\n\n'
+
+
+def expired(engine, last_event_id):
+    '''
+    Whether events after the client's last one may have been deleted
+    (older than the retention). The last event is never deleted, so the
+    oldest one left is right after a client that missed none.
+    '''
+    with engine.connect() as connection:
+        oldest = connection.execute(sql.select(
+            [func.min(ChangeEvent.__table__.c.id)])).scalar()
+    return oldest is not None and last_event_id + 1 < oldest
+
+
+def stream_changes(app, tables, last_event_id=None,
+                   duration=CHANGES_MAX_DURATION):
+    hub.start(app)
+    engine = db.engine
+    # Start after the client's last event, or from now
+    start = get_last_event_id(last_event_id) if last_event_id \
+        else hub.position()
+
+    def generate():
+        after = start
+        # Reconnect after 3 seconds if the connection is lost
+        yield b'retry: 3000\n\n'
+        if last_event_id and expired(engine, after):
+            # Start again from now, after loading the tables
+            after = hub.position()
+            yield ('id: %d\nevent: reset\ndata: {}\n\n' % after).encode(
+                'ascii')
+        deadline = time.monotonic() + duration
+        while True:
+            generation = hub.generation
+            # A poll (no duration) doesn't wait for the hub to read the
+            # latest events
+            events = hub.events_after(after) if duration else None
+            if events is None:
+                # Too far behind for the buffer
+                with engine.connect() as connection:
+                    events = _events(connection, after, tables,
+                                     CHANGES_REPLAY_BATCH)
+                if events:
+                    after = events[-1].id
+                else:
+                    after = max(after, hub.position())
+            elif events:
+                after = events[-1].id
+            for event in events:
+                # The events of the other tables are skipped
+                if event.table in tables:
+                    yield _message(event)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                # Where the client resumes, even if none of the events
+                # were for its tables (an id without data is no event)
+                yield ('id: %d\n\n' % after).encode('ascii')
+                break
+            if events:
+                continue
+            if not hub.wait(generation, min(remaining, CHANGES_HEARTBEAT)):
+                # Keep the connection (and the proxies) open
+                yield b': keep-alive\n\n'
+
+    response = Response(stream_with_context(generate()),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Don't let nginx buffer the events
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,188 @@
+import os
+import zlib
+from flask import request, g
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Compress the responses (set COMPRESSION_ENABLED=false to disable, e.g.
+# when a proxy already does it)
+COMPRESSION_ENABLED = os.environ.get(
+    'COMPRESSION_ENABLED', 'true').lower() not in ('false', '0', 'no')
+# Responses smaller than this (in bytes) are sent as they are
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))
+# The encodings offered, preferred first when the client accepts several
+# equally (brotli and zstd need the brotli / zstandard packages)
+COMPRESSION_ENCODINGS = os.environ.get(
+    'COMPRESSION_ENCODINGS', 'zstd,br,gzip').split(',')
+# Higher levels make smaller responses for more CPU
+COMPRESSION_LEVELS = {
+    'gzip': int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6)),
+    'br': int(os.environ.get('COMPRESSION_BROTLI_LEVEL', 4)),
+    'zstd': int(os.environ.get('COMPRESSION_ZSTD_LEVEL', 3)),
+}
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/msgpack',
+                          'application/x-ndjson'}
+
+# Called with (encoding, size before, size after) of every compressed
+# response (see metrics.py)
+compression_listeners = []
+
+
+'''
+Compression
+Negotiates gzip, brotli or zstd through Accept-Encoding and compresses
+the responses above COMPRESSION_MIN_SIZE. Streamed responses are
+compressed chunk by chunk as they are sent, and the compressed bytes of
+a cached response are kept with it, so a cache hit isn't compressed
+again.
+'''
+
+
+class _GzipCompressor:
+    def __init__(self, level):
+        # wbits 31: a gzip header and trailer around the deflate stream
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+class _BrotliCompressor:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.finish()
+
+
+class _ZstdCompressor:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+
+def _available():
+    compressors = {'gzip': _GzipCompressor}
+    if brotli is not None:
+        compressors['br'] = _BrotliCompressor
+    if zstandard is not None:
+        compressors['zstd'] = _ZstdCompressor
+    return compressors
+
+
+COMPRESSORS = _available()
+
+
+def compressor(encoding):
+    return COMPRESSORS[encoding](COMPRESSION_LEVELS[encoding])
+
+
+def compress(data, encoding):
+    stream = compressor(encoding)
+    return stream.compress(data) + stream.flush()
+
+
+def choose_encoding():
+    # The encoding the client accepts with the highest quality (the
+    # server's preference breaks the ties), or None
+    if not COMPRESSION_ENABLED:
+        return None
+    best, best_quality = None, 0
+    for encoding in COMPRESSION_ENCODINGS:
+        if encoding not in COMPRESSORS:
+            continue
+        quality = request.accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _observe(encoding, size, compressed_size):
+    for listener in compression_listeners:
+        listener(encoding, size, compressed_size)
+
+
+def _compress_stream(chunks, encoding):
+    stream = compressor(encoding)
+    size = compressed_size = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            size += len(chunk)
+            data = stream.compress(chunk)
+            if data:
+                compressed_size += len(data)
+                yield data
+        data = stream.flush()
+        compressed_size += len(data)
+        yield data
+        _observe(encoding, size, compressed_size)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def _compressible(response):
+    # The events of a stream must reach the client right away, not when
+    # a compressed block is full
+    return response.status_code == 200 and \
+        'Content-Encoding' not in response.headers and \
+        not response.direct_passthrough and \
+        response.mimetype != 'text/event-stream' and \
+        (response.mimetype in COMPRESSIBLE_MIMETYPES or
+         response.mimetype.startswith('text/'))
+
+
+def compress_response(response):
+    if not COMPRESSION_ENABLED or not _compressible(response):
+        return response
+    # The body depends on the Accept-Encoding header
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESSION_MIN_SIZE:
+            return response
+        # Reuse the compressed bytes of a cached response (see cache.py)
+        entry = g.get('cached_response')
+        if entry is not None and entry.body == body:
+            data = entry.encoded(encoding, compress)
+        else:
+            data = compress(body, encoding)
+        response.set_data(data)
+        _observe(encoding, len(body), len(data))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    if 'compression' in app.extensions:
+        return
+    app.extensions['compression'] = True
+    app.after_request(compress_response)
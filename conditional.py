@@ -0,0 +1,90 @@
+import hashlib
+import datetime
+from functools import wraps
+from flask import request, g, make_response
+from models import get_version
+from compression import choose_encoding
+
+
+'''
+Conditional GET
+The list endpoints send an ETag and a Last-Modified header built from
+the table's version stamp. A client that sends them back (If-None-Match
+/ If-Modified-Since) gets a 304 Not Modified before the table is queried
+or serialized.
+'''
+
+
+def make_etag(table, version):
+    # The same version has a different body for other query parameters
+    # (page, fields, ...), another representation (JSON / NDJSON) or
+    # another content encoding (gzip, ...)
+    variant = hashlib.sha1('{}|{}|{}'.format(
+        sorted(request.args.items(multi=True)),
+        request.headers.get('Accept', ''),
+        choose_encoding()).encode('utf-8')).hexdigest()
+    return '{}-{}-{}'.format(table, version, variant[:16])
+
+
+def resolve_tables(tables):
+    # A table's name, a tuple of names, or a function returning either
+    # (for the responses whose tables depend on the request)
+    if callable(tables):
+        tables = tables()
+    if isinstance(tables, str):
+        tables = (tables,)
+    return tuple(tables)
+
+
+def table_versions(tables):
+    # The (version, updated_at) of each table, read once per request
+    if not hasattr(g, 'versions'):
+        g.versions = {}
+    for table in tables:
+        if table not in g.versions:
+            g.versions[table] = get_version(table)
+    return [g.versions[table] for table in tables]
+
+
+def _not_modified(etag, updated_at):
+    # The ETag decides alone when the client sent one
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and updated_at is not None:
+        # HTTP dates have no microseconds: a write in the same second as
+        # the client's date may be newer than its copy, so the table must
+        # have changed strictly before that second
+        if updated_at.microsecond:
+            updated_at = updated_at.replace(microsecond=0) + \
+                datetime.timedelta(seconds=1)
+        return updated_at < request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def conditional(table):
+    def conditional_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            # The response changes when any of its tables does
+            tables = resolve_tables(table)
+            versions = table_versions(tables)
+            version = '.'.join(str(version) for version, _ in versions)
+            updated = [updated_at for _, updated_at in versions
+                       if updated_at is not None]
+            updated_at = max(updated) if updated else None
+            etag = make_etag('+'.join(tables), version)
+
+            if _not_modified(etag, updated_at):
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if updated_at is not None:
+                response.last_modified = updated_at
+            return response
+
+        return wrapper
+    return conditional_decorator
@@ -0,0 +1,195 @@
+import io
+import os
+import csv
+import gzip
+import datetime
+from contextlib import contextmanager
+from flask import Response, abort, stream_with_context
+from sqlalchemy import select, text
+from models import db, Movie, Actor
+from serializers import dumps
+import compression
+
+
+# Number of rows fetched from the server-side cursor (and written) at a
+# time
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 5000))
+
+# format -> mimetype
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+# The tables that can be exported
+EXPORT_TABLES = {
+    'movies': Movie,
+    'actors': Actor,
+}
+
+
+'''
+Export
+Dumps whole tables as CSV or JSONL (one object per line) for the backups
+and the analytics, through GET /export and flask export. The rows are
+read from a server-side cursor and written a batch at a time, so the
+memory used doesn't depend on the size of the table, and all of them
+come from one snapshot of the database (a REPEATABLE READ transaction
+on PostgreSQL).
+'''
+
+
+@contextmanager
+def snapshot(engine):
+    # A read-only connection that sees the database as it was at its
+    # first statement
+    connection = engine.connect()
+    try:
+        if engine.dialect.name == 'postgresql':
+            connection = connection.execution_options(
+                isolation_level='REPEATABLE READ')
+            transaction = connection.begin()
+            connection.execute(text('SET TRANSACTION READ ONLY'))
+        else:
+            transaction = connection.begin()
+            if engine.dialect.name == 'sqlite':
+                # pysqlite doesn't start a transaction for a SELECT
+                connection.execute(text('BEGIN'))
+        try:
+            yield connection
+        finally:
+            # Nothing to commit
+            transaction.rollback()
+    finally:
+        connection.close()
+
+
+def columns(table):
+    # The public columns (not the change sequence of the delta syncs)
+    return list(EXPORT_TABLES[table].public_fields)
+
+
+def iter_batches(connection, table, batch_size=EXPORT_BATCH_SIZE):
+    # The rows of the table in lists of at most batch_size rows, from a
+    # server-side cursor (in the order of the primary key)
+    model_table = EXPORT_TABLES[table].__table__
+    result = connection.execution_options(stream_results=True).execute(
+        select([model_table.c[name] for name in columns(table)])
+        .order_by(model_table.c.id))
+    try:
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        result.close()
+
+
+def _value(value):
+    # Dates in ISO format ('2021-04-01'), so flask import reads them back
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+
+def _encode_csv(names, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for rows in batches:
+        writer.writerows([_value(value) for value in row] for row in rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    # The header of an empty table
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _encode_jsonl(names, batches):
+    for rows in batches:
+        yield b''.join(
+            dumps({name: _value(value) for name, value in zip(names, row)}) +
+            b'\n' for row in rows)
+
+
+def encode(fmt, table, batches):
+    # The bytes of the export, a batch at a time
+    if fmt == 'csv':
+        return _encode_csv(columns(table), batches)
+    return _encode_jsonl(columns(table), batches)
+
+
+def _gzip(chunks):
+    stream = compression.compressor('gzip')
+    for chunk in chunks:
+        data = stream.compress(chunk)
+        if data:
+            yield data
+    yield stream.flush()
+
+
+def filename(table, fmt, compress=False):
+    return '%s.%s%s' % (table, fmt, '.gz' if compress else '')
+
+
+def get_table(args):
+    # The exported table (?table=), or send an error (bad request - 400)
+    table = args.get('table')
+    if table not in EXPORT_TABLES:
+        abort(400)
+    return table
+
+
+def get_format(args):
+    fmt = args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        abort(400)
+    return fmt
+
+
+def export_response(table, fmt, compress=False,
+                    batch_size=EXPORT_BATCH_SIZE):
+    engine = db.engine
+
+    def generate():
+        with snapshot(engine) as connection:
+            chunks = encode(fmt, table, iter_batches(
+                connection, table, batch_size))
+            if compress:
+                chunks = _gzip(chunks)
+            yield from chunks
+
+    response = Response(stream_with_context(generate()),
+                        mimetype='application/gzip' if compress
+                        else EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = 'attachment; filename="%s"' % (
+        filename(table, fmt, compress))
+    return response
+
+
+def export_files(tables, fmt='csv', directory='.', compress=False,
+                 batch_size=EXPORT_BATCH_SIZE):
+    '''
+    Write each table to <directory>/<table>.<format>[.gz] (flask export),
+    all of them from the same snapshot. Return [(path, number of rows)].
+    '''
+    written = []
+    with snapshot(db.engine) as connection:
+        for table in tables:
+            path = os.path.join(directory, filename(table, fmt, compress))
+            counts = []
+
+            def counted(batches):
+                for rows in batches:
+                    counts.append(len(rows))
+                    yield rows
+
+            opener = gzip.open if compress else open
+            with opener(path, 'wb') as output:
+                for chunk in encode(fmt, table, counted(iter_batches(
+                        connection, table, batch_size))):
+                    output.write(chunk)
+            written.append((path, sum(counts)))
+    return written
@@ -0,0 +1,80 @@
+import datetime
+from flask import abort
+
+
+'''
+Filters and sorts of the list endpoints
+Every filter and every sort is backed by an index of models.py (and of
+the migrations), so the database never scans a whole table for them.
+'''
+
+# sort= values a client can use: field -> column name
+MOVIE_SORTS = ('id', 'title', 'release_date')
+ACTOR_SORTS = ('id', 'name', 'age')
+
+
+def _escape_like(value):
+    # Match the prefix literally (% and _ are LIKE wildcards)
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _get_date(args, name):
+    if name not in args:
+        return None
+    try:
+        return datetime.date.fromisoformat(args[name])
+    except ValueError:
+        # If the date can't be read, send an error (bad request - 400)
+        abort(400)
+
+
+def _get_int(args, name):
+    if name not in args:
+        return None
+    try:
+        return int(args[name])
+    except ValueError:
+        abort(400)
+
+
+def get_sort(args, model, sorts):
+    '''
+    Return the column to sort by and whether the order is descending
+    (sort=-title). The default is the id, ascending
+    '''
+    sort = args.get('sort', 'id')
+    descending = sort.startswith('-')
+    name = sort[1:] if descending else sort
+    if name not in sorts:
+        abort(400)
+    return getattr(model, name), descending
+
+
+def filter_movies(query, args, model):
+    # title_prefix=, release_date_from= and release_date_to= (inclusive)
+    if args.get('title_prefix'):
+        query = query.filter(model.title.like(
+            _escape_like(args['title_prefix']) + '%', escape='\\'))
+    release_date_from = _get_date(args, 'release_date_from')
+    if release_date_from is not None:
+        query = query.filter(model.release_date >= release_date_from)
+    release_date_to = _get_date(args, 'release_date_to')
+    if release_date_to is not None:
+        query = query.filter(model.release_date <= release_date_to)
+    return query
+
+
+def filter_actors(query, args, model):
+    # name_prefix=, gender=, min_age= and max_age= (inclusive)
+    if args.get('name_prefix'):
+        query = query.filter(model.name.like(
+            _escape_like(args['name_prefix']) + '%', escape='\\'))
+    if args.get('gender'):
+        query = query.filter(model.gender == args['gender'])
+    min_age = _get_int(args, 'min_age')
+    if min_age is not None:
+        query = query.filter(model.age >= min_age)
+    max_age = _get_int(args, 'max_age')
+    if max_age is not None:
+        query = query.filter(model.age <= max_age)
+    return query
@@ -0,0 +1,48 @@
+import os
+
+
+# gunicorn loads this file by default (see the Procfile)
+
+# 'sync' (one request per worker at a time) or 'gevent' (cooperative
+# workers: a request waiting on Postgres or on the JWKS download yields
+# to the others, so each worker keeps up to WORKER_CONNECTIONS requests
+# in flight)
+worker_class = os.environ.get('WORKER_CLASS', 'sync')
+worker_connections = int(os.environ.get('WORKER_CONNECTIONS', 1000))
+
+
+def _gevent_wait_callback(connection, timeout=None):
+    # Wait for psycopg2 through the gevent hub instead of blocking the
+    # whole worker
+    from psycopg2 import extensions, OperationalError
+    from gevent.socket import wait_read, wait_write
+    while True:
+        state = connection.poll()
+        if state == extensions.POLL_OK:
+            break
+        elif state == extensions.POLL_READ:
+            wait_read(connection.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(connection.fileno(), timeout=timeout)
+        else:
+            raise OperationalError('Bad result from poll: %r' % state)
+
+
+def post_fork(server, worker):
+    # gunicorn monkey-patches the standard library (sockets, threads,
+    # urlopen of the JWKS) in gevent workers, psycopg2 needs a callback
+    if 'gevent' not in server.cfg.worker_class_str:
+        return
+    try:
+        from psycopg2 import extensions
+    except ImportError:
+        # Not using PostgreSQL
+        return
+    extensions.set_wait_callback(_gevent_wait_callback)
+
+
+def child_exit(server, worker):
+    # Drop the live metrics of a worker that exited (see metrics.py)
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,229 @@
+import os
+import csv
+import gzip
+import json
+import time
+from sqlalchemy import text
+from models import db, Movie, Actor
+from bulk import validate_movie, validate_actor
+
+
+# Number of valid rows written (and committed) at a time
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 5000))
+
+# table -> (model, validation of a row)
+IMPORT_TABLES = {
+    'movies': (Movie, validate_movie),
+    'actors': (Actor, validate_actor),
+}
+
+# The column names of flask export -> the fields of POST /movies
+FIELD_ALIASES = {
+    'release_date': 'release-date',
+}
+
+
+'''
+Import
+flask import loads a CSV or JSONL file (gzipped or not, e.g. one written
+by flask export) into a table. The rows are read as a stream, validated
+like the rows of the bulk endpoints, and written a batch at a time with
+COPY FROM STDIN on PostgreSQL (an executemany elsewhere, see
+bulk_insert). Each batch is committed on its own:
+- the rows that fail the validation are written to the rejects file
+  (one JSON object per line, with their line and their errors)
+- after each batch, the checkpoint file records how many rows of the
+  file are done, so an interrupted import resumes where it stopped
+- the secondary indexes can be dropped before the load and built once
+  at the end (--defer-indexes), which is faster than updating them for
+  every row. Their definitions are kept in the checkpoint until then.
+'''
+
+
+def file_format(path, fmt=None):
+    # The format of the file: given, or from its extension
+    if fmt:
+        return fmt
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'csv' if name.endswith('.csv') else 'jsonl'
+
+
+def read_records(path, fmt):
+    '''
+    Yield (number of the record, row dict or None, error) for each
+    record of the file (None and an error if it can't be read)
+    '''
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as source:
+        if fmt == 'csv':
+            for number, row in enumerate(csv.DictReader(source), 1):
+                yield number, row, None
+            return
+        number = 0
+        for line in source:
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield number, None, 'invalid JSON'
+                continue
+            if not isinstance(row, dict):
+                yield number, None, 'row must be an object'
+                continue
+            yield number, row, None
+
+
+def validate(table, data, keep_ids=False):
+    # Return the row's columns and its errors
+    model, validate_row = IMPORT_TABLES[table]
+    data = {FIELD_ALIASES.get(field, field): value
+            for field, value in data.items()}
+    mapping, errors = validate_row(data)
+    if keep_ids:
+        try:
+            mapping['id'] = int(data['id'])
+        except KeyError:
+            errors.append('id is required')
+        except (TypeError, ValueError):
+            errors.append('id must be a number')
+    return mapping, errors
+
+
+def load_checkpoint(path, table, source):
+    state = {'table': table, 'file': os.path.abspath(source), 'records': 0,
+             'imported': 0, 'rejected': 0, 'indexes': None}
+    if path and os.path.exists(path):
+        with open(path) as checkpoint:
+            saved = json.load(checkpoint)
+        # A checkpoint of another import doesn't apply
+        if saved.get('table') == table and \
+                saved.get('file') == state['file']:
+            state.update(saved)
+    return state
+
+
+def save_checkpoint(path, state):
+    if not path:
+        return
+    # Write a new file and move it over the old one, so a crash never
+    # leaves half a checkpoint
+    with open(path + '.tmp', 'w') as checkpoint:
+        json.dump(state, checkpoint)
+    os.replace(path + '.tmp', path)
+
+
+def secondary_indexes(table):
+    # [(name, definition)] of the indexes of the table, except the ones
+    # of the primary key and of the unique constraints
+    if db.engine.dialect.name == 'postgresql':
+        rows = db.session.execute(text(
+            'SELECT indexname, indexdef FROM pg_indexes '
+            'WHERE schemaname = current_schema() AND tablename = :table '
+            'AND indexname NOT IN (SELECT conname FROM pg_constraint '
+            'WHERE conrelid = CAST(:table AS regclass))'), {'table': table})
+    else:
+        rows = db.session.execute(text(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+            'AND tbl_name = :table AND sql IS NOT NULL'), {'table': table})
+    return [[name, definition] for name, definition in rows]
+
+
+def drop_indexes(table):
+    indexes = secondary_indexes(table)
+    for name, _ in indexes:
+        db.session.execute(text('DROP INDEX %s' % name))
+    db.session.commit()
+    return indexes
+
+
+def create_indexes(indexes):
+    for _, definition in indexes:
+        db.session.execute(text(definition))
+    db.session.commit()
+
+
+def reset_sequence(model):
+    # Move the id sequence past the imported ids (PostgreSQL), so the
+    # next insert doesn't reuse one of them
+    if db.engine.dialect.name != 'postgresql':
+        return
+    table = model.__tablename__
+    db.session.execute(text(
+        "SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+        'COALESCE((SELECT MAX(id) FROM %s), 1))' % table), {'table': table})
+    db.session.commit()
+
+
+def import_file(table, path, fmt=None, batch_size=IMPORT_BATCH_SIZE,
+                rejects=None, checkpoint=None, defer_indexes=False,
+                keep_ids=False, progress=print):
+    '''
+    Import the rows of the file into the table and return the state of
+    the import (rows read, imported and rejected)
+    '''
+    model = IMPORT_TABLES[table][0]
+    fmt = file_format(path, fmt)
+    state = load_checkpoint(checkpoint, table, path)
+    if defer_indexes and state['indexes'] is None:
+        state['indexes'] = drop_indexes(table)
+        save_checkpoint(checkpoint, state)
+
+    start = time.perf_counter()
+    imported = 0
+    rejects_file = open(rejects, 'a') if rejects else None
+    batch = []
+    rejected = []
+    number = state['records']
+
+    def flush():
+        nonlocal batch, rejected, imported
+        model.bulk_insert(batch, return_ids=False)
+        # The rejects and the checkpoint of the batch once it is
+        # committed, so a resumed import doesn't write them twice
+        if rejects_file:
+            for reject in rejected:
+                rejects_file.write(json.dumps(reject, default=str) + '\n')
+            rejects_file.flush()
+        imported += len(batch)
+        state['records'] = number
+        state['imported'] += len(batch)
+        state['rejected'] += len(rejected)
+        save_checkpoint(checkpoint, state)
+        elapsed = time.perf_counter() - start
+        progress('%s: %d rows imported, %d rejected (%d rows/s)' % (
+            table, state['imported'], state['rejected'],
+            imported / elapsed if elapsed else 0))
+        batch = []
+        rejected = []
+
+    try:
+        for number, data, error in read_records(path, fmt):
+            # Skip the rows a previous run already imported
+            if number <= state['records']:
+                continue
+            errors = [error] if error else []
+            if data is not None:
+                mapping, errors = validate(table, data, keep_ids)
+            if errors:
+                rejected.append({'line': number, 'row': data,
+                                 'errors': errors})
+            else:
+                batch.append(mapping)
+            if len(batch) >= batch_size:
+                flush()
+        if batch or rejected:
+            flush()
+    finally:
+        if rejects_file:
+            rejects_file.close()
+
+    if keep_ids:
+        reset_sequence(model)
+    if state['indexes']:
+        progress('%s: building %d indexes' % (table, len(state['indexes'])))
+        create_indexes(state['indexes'])
+        state['indexes'] = []
+        save_checkpoint(checkpoint, state)
+    return state
@@ -0,0 +1,85 @@
+from flask import abort
+from models import db, Movie, Actor, Casting, IN_CHUNK_SIZE
+
+
+'''
+Includes
+?include=cast (GET /movies) and ?include=movies (GET /actors) add the
+related rows to each row of a list. They are loaded for a whole page
+(or a whole batch of a stream) with one IN query, so the number of
+queries doesn't grow with the number of rows.
+'''
+
+# The includes each list endpoint accepts
+MOVIE_INCLUDES = ('cast',)
+ACTOR_INCLUDES = ('movies',)
+
+
+def get_includes(args, allowed):
+    # Return the requested includes, or send an error (bad request -
+    # 400) if one of them doesn't exist
+    includes = []
+    for name in args.get('include', '').split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in allowed:
+            abort(400)
+        if name not in includes:
+            includes.append(name)
+    return includes
+
+
+def movie_cast(movie_ids):
+    # {movie id: [actor with its role]} of the movies
+    cast = {movie_id: [] for movie_id in movie_ids}
+    ids = list(cast)
+    for start in range(0, len(ids), IN_CHUNK_SIZE):
+        rows = db.session.query(Casting.movie_id, Casting.role, Actor) \
+            .join(Actor, Actor.id == Casting.actor_id) \
+            .filter(Casting.movie_id.in_(ids[start:start + IN_CHUNK_SIZE])) \
+            .order_by(Casting.movie_id, Actor.id)
+        for movie_id, role, actor in rows:
+            cast[movie_id].append(dict(actor.format(), role=role))
+    return cast
+
+
+def actor_movies(actor_ids):
+    # {actor id: [movie with the actor's role]} of the actors
+    movies = {actor_id: [] for actor_id in actor_ids}
+    ids = list(movies)
+    for start in range(0, len(ids), IN_CHUNK_SIZE):
+        rows = db.session.query(Casting.actor_id, Casting.role, Movie) \
+            .join(Movie, Movie.id == Casting.movie_id) \
+            .filter(Casting.actor_id.in_(ids[start:start + IN_CHUNK_SIZE])) \
+            .order_by(Casting.actor_id, Movie.id)
+        for actor_id, role, movie in rows:
+            movies[actor_id].append(dict(movie.format(), role=role))
+    return movies
+
+
+# include -> function loading it for a list of ids
+LOADERS = {
+    'cast': movie_cast,
+    'movies': actor_movies,
+}
+
+
+def rows_formatter(format_row, includes=()):
+    # Return a function that turns a list of rows into the response's
+    # dicts, with the includes loaded once for all the rows
+    if not includes:
+        return lambda rows: [format_row(row) for row in rows]
+
+    def format_rows(rows):
+        ids = [row.id for row in rows]
+        related = [(name, LOADERS[name](ids)) for name in includes]
+        items = []
+        for row in rows:
+            item = format_row(row)
+            for name, values in related:
+                item[name] = values[row.id]
+            items.append(item)
+        return items
+
+    return format_rows
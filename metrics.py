@@ -0,0 +1,197 @@
+import os
+import time
+import weakref
+import threading
+from flask import request, g, has_request_context, Response, abort
+from sqlalchemy import event
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, \
+    REGISTRY, generate_latest, CONTENT_TYPE_LATEST, multiprocess
+import auth
+import compression
+from models import db
+from replicas import replica_router
+
+
+# Directory shared by the gunicorn workers to aggregate their metrics
+# (see gunicorn.conf.py). Without it, /metrics only shows the worker
+# that answers the scrape.
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+# If set, /metrics requires 'Authorization: Bearer <METRICS_TOKEN>'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency per route',
+    ['method', 'route'])
+REQUEST_COUNT = Counter(
+    'http_requests_total', 'Requests per route and status code',
+    ['method', 'route', 'status'])
+AUTH_PHASE_LATENCY = Histogram(
+    'auth_phase_duration_seconds',
+    'Time spent in each phase of requires_auth '
+    '(header, cache, jwks, decode, permissions)',
+    ['phase'], buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1))
+SQL_QUERIES = Histogram(
+    'db_queries_per_request', 'Number of SQL statements per request',
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+SQL_TIME = Histogram(
+    'db_query_seconds_per_request', 'Time spent in SQL per request')
+POOL_CHECKOUTS = Counter(
+    'db_pool_checkouts_total', 'Connections checked out of the pool',
+    ['database'])
+POOL_WAIT = Histogram(
+    'db_pool_wait_seconds', 'Time spent waiting for a pool connection',
+    ['database'], buckets=(.0001, .001, .005, .01, .05, .1, .5, 1, 5, 30))
+POOL_IN_USE = Gauge(
+    'db_pool_connections_in_use', 'Connections currently checked out',
+    ['database'], multiprocess_mode='livesum')
+COMPRESSION_RATIO = Histogram(
+    'http_response_compression_ratio',
+    'Compressed size / uncompressed size of the compressed responses',
+    ['encoding'], buckets=(.05, .1, .15, .2, .3, .4, .5, .75, 1))
+UNCOMPRESSED_BYTES = Counter(
+    'http_response_uncompressed_bytes_total',
+    'Size of the compressed responses before compression', ['encoding'])
+COMPRESSED_BYTES = Counter(
+    'http_response_compressed_bytes_total',
+    'Size of the compressed responses after compression', ['encoding'])
+SHED_REQUESTS = Counter(
+    'http_requests_shed_total',
+    'Requests answered 503 by the admission control '
+    '(overloaded, queue_timeout)', ['reason'])
+
+# Called with the seconds each checkout of the primary's pool waited
+# (see admission.py)
+pool_wait_listeners = []
+
+
+def _observe_auth_phase(phase, seconds):
+    AUTH_PHASE_LATENCY.labels(phase).observe(seconds)
+
+
+def _observe_compression(encoding, size, compressed_size):
+    if size:
+        COMPRESSION_RATIO.labels(encoding).observe(compressed_size / size)
+    UNCOMPRESSED_BYTES.labels(encoding).inc(size)
+    COMPRESSED_BYTES.labels(encoding).inc(compressed_size)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if has_request_context():
+        g.sql_count = g.get('sql_count', 0) + 1
+        g.sql_time = g.get('sql_time', 0.0) + elapsed
+
+
+def _handle_error(context):
+    # A statement that raised never reaches after_cursor_execute: drop
+    # its start time
+    if context.connection is None or context.execution_context is None:
+        return
+    starts = context.connection.info.get('query_start')
+    if starts:
+        starts.pop()
+
+
+# The engines that already have the listeners
+_instrumented = weakref.WeakSet()
+
+
+def instrument_engine(engine, name):
+    if engine in _instrumented:
+        return
+    _instrumented.add(engine)
+
+    # Count the statements and time them
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+
+    # Time how long getting a connection from the pool takes: from the
+    # call of the pool's public connect() to its checkout event (a new
+    # DBAPI connection is opened in between if the pool needs one)
+    pool = engine.pool
+    pending = threading.local()
+    connect = pool.connect
+
+    def timed_connect():
+        pending.start = time.perf_counter()
+        try:
+            return connect()
+        finally:
+            pending.start = None
+
+    pool.connect = timed_connect
+
+    # Count the checkouts and the connections in use
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, record, proxy):
+        POOL_CHECKOUTS.labels(name).inc()
+        POOL_IN_USE.labels(name).inc()
+        start = getattr(pending, 'start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        POOL_WAIT.labels(name).observe(elapsed)
+        if name == 'primary':
+            for listener in pool_wait_listeners:
+                listener(elapsed)
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, record):
+        POOL_IN_USE.labels(name).dec()
+
+
+def _before_request():
+    # setup_db() may have replaced the engine since init_app()
+    instrument_engine(db.engine, 'primary')
+    g.request_start = time.perf_counter()
+    g.sql_count = 0
+    g.sql_time = 0.0
+
+
+def _after_request(response):
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    if 'request_start' in g:
+        REQUEST_LATENCY.labels(request.method, route).observe(
+            time.perf_counter() - g.request_start)
+    REQUEST_COUNT.labels(request.method, route, response.status_code).inc()
+    SQL_QUERIES.observe(g.get('sql_count', 0))
+    SQL_TIME.observe(g.get('sql_time', 0.0))
+    return response
+
+
+def init_app(app):
+    if 'metrics' in app.extensions:
+        return
+    app.extensions['metrics'] = True
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    with app.app_context():
+        instrument_engine(db.engine, 'primary')
+    for index, replica in enumerate(replica_router.replicas):
+        instrument_engine(replica.engine, 'replica%d' % index)
+
+
+auth.phase_listeners.append(_observe_auth_phase)
+compression.compression_listeners.append(_observe_compression)
+
+
+def metrics_response():
+    # Prometheus text format, aggregated over all the workers if the
+    # multiprocess directory is configured
+    if METRICS_TOKEN and request.headers.get('Authorization') != \
+            'Bearer ' + METRICS_TOKEN:
+        abort(401)
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
@@ -0,0 +1,32 @@
+"""table versions
+
+Revision ID: 2c7f5a9e3d10
+Revises: 1799041c1604
+Create Date: 2026-10-18 04:21:07.884213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c7f5a9e3d10'
+down_revision = '1799041c1604'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The version stamps of the tables (see bump_version), the app adds
+    # their rows when it starts
+    op.create_table(
+        'table_versions',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('table_versions')
@@ -0,0 +1,38 @@
+"""castings
+
+Revision ID: 5b2e8c1d7a43
+Revises: 9654f2d79609
+Create Date: 2026-10-18 04:32:15.104211
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2e8c1d7a43'
+down_revision = '9654f2d79609'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'castings',
+        sa.Column('movie_id', sa.Integer(), nullable=False),
+        sa.Column('actor_id', sa.Integer(), nullable=False),
+        sa.Column('role', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(['actor_id'], ['actors.id'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['movie_id'], ['movies.id'],
+                                ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('movie_id', 'actor_id')
+    )
+    # The primary key indexes movie_id, this index actor_id
+    op.create_index('ix_castings_actor_id_movie_id', 'castings',
+                    ['actor_id', 'movie_id'])
+
+
+def downgrade():
+    op.drop_index('ix_castings_actor_id_movie_id', table_name='castings')
+    op.drop_table('castings')
@@ -0,0 +1,56 @@
+"""list filter indexes
+
+Revision ID: 9654f2d79609
+Revises: 2c7f5a9e3d10
+Create Date: 2026-10-18 04:21:08.199549
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9654f2d79609'
+down_revision = '2c7f5a9e3d10'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    # (name, table, columns, PostgreSQL operator classes)
+    ('ix_movies_title_id', 'movies', ['title', 'id'], None),
+    ('ix_movies_release_date_id', 'movies', ['release_date', 'id'], None),
+    ('ix_movies_title_prefix', 'movies', ['title'],
+     {'title': 'varchar_pattern_ops'}),
+    ('ix_actors_name_id', 'actors', ['name', 'id'], None),
+    ('ix_actors_age_id', 'actors', ['age', 'id'], None),
+    ('ix_actors_gender_age_id', 'actors', ['gender', 'age', 'id'], None),
+    ('ix_actors_name_prefix', 'actors', ['name'],
+     {'name': 'varchar_pattern_ops'}),
+]
+
+
+def _create_index(name, table, columns, ops, postgresql):
+    # IF NOT EXISTS: a database created by the app (create_all) already
+    # has the indexes of the models
+    if postgresql:
+        columns = [column + ' ' + ops[column] if ops and column in ops
+                   else column for column in columns]
+    op.execute('CREATE INDEX %sIF NOT EXISTS %s ON %s (%s)' % (
+        'CONCURRENTLY ' if postgresql else '', name, table,
+        ', '.join(columns)))
+
+
+def upgrade():
+    if op.get_context().dialect.name == 'postgresql':
+        # Build the indexes without locking the tables against writes
+        with op.get_context().autocommit_block():
+            for name, table, columns, ops in INDEXES:
+                _create_index(name, table, columns, ops, True)
+    else:
+        for name, table, columns, ops in INDEXES:
+            _create_index(name, table, columns, ops, False)
+
+
+def downgrade():
+    for name, table, columns, ops in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,96 @@
+"""delta sync
+
+Revision ID: a6d3e8f1b4c7
+Revises: f4b7c2d9e5a1
+Create Date: 2026-10-18 15:21:44.630952
+
+"""
+import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d3e8f1b4c7'
+down_revision = 'f4b7c2d9e5a1'
+branch_labels = None
+depends_on = None
+
+
+change_events = sa.Table(
+    'change_events', sa.MetaData(),
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('table_name', sa.String), sa.Column('action', sa.String),
+    sa.Column('row_ids', sa.Text), sa.Column('created_at', sa.DateTime))
+table_versions = sa.table(
+    'table_versions',
+    sa.column('name', sa.String), sa.column('version', sa.Integer),
+    sa.column('updated_at', sa.DateTime))
+
+
+def stamp_rows(table):
+    # Give the existing rows one change event, so the delta syncs
+    # return them (like a write of the app, see record_change)
+    rows = sa.table(table, sa.column('change_seq', sa.Integer),
+                    sa.column('updated_at', sa.DateTime))
+    connection = op.get_bind()
+    if connection.execute(sa.select([sa.literal(1)]).select_from(rows)
+                          .limit(1)).scalar() is None:
+        return
+    now = datetime.datetime.utcnow()
+    connection.execute(table_versions.update().where(
+        table_versions.c.name.in_([table, 'change_events'])).values(
+        version=table_versions.c.version + 1, updated_at=now))
+    seq = connection.execute(change_events.insert().values(
+        table_name=table, action='create', row_ids=None,
+        created_at=now)).inserted_primary_key[0]
+    connection.execute(rows.update().values(change_seq=seq, updated_at=now))
+
+
+INDEXES = [
+    # (name, table, columns)
+    ('ix_movies_change_seq_id', 'movies', ['change_seq', 'id']),
+    ('ix_actors_change_seq_id', 'actors', ['change_seq', 'id']),
+]
+
+
+def upgrade():
+    # Nullable without a default: the rows written outside the app are
+    # left unstamped (see flask stamp-changes)
+    for table in ('movies', 'actors'):
+        op.add_column(table, sa.Column('change_seq', sa.Integer(),
+                                       nullable=True))
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(),
+                                       nullable=True))
+        stamp_rows(table)
+    op.create_table(
+        'tombstones',
+        sa.Column('table_name', sa.String(), nullable=False),
+        sa.Column('row_id', sa.Integer(), nullable=False),
+        sa.Column('change_seq', sa.Integer(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('table_name', 'row_id')
+    )
+    op.create_index('ix_tombstones_table_name_change_seq_row_id',
+                    'tombstones', ['table_name', 'change_seq', 'row_id'],
+                    unique=False)
+    if op.get_context().dialect.name == 'postgresql':
+        # Build the indexes without locking the tables against writes
+        with op.get_context().autocommit_block():
+            for name, table, columns in INDEXES:
+                op.create_index(name, table, columns,
+                                postgresql_concurrently=True)
+    else:
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns)
+
+
+def downgrade():
+    for name, table, columns in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
+    op.drop_index('ix_tombstones_table_name_change_seq_row_id',
+                  table_name='tombstones')
+    op.drop_table('tombstones')
+    for table in ('actors', 'movies'):
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'change_seq')
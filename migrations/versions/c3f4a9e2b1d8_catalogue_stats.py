@@ -0,0 +1,32 @@
+"""catalogue stats
+
+Revision ID: c3f4a9e2b1d8
+Revises: 5b2e8c1d7a43
+Create Date: 2026-10-18 06:12:40.518327
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f4a9e2b1d8'
+down_revision = '5b2e8c1d7a43'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled from the tables when the app starts (see init_stats), or
+    # by flask rebuild-stats
+    op.create_table(
+        'catalogue_stats',
+        sa.Column('metric', sa.String(), nullable=False),
+        sa.Column('bucket', sa.String(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('metric', 'bucket')
+    )
+
+
+def downgrade():
+    op.drop_table('catalogue_stats')
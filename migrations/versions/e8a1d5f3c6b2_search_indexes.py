@@ -0,0 +1,89 @@
+"""search indexes
+
+Revision ID: e8a1d5f3c6b2
+Revises: c3f4a9e2b1d8
+Create Date: 2026-10-18 07:03:27.880613
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8a1d5f3c6b2'
+down_revision = 'c3f4a9e2b1d8'
+branch_labels = None
+depends_on = None
+
+
+# table -> searched column (see search.py)
+SEARCHED = {
+    'movies': 'title',
+    'actors': 'name',
+}
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, column in SEARCHED.items():
+            # Generated, so every write keeps it up to date (PostgreSQL 12+)
+            op.execute(
+                "ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector "
+                "tsvector GENERATED ALWAYS AS (to_tsvector('simple', "
+                "coalesce({column}, ''))) STORED".format(
+                    table=table, column=column))
+            op.execute(
+                'CREATE INDEX IF NOT EXISTS ix_{table}_search_vector '
+                'ON {table} USING gin (search_vector)'.format(table=table))
+            op.execute(
+                'CREATE INDEX IF NOT EXISTS ix_{table}_{column}_trgm '
+                'ON {table} USING gin ({column} gin_trgm_ops)'.format(
+                    table=table, column=column))
+    else:
+        for table, column in SEARCHED.items():
+            names = dict(table=table, column=column)
+            op.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS {table}_search "
+                "USING fts5({column}, content='{table}', "
+                "content_rowid='id', "
+                "tokenize='unicode61 remove_diacritics 2')".format(**names))
+            op.execute(
+                'CREATE TRIGGER IF NOT EXISTS {table}_search_insert '
+                'AFTER INSERT ON {table} BEGIN '
+                'INSERT INTO {table}_search (rowid, {column}) '
+                'VALUES (new.id, new.{column}); END'.format(**names))
+            op.execute(
+                'CREATE TRIGGER IF NOT EXISTS {table}_search_delete '
+                'AFTER DELETE ON {table} BEGIN '
+                'INSERT INTO {table}_search ({table}_search, rowid, '
+                "{column}) VALUES ('delete', old.id, old.{column}); "
+                'END'.format(**names))
+            op.execute(
+                'CREATE TRIGGER IF NOT EXISTS {table}_search_update '
+                'AFTER UPDATE OF {column} ON {table} BEGIN '
+                'INSERT INTO {table}_search ({table}_search, rowid, '
+                "{column}) VALUES ('delete', old.id, old.{column}); "
+                'INSERT INTO {table}_search (rowid, {column}) '
+                'VALUES (new.id, new.{column}); END'.format(**names))
+            # Index the rows already in the table
+            op.execute(
+                "INSERT INTO {table}_search ({table}_search) "
+                "VALUES ('rebuild')".format(**names))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        for table, column in SEARCHED.items():
+            op.execute('DROP INDEX IF EXISTS ix_{table}_{column}_trgm'.format(
+                table=table, column=column))
+            op.execute('DROP INDEX IF EXISTS ix_{table}_search_vector'.format(
+                table=table))
+            op.execute('ALTER TABLE {table} DROP COLUMN IF EXISTS '
+                       'search_vector'.format(table=table))
+    else:
+        for table in SEARCHED:
+            for trigger in ('insert', 'delete', 'update'):
+                op.execute('DROP TRIGGER IF EXISTS {table}_search_{trigger}'
+                           .format(table=table, trigger=trigger))
+            op.execute('DROP TABLE IF EXISTS {table}_search'.format(
+                table=table))
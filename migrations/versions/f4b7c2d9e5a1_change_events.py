@@ -0,0 +1,36 @@
+"""change events
+
+Revision ID: f4b7c2d9e5a1
+Revises: e8a1d5f3c6b2
+Create Date: 2026-10-18 14:03:27.904116
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4b7c2d9e5a1'
+down_revision = 'e8a1d5f3c6b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The events sent by GET /changes/stream (see record_change)
+    op.create_table(
+        'change_events',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('table_name', sa.String(), nullable=False),
+        sa.Column('action', sa.String(), nullable=False),
+        sa.Column('row_ids', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_change_events_created_at', 'change_events',
+                    ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_change_events_created_at', table_name='change_events')
+    op.drop_table('change_events')
@@ -1,12 +1,74 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
-from flask_sqlalchemy import SQLAlchemy
+import io
+import csv
+import sqlite3
+import logging
+import datetime
+from collections import Counter
+from sqlalchemy import Column, String, Integer, create_engine, text, \
+    and_, select, tuple_, event, func, inspect
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy import orm
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 import json
+from collections import namedtuple
 from flask_migrate import Migrate
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from replicas import replica_router, current_replica_engine
 
 database_path = os.environ.get('DATABASE_URL')
+# Bulk inserts of at least this many rows use COPY on PostgreSQL
+BULK_COPY_THRESHOLD = int(os.environ.get('BULK_COPY_THRESHOLD', 500))
+# Connections kept open (and opened on top of them under load) per
+# worker. A gevent worker keeps many requests in flight at once (see
+# gunicorn.conf.py), so it needs a larger pool than a sync one.
+DATABASE_POOL_SIZE = os.environ.get('DATABASE_POOL_SIZE')
+DATABASE_MAX_OVERFLOW = os.environ.get('DATABASE_MAX_OVERFLOW')
+# Whether gunicorn runs gevent workers (WORKER_CLASS, see gunicorn.conf.py)
+GEVENT_WORKERS = 'gevent' in os.environ.get('WORKER_CLASS', 'sync')
+# The alembic scripts of 'flask db' (wherever the app is started from)
+MIGRATIONS_DIRECTORY = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+logger = logging.getLogger(__name__)
+
+
+'''
+RoutingSession
+Reads of GET requests go to the read replica chosen for the request
+(see replicas.py), everything else goes to the primary database.
+'''
+
+
+class RoutingSession(SignallingSession):
+    def get_bind(self, mapper=None, clause=None):
+        engine = current_replica_engine()
+        if engine is not None and not self._flushing:
+            return engine
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
+migrate = Migrate(directory=MIGRATIONS_DIRECTORY)
+
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, record):
+    # SQLite ignores the foreign keys (and their ON DELETE CASCADE)
+    # unless they are enabled on each connection
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
 
-db = SQLAlchemy()
 
 '''
 setup_db(app)
@@ -14,12 +76,641 @@ setup_db(app)
 '''
 
 
+def engine_options():
+    # Only set the pool options that are configured (SQLite doesn't
+    # accept them)
+    options = {}
+    if DATABASE_POOL_SIZE:
+        options['pool_size'] = int(DATABASE_POOL_SIZE)
+    if DATABASE_MAX_OVERFLOW:
+        options['max_overflow'] = int(DATABASE_MAX_OVERFLOW)
+    return options
+
+
+def schema_state():
+    '''
+    'empty' (a new database), 'current' (at the latest migration) or
+    'outdated' (behind the migrations, or never stamped with one)
+    '''
+    heads = set(ScriptDirectory(MIGRATIONS_DIRECTORY).get_heads())
+    with db.engine.connect() as connection:
+        current = set(
+            MigrationContext.configure(connection).get_current_heads())
+        if not current:
+            if inspect(connection).get_table_names():
+                return 'outdated'
+            return 'empty'
+    return 'current' if current == heads else 'outdated'
+
+
+# Functions called with the connection of a new database after its
+# tables are created, for what create_all() doesn't build (e.g. the
+# search indexes, see search.py)
+schema_listeners = []
+
+
+def create_schema():
+    # Create the latest schema in a new database, and record that it is
+    # at the latest migration (like 'flask db stamp head')
+    db.create_all()
+    with db.engine.begin() as connection:
+        for listener in schema_listeners:
+            listener(connection)
+        MigrationContext.configure(connection).stamp(
+            ScriptDirectory(MIGRATIONS_DIRECTORY), 'head')
+
+
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options()
     db.app = app
     db.init_app(app)
-    db.create_all()
+    # Enable the 'flask db' migration commands
+    migrate.init_app(app, db)
+    # Send the reads of GET requests to the read replicas (if any)
+    replica_router.init_app(app)
+    state = schema_state()
+    if state == 'empty':
+        create_schema()
+    elif state == 'outdated':
+        # The tables and the migrations don't agree: leave the database
+        # to 'flask db upgrade' (which also imports the app)
+        logger.warning('The database schema is not up to date, '
+                       'run flask db upgrade')
+        return
+    init_versions()
+    init_stats()
+
+
+'''
+Table versions
+A version stamp per table, bumped in the same transaction as every
+write to the table. It lives in the database, so all the workers see
+the same version and the list endpoints can answer conditional GETs
+(ETag / Last-Modified) with a single primary key lookup.
+'''
+
+
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+
+    name = Column(db.String, primary_key=True)
+    version = Column(db.Integer, nullable=False, default=0)
+    updated_at = Column(db.DateTime, nullable=False,
+                        default=datetime.datetime.utcnow)
+
+
+VERSIONED_TABLES = ('movies', 'actors', 'castings', 'change_events')
+
+
+def init_versions():
+    # Create the missing version rows (another worker may do the same)
+    existing = {version.name for version in TableVersion.query.all()}
+    for name in VERSIONED_TABLES:
+        if name not in existing:
+            db.session.add(TableVersion(name=name, version=0))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+
+
+def bump_version(name):
+    # Must be called before the commit of the write it stamps
+    db.session.execute(
+        TableVersion.__table__.update()
+        .where(TableVersion.name == name)
+        .values(version=TableVersion.version + 1,
+                updated_at=datetime.datetime.utcnow()))
+
+
+# Functions called with a table's name after a write to it is committed
+change_listeners = []
+
+
+def notify_change(name):
+    for listener in change_listeners:
+        listener(name)
+
+
+'''
+Change events
+Every write to movies or actors also records what changed (the action
+and the ids of the rows) in change_events, in the same transaction.
+GET /changes/stream sends them to the clients (see changes.py): on
+PostgreSQL, NOTIFY wakes up the workers once the write is committed.
+
+The event is allocated before the write (begin_change), so the rows are
+written with its id (their change_seq) and time, and the write leaves a
+tombstone for each deleted row: GET /movies?since= and GET /actors?since=
+can return only what changed (see sync.py).
+
+The ids of the events are in the order of their commits, so a client
+can resume after the id of the last event it received: record_change
+locks the version row of change_events until the commit, and moves the
+event (and restamps its rows) after any event that was allocated later
+but committed first. The lock is global: the writes of the whole app
+(movies and actors alike) commit one at a time. It is only held for
+the order check and the commit, so it costs a round trip and a commit
+per write, not the write itself. A sequence alone would not do: its
+values are taken in the order the writes begin, not the order they
+commit, and a client could skip a write that commits late.
+'''
+
+# The channel of the NOTIFY sent for each change
+CHANGES_CHANNEL = 'agency_changes'
+
+
+class ChangeEvent(db.Model):
+    __tablename__ = 'change_events'
+    # The events to delete once they are too old
+    __table_args__ = (
+        db.Index('ix_change_events_created_at', 'created_at'),
+    )
+
+    id = Column(db.Integer, primary_key=True)
+    table_name = Column(db.String, nullable=False)
+    # 'create', 'update' or 'delete'
+    action = Column(db.String, nullable=False)
+    # JSON list of the ids of the rows (null if they are not known, e.g.
+    # the rows of flask import on SQLite)
+    row_ids = Column(db.Text)
+    created_at = Column(db.DateTime, nullable=False,
+                        default=datetime.datetime.utcnow)
+
+
+class Tombstone(db.Model):
+    __tablename__ = 'tombstones'
+    # The deletions of a table after a client's watermark
+    __table_args__ = (
+        db.Index('ix_tombstones_table_name_change_seq_row_id',
+                 'table_name', 'change_seq', 'row_id'),
+    )
+
+    table_name = Column(db.String, primary_key=True)
+    row_id = Column(db.Integer, primary_key=True)
+    # The id of the change event of the deletion
+    change_seq = Column(db.Integer, nullable=False)
+    deleted_at = Column(db.DateTime, nullable=False,
+                        default=datetime.datetime.utcnow)
+
+
+# The event of a write in progress: the written rows get its seq (the
+# id of the event) and time
+Change = namedtuple('Change', 'table action seq at')
+
+
+def begin_change(name, action):
+    # Allocate the event of a write to the table, before the write
+    now = datetime.datetime.utcnow()
+    result = db.session.execute(ChangeEvent.__table__.insert().values(
+        table_name=name, action=action, created_at=now))
+    return Change(name, action, result.inserted_primary_key[0], now)
+
+
+def stamp(change):
+    # The values of the rows written by the change
+    return {'change_seq': change.seq, 'updated_at': change.at}
+
+
+def _move_change(change, row_ids):
+    # Give the event an id after every allocated one, and restamp the
+    # rows (or the tombstones) written with the old one
+    events = ChangeEvent.__table__
+    db.session.execute(events.delete().where(events.c.id == change.seq))
+    seq = db.session.execute(events.insert().values(
+        table_name=change.table, action=change.action, row_ids=row_ids,
+        created_at=change.at)).inserted_primary_key[0]
+    model = SYNCED_MODELS.get(change.table)
+    if model is not None:
+        table = Tombstone.__table__ if change.action == 'delete' \
+            else model.__table__
+        db.session.execute(table.update().where(
+            table.c.change_seq == change.seq).values(change_seq=seq))
+    return seq
+
+
+def _leave_tombstones(name, ids, seq, now):
+    tombstones = Tombstone.__table__
+    for chunk in _chunks(ids):
+        # A row deleted again (e.g. imported back with its id)
+        db.session.execute(tombstones.delete().where(and_(
+            tombstones.c.table_name == name,
+            tombstones.c.row_id.in_(chunk))))
+    db.session.execute(tombstones.insert(), [
+        {'table_name': name, 'row_id': id, 'change_seq': seq,
+         'deleted_at': now} for id in ids])
+
+
+def record_change(change, ids):
+    '''
+    Complete the event of the write with the ids of its rows (None if
+    they are not known), and leave the tombstones of the deleted ones.
+    Must be called right before the commit of the write. Return the
+    final id of the event
+    '''
+    events = ChangeEvent.__table__
+    row_ids = None if ids is None else json.dumps(ids)
+    db.session.execute(events.update().where(
+        events.c.id == change.seq).values(row_ids=row_ids))
+    if change.action == 'delete' and change.table in SYNCED_MODELS:
+        _leave_tombstones(change.table, ids, change.seq, change.at)
+    if db.engine.dialect.name == 'postgresql':
+        # Delivered to the listening workers at the commit
+        db.session.execute(text('SELECT pg_notify(:channel, :name)'),
+                           {'channel': CHANGES_CHANNEL,
+                            'name': change.table})
+
+    # Held until the commit: no other write commits in between. Only
+    # the order check (and the move, if another write got ahead) runs
+    # under it
+    bump_version(ChangeEvent.__tablename__)
+    seq = change.seq
+    last = db.session.execute(select([func.max(events.c.id)]).where(
+        events.c.id != seq)).scalar()
+    if last is not None and last > seq:
+        # A write that began later committed first
+        seq = _move_change(change, row_ids)
+    return seq
+
+
+def last_change_seq():
+    # The id of the last committed change event
+    return db.session.query(func.max(ChangeEvent.id)).scalar() or 0
+
+
+def first_change_seq():
+    # The id of the oldest change event kept (see changes.prune_changes)
+    return db.session.query(func.min(ChangeEvent.id)).scalar()
+
+
+def stamp_changes():
+    '''
+    Give a change event to the rows written without one (e.g. by hand),
+    so the delta syncs return them. Return the names of the tables that
+    had some (the rows that existed before the change sequence are
+    stamped by its migration)
+    '''
+    stamped = []
+    for name, model in SYNCED_MODELS.items():
+        if db.session.query(model.id).filter(
+                model.change_seq.is_(None)).first() is None:
+            continue
+        change = begin_change(name, 'create')
+        table = model.__table__
+        db.session.execute(table.update().where(
+            table.c.change_seq.is_(None)).values(**stamp(change)))
+        bump_version(name)
+        record_change(change, None)
+        db.session.commit()
+        notify_change(name)
+        stamped.append(name)
+    return stamped
+
+
+def get_version(name):
+    # Return the (version, last update time) of a table
+    version = db.session.query(
+        TableVersion.version, TableVersion.updated_at).filter(
+        TableVersion.name == name).first()
+    if version is None:
+        return 0, None
+    return version.version, version.updated_at
+
+
+'''
+Catalogue statistics
+Counts of the actors per gender and per age range, and of the movies per
+release year. Every write updates them in its own transaction, so
+GET /stats reads a few rows instead of scanning the tables.
+'''
+
+
+class CatalogueStat(db.Model):
+    __tablename__ = 'catalogue_stats'
+
+    metric = Column(db.String, primary_key=True)
+    bucket = Column(db.String, primary_key=True)
+    count = Column(db.Integer, nullable=False, default=0)
+
+
+def _age_range(age):
+    low = int(age) // 10 * 10
+    return '%d-%d' % (low, low + 9)
+
+
+def _release_year(release_date):
+    # A date, or the 'YYYY-MM-DD' string of POST /movies
+    return str(release_date)[:4]
+
+
+# table -> {metric: (column, function returning the column's bucket)}
+STATS = {
+    'actors': {
+        'actors_by_gender': ('gender', str),
+        'actors_by_age': ('age', _age_range),
+    },
+    'movies': {
+        'movies_by_release_year': ('release_date', _release_year),
+    },
+}
+
+
+def stat_columns(table):
+    # The columns the statistics of the table depend on
+    return sorted({column for column, _ in STATS.get(table, {}).values()})
+
+
+def count_rows(table, rows, sign, deltas=None):
+    '''
+    Add sign (1 for new rows, -1 for removed ones) to the bucket of each
+    row ({column: value}) in deltas ({(metric, bucket): change})
+    '''
+    if deltas is None:
+        deltas = Counter()
+    for row in rows:
+        for metric, (column, bucket) in STATS.get(table, {}).items():
+            if row.get(column) is not None:
+                deltas[metric, bucket(row[column])] += sign
+    return deltas
+
+
+def _row_values(instance, old=False):
+    # The columns of the statistics of a model instance (their values
+    # before the pending changes if old is True)
+    state = inspect(instance)
+    columns = stat_columns(instance.__tablename__)
+    values = {}
+    for column in columns:
+        history = state.attrs[column].history
+        if old and history.added and not history.deleted:
+            # Changed before its old value was loaded (e.g. after a
+            # commit expired it): read the row as it is in the database
+            model = type(instance)
+            with db.session.no_autoflush:
+                row = db.session.query(
+                    *[getattr(model, name) for name in columns]).filter(
+                    model.id == instance.id).one()
+            return dict(zip(columns, row))
+        if old and history.deleted:
+            values[column] = history.deleted[0]
+        else:
+            values[column] = getattr(instance, column)
+    return values
+
+
+def apply_stats(deltas):
+    # Must be called before the commit of the write it counts. The rows
+    # are updated in a fixed order so concurrent writes can't deadlock.
+    table = CatalogueStat.__table__
+    for (metric, bucket), delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        if db.engine.dialect.name == 'postgresql':
+            db.session.execute(
+                postgresql.insert(table)
+                .values(metric=metric, bucket=bucket, count=delta)
+                .on_conflict_do_update(
+                    index_elements=['metric', 'bucket'],
+                    set_={'count': table.c.count + delta}))
+        else:
+            result = db.session.execute(
+                table.update()
+                .where(and_(table.c.metric == metric,
+                            table.c.bucket == bucket))
+                .values(count=table.c.count + delta))
+            if result.rowcount == 0:
+                db.session.execute(table.insert().values(
+                    metric=metric, bucket=bucket, count=delta))
+
+
+def rebuild_stats():
+    '''
+    Recompute the statistics from the tables (flask rebuild-stats).
+    Writes wait for the rebuild on PostgreSQL, so none is lost.
+    '''
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text(
+            'LOCK TABLE catalogue_stats IN SHARE ROW EXCLUSIVE MODE'))
+    db.session.execute(CatalogueStat.__table__.delete())
+    deltas = Counter()
+    for model in (Movie, Actor):
+        table = model.__tablename__
+        for metric, (column, bucket) in STATS[table].items():
+            # Group in SQL, then put the values in their buckets
+            for value, count in db.session.query(
+                    getattr(model, column), func.count()).group_by(
+                    getattr(model, column)):
+                if value is not None:
+                    deltas[metric, bucket(value)] += count
+    apply_stats(deltas)
+    db.session.commit()
+    return deltas
+
+
+def init_stats():
+    # Compute the statistics of a database that has rows but no
+    # statistics yet (e.g. created before they existed)
+    if CatalogueStat.query.first() is not None:
+        return
+    if Movie.query.first() is None and Actor.query.first() is None:
+        return
+    rebuild_stats()
+
+
+def get_stats():
+    '''
+    {table: {'total': rows, 'by_<column>': {bucket: rows}}} (the empty
+    buckets are left out). Every row has a bucket in each metric (the
+    columns are required), so a metric's counts add up to the total.
+    '''
+    counts = {}
+    for stat in CatalogueStat.query.filter(CatalogueStat.count > 0):
+        counts.setdefault(stat.metric, {})[stat.bucket] = stat.count
+    stats = {}
+    for table, metrics in STATS.items():
+        stats[table] = {'total': 0}
+        for metric in metrics:
+            buckets = counts.get(metric, {})
+            stats[table]['total'] = sum(buckets.values())
+            stats[table][metric[len(table) + 1:]] = dict(sorted(
+                buckets.items()))
+    return stats
+
+
+'''
+bulk_insert(model, rows, return_ids=True)
+    inserts many rows (dicts of column values) in a single transaction
+    and returns their ids, in the same order. The rows that already have
+    an id keep it. With return_ids=False (flask import), the ids are not
+    read back, so every backend inserts the rows with one executemany.
+'''
+
+
+def bulk_insert(model, rows, return_ids=True):
+    if not rows:
+        return []
+    # The rows are written with their change event
+    change = begin_change(model.__tablename__, 'create')
+    values = stamp(change)
+    for row in rows:
+        row.update(values)
+    if db.engine.dialect.name == 'postgresql':
+        table = model.__tablename__
+        # Reserve the ids up front, so they are known even with COPY
+        missing = [row for row in rows if row.get('id') is None]
+        if missing:
+            result = db.session.execute(
+                text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) "
+                     "FROM generate_series(1, :count)"),
+                {'table': table, 'count': len(missing)})
+            for row, (id,) in zip(missing, result):
+                row['id'] = id
+        if len(rows) >= BULK_COPY_THRESHOLD:
+            _copy_rows(model, rows)
+        else:
+            # One executemany for the whole batch
+            db.session.execute(model.__table__.insert(), rows)
+    elif return_ids:
+        db.session.bulk_insert_mappings(model, rows, return_defaults=True)
+    else:
+        db.session.execute(model.__table__.insert(), rows)
+    apply_stats(count_rows(model.__tablename__, rows, 1))
+    bump_version(model.__tablename__)
+    ids = [row.get('id') for row in rows]
+    record_change(change, None if None in ids else ids)
+    db.session.commit()
+    notify_change(model.__tablename__)
+    if not return_ids:
+        return []
+    return [row['id'] for row in rows]
+
+
+def _copy_rows(model, rows):
+    # COPY FROM STDIN on the session's own connection (same transaction)
+    columns = [column.name for column in model.__table__.columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row.get(column) for column in columns])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            'COPY %s (%s) FROM STDIN WITH (FORMAT csv)' % (
+                model.__tablename__, ', '.join(columns)),
+            buffer)
+    finally:
+        cursor.close()
+
+
+'''
+bulk_update(model, values, ids, filters) / bulk_delete(model, ids, filters)
+    run set-based UPDATEs / DELETEs (one per IN_CHUNK_SIZE ids) in one
+    transaction on the rows selected by their ids and/or by a filter
+    ({column: value}). Return the number of affected rows and the ids
+    that were not found
+'''
+
+
+def _where(model, ids, filters):
+    conditions = []
+    if ids is not None:
+        conditions.append(model.id.in_(ids))
+    for column, value in (filters or {}).items():
+        conditions.append(getattr(model, column) == value)
+    return and_(*conditions)
+
+
+def _bulk_wheres(model, ids, filters):
+    # One WHERE per chunk of the ids (or a single one for a filter)
+    if ids is None:
+        return [_where(model, None, filters)]
+    return [_where(model, chunk, filters)
+            for chunk in _chunks(sorted(set(ids)))]
+
+
+def _run_bulk(model, ids, filters, values=None):
+    '''
+    Run the UPDATE (values is its {column: value}) or the DELETE (values
+    is None) and update the statistics of the rows it touched
+    '''
+    table = model.__table__
+    columns = stat_columns(model.__tablename__)
+    if values is not None:
+        # Only the statistics of the updated columns change
+        columns = [column for column in columns if column in values]
+    selected = [table.c.id] + [table.c[column] for column in columns]
+    change = begin_change(model.__tablename__,
+                          'delete' if values is None else 'update')
+    rows = []
+    for where in _bulk_wheres(model, ids, filters):
+        if values is None:
+            statement = table.delete().where(where)
+        else:
+            # The rows are written with their change event
+            statement = table.update().where(where).values(
+                dict(values, **stamp(change)))
+        if db.engine.dialect.name == 'postgresql' and \
+                (values is None or not columns):
+            # One statement that also reports the rows it touched (and
+            # the deleted values)
+            rows += db.session.execute(
+                statement.returning(*selected)).fetchall()
+        else:
+            # Lock the rows and read their values before they change
+            rows += db.session.execute(
+                select(selected).where(where).with_for_update()).fetchall()
+            db.session.execute(statement)
+    found = [row[0] for row in rows]
+    if found:
+        old = [dict(zip(columns, row[1:])) for row in rows]
+        deltas = count_rows(model.__tablename__, old, -1)
+        if values is not None:
+            new = [dict(row, **values) for row in old]
+            count_rows(model.__tablename__, new, 1, deltas)
+        apply_stats(deltas)
+        bump_version(model.__tablename__)
+        record_change(change, found)
+        db.session.commit()
+        notify_change(model.__tablename__)
+    else:
+        # Nothing changed: drop the event
+        db.session.rollback()
+    not_found = []
+    if ids is not None:
+        found_ids = set(found)
+        not_found = [id for id in ids if id not in found_ids]
+    return len(found), not_found
+
+
+def bulk_update(model, values, ids=None, filters=None):
+    return _run_bulk(model, ids, filters, values)
+
+
+def bulk_delete(model, ids=None, filters=None):
+    return _run_bulk(model, ids, filters)
+
+
+def missing_ids(model, ids):
+    # Return the ids (of the list) that have no row in the model's table
+    ids = set(ids)
+    found = set()
+    for chunk in _chunks(sorted(ids)):
+        found.update(row[0] for row in db.session.query(model.id).filter(
+            model.id.in_(chunk)))
+    return ids - found
+
+
+# Largest number of ids (or pairs) in one IN list (older SQLite versions
+# accept at most 999 parameters per statement)
+IN_CHUNK_SIZE = 400
+
+
+def _chunks(values, size=IN_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
 
 
 '''
@@ -29,25 +720,83 @@ Movies
 
 class Movie(db.Model):
     __tablename__ = 'movies'
+    # Indexes backing the filters and the sorts of GET /movies
+    __table_args__ = (
+        db.Index('ix_movies_title_id', 'title', 'id'),
+        db.Index('ix_movies_release_date_id', 'release_date', 'id'),
+        # Title prefix search (LIKE 'x%') whatever the collation
+        db.Index('ix_movies_title_prefix', 'title',
+                 postgresql_ops={'title': 'varchar_pattern_ops'}),
+        # The rows changed after a watermark (GET /movies?since=)
+        db.Index('ix_movies_change_seq_id', 'change_seq', 'id'),
+    )
 
     id = Column(db.Integer, primary_key=True)
     title = Column(db.String, nullable=False)
     release_date = Column(db.Date, nullable=False)
+    # The id of the change event that last wrote the row, and its time
+    # (see begin_change)
+    change_seq = Column(db.Integer)
+    updated_at = Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    # The fields a client can select with ?fields=
+    public_fields = ('id', 'title', 'release_date')
+
+    # The actors of the movie (the database deletes them with the movie)
+    cast = db.relationship('Casting', back_populates='movie',
+                           cascade='all, delete-orphan', passive_deletes=True)
 
     def __init__(self, title, release_date):
         self.title = title
         self.release_date = release_date
 
     def insert(self):
+        change = begin_change(self.__tablename__, 'create')
+        self.change_seq, self.updated_at = change.seq, change.at
         db.session.add(self)
+        apply_stats(count_rows(self.__tablename__, [_row_values(self)], 1))
+        bump_version(self.__tablename__)
+        # Flush to get the new row's id
+        db.session.flush()
+        record_change(change, [self.id])
         db.session.commit()
+        notify_change(self.__tablename__)
+
+    @classmethod
+    def bulk_insert(cls, rows, return_ids=True):
+        return bulk_insert(cls, rows, return_ids)
+
+    @classmethod
+    def bulk_update(cls, values, ids=None, filters=None):
+        return bulk_update(cls, values, ids, filters)
+
+    @classmethod
+    def bulk_delete(cls, ids=None, filters=None):
+        return bulk_delete(cls, ids, filters)
 
     def update(self):
+        # Move the row to the buckets of its new values
+        deltas = count_rows(self.__tablename__,
+                            [_row_values(self, old=True)], -1)
+        count_rows(self.__tablename__, [_row_values(self)], 1, deltas)
+        apply_stats(deltas)
+        change = begin_change(self.__tablename__, 'update')
+        self.change_seq, self.updated_at = change.seq, change.at
+        # Write the row before the event is ordered (see record_change)
+        db.session.flush()
+        bump_version(self.__tablename__)
+        record_change(change, [self.id])
         db.session.commit()
+        notify_change(self.__tablename__)
 
     def delete(self):
+        change = begin_change(self.__tablename__, 'delete')
         db.session.delete(self)
+        apply_stats(count_rows(self.__tablename__, [_row_values(self)], -1))
+        bump_version(self.__tablename__)
+        record_change(change, [self.id])
         db.session.commit()
+        notify_change(self.__tablename__)
 
     def format(self):
         return {
@@ -64,11 +813,34 @@ Actors
 
 class Actor(db.Model):
     __tablename__ = 'actors'
+    # Indexes backing the filters and the sorts of GET /actors
+    __table_args__ = (
+        db.Index('ix_actors_name_id', 'name', 'id'),
+        db.Index('ix_actors_age_id', 'age', 'id'),
+        db.Index('ix_actors_gender_age_id', 'gender', 'age', 'id'),
+        # Name prefix search (LIKE 'x%') whatever the collation
+        db.Index('ix_actors_name_prefix', 'name',
+                 postgresql_ops={'name': 'varchar_pattern_ops'}),
+        # The rows changed after a watermark (GET /actors?since=)
+        db.Index('ix_actors_change_seq_id', 'change_seq', 'id'),
+    )
 
     id = Column(db.Integer, primary_key=True)
     name = Column(db.String, nullable=False)
     age = Column(db.Integer, nullable=False)
     gender = Column(db.String, nullable=False)
+    # The id of the change event that last wrote the row, and its time
+    # (see begin_change)
+    change_seq = Column(db.Integer)
+    updated_at = Column(db.DateTime, default=datetime.datetime.utcnow)
+
+    # The fields a client can select with ?fields=
+    public_fields = ('id', 'name', 'age', 'gender')
+
+    # The movies of the actor (the database deletes them with the actor)
+    castings = db.relationship('Casting', back_populates='actor',
+                               cascade='all, delete-orphan',
+                               passive_deletes=True)
 
     def __init__(self, name, age, gender):
         self.name = name
@@ -76,15 +848,52 @@ class Actor(db.Model):
         self.gender = gender
 
     def insert(self):
+        change = begin_change(self.__tablename__, 'create')
+        self.change_seq, self.updated_at = change.seq, change.at
         db.session.add(self)
+        apply_stats(count_rows(self.__tablename__, [_row_values(self)], 1))
+        bump_version(self.__tablename__)
+        # Flush to get the new row's id
+        db.session.flush()
+        record_change(change, [self.id])
         db.session.commit()
+        notify_change(self.__tablename__)
+
+    @classmethod
+    def bulk_insert(cls, rows, return_ids=True):
+        return bulk_insert(cls, rows, return_ids)
+
+    @classmethod
+    def bulk_update(cls, values, ids=None, filters=None):
+        return bulk_update(cls, values, ids, filters)
+
+    @classmethod
+    def bulk_delete(cls, ids=None, filters=None):
+        return bulk_delete(cls, ids, filters)
 
     def update(self):
+        # Move the row to the buckets of its new values
+        deltas = count_rows(self.__tablename__,
+                            [_row_values(self, old=True)], -1)
+        count_rows(self.__tablename__, [_row_values(self)], 1, deltas)
+        apply_stats(deltas)
+        change = begin_change(self.__tablename__, 'update')
+        self.change_seq, self.updated_at = change.seq, change.at
+        # Write the row before the event is ordered (see record_change)
+        db.session.flush()
+        bump_version(self.__tablename__)
+        record_change(change, [self.id])
         db.session.commit()
+        notify_change(self.__tablename__)
 
     def delete(self):
+        change = begin_change(self.__tablename__, 'delete')
         db.session.delete(self)
+        apply_stats(count_rows(self.__tablename__, [_row_values(self)], -1))
+        bump_version(self.__tablename__)
+        record_change(change, [self.id])
         db.session.commit()
+        notify_change(self.__tablename__)
 
     def format(self):
         return {
@@ -93,3 +902,83 @@ class Actor(db.Model):
             'age': self.age,
             'gender': self.gender
         }
+
+
+# The tables of the delta syncs (GET /movies?since=, GET /actors?since=)
+SYNCED_MODELS = {
+    'movies': Movie,
+    'actors': Actor,
+}
+
+
+'''
+Castings
+Which actors play in which movies (many-to-many), with their role
+'''
+
+
+class Casting(db.Model):
+    __tablename__ = 'castings'
+    # The primary key (movie_id, actor_id) indexes the movie_id foreign
+    # key, this index the actor_id one
+    __table_args__ = (
+        db.Index('ix_castings_actor_id_movie_id', 'actor_id', 'movie_id'),
+    )
+
+    movie_id = Column(db.Integer,
+                      db.ForeignKey('movies.id', ondelete='CASCADE'),
+                      primary_key=True)
+    actor_id = Column(db.Integer,
+                      db.ForeignKey('actors.id', ondelete='CASCADE'),
+                      primary_key=True)
+    role = Column(db.String)
+
+    movie = db.relationship('Movie', back_populates='cast')
+    actor = db.relationship('Actor', back_populates='castings')
+
+    @classmethod
+    def assign(cls, rows):
+        '''
+        Cast the actors of the rows ({movie_id, actor_id, role}) in a
+        single transaction. A pair that is already cast gets the new role
+        '''
+        table = cls.__table__
+        # The last row of a pair wins
+        rows = list({(row['movie_id'], row['actor_id']): row
+                     for row in rows}.values())
+        pairs = [(row['movie_id'], row['actor_id']) for row in rows]
+        for chunk in _chunks(pairs):
+            db.session.execute(table.delete().where(
+                tuple_(table.c.movie_id, table.c.actor_id).in_(chunk)))
+        # One executemany for all the rows
+        db.session.execute(table.insert(), rows)
+        bump_version(cls.__tablename__)
+        db.session.commit()
+        notify_change(cls.__tablename__)
+        return len(rows)
+
+    @classmethod
+    def unassign(cls, pairs):
+        '''
+        Remove the (movie_id, actor_id) pairs. Return the number of
+        castings removed and the pairs that were not found
+        '''
+        table = cls.__table__
+        found = set()
+        for chunk in _chunks(pairs):
+            where = tuple_(table.c.movie_id, table.c.actor_id).in_(chunk)
+            statement = table.delete().where(where)
+            if db.engine.dialect.name == 'postgresql':
+                found.update(tuple(row) for row in db.session.execute(
+                    statement.returning(table.c.movie_id, table.c.actor_id)))
+            else:
+                found.update(tuple(row) for row in db.session.execute(
+                    select([table.c.movie_id, table.c.actor_id]).where(where)))
+                db.session.execute(statement)
+        if found:
+            bump_version(cls.__tablename__)
+        db.session.commit()
+        if found:
+            notify_change(cls.__tablename__)
+        return len(found), [list(pair) for pair in pairs
+                            if tuple(pair) not in found]
@@ -0,0 +1,109 @@
+import os
+import json
+import base64
+import datetime
+from flask import abort
+from sqlalchemy import Date, tuple_
+
+
+# Number of rows returned when the client doesn't send a limit
+DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', 50))
+# Largest limit a client is allowed to ask for
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 500))
+# Small deployments can keep returning whole tables when the client
+# doesn't ask for a page (set UNPAGINATED_LISTS=true)
+UNPAGINATED_LISTS = os.environ.get(
+    'UNPAGINATED_LISTS', 'false').lower() in ('true', '1', 'yes')
+
+
+'''
+Cursors
+An opaque, URL-safe encoding of the (sort key, id) of the last row of a
+page. The next page starts right after that row (keyset pagination), so
+no OFFSET is ever used.
+'''
+
+
+def encode_cursor(values):
+    data = json.dumps(values, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except Exception:
+        # If the cursor can't be read, send an error (bad request - 400)
+        abort(400)
+    if not isinstance(values, list) or len(values) != 2:
+        abort(400)
+    return values
+
+
+def wants_pagination(args):
+    # Paginate unless the deployment opted out and the client didn't
+    # ask for a page
+    return not UNPAGINATED_LISTS or 'limit' in args or 'cursor' in args
+
+
+def get_page_size(args):
+    limit = args.get('limit', DEFAULT_PAGE_SIZE)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        abort(400)
+    if limit < 1:
+        abort(400)
+    # The server never returns more than MAX_PAGE_SIZE rows at once
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def _coerce(column, value):
+    # Cursor values are JSON, turn them back into the column's type
+    if value is not None and isinstance(column.type, Date):
+        try:
+            return datetime.date.fromisoformat(value)
+        except (TypeError, ValueError):
+            abort(400)
+    return value
+
+
+def ordered(query, sort_column, id_column, descending=False):
+    # Order by the sort key, then by id so the order is always the same
+    columns = [sort_column] if sort_column is id_column \
+        else [sort_column, id_column]
+    if descending:
+        columns = [column.desc() for column in columns]
+    return query.order_by(*columns)
+
+
+def paginate(query, sort_column, id_column, limit, cursor=None,
+             descending=False):
+    '''
+    Return one page of the query's rows ordered by (sort_column, id_column)
+    and the cursor of the next page (None on the last page)
+    '''
+    if cursor:
+        sort_value, last_id = decode_cursor(cursor)
+        sort_value = _coerce(sort_column, sort_value)
+        # Seek right after the last row of the previous page
+        if sort_column is id_column:
+            last = id_column
+            after = last_id
+        else:
+            last = tuple_(sort_column, id_column)
+            after = tuple_(sort_value, last_id)
+        query = query.filter(last < after if descending else last > after)
+
+    query = ordered(query, sort_column, id_column, descending)
+
+    # Fetch one extra row to know if there is a next page
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([
+            getattr(last, sort_column.key), getattr(last, id_column.key)])
+    return rows, next_cursor
@@ -0,0 +1,173 @@
+import os
+import time
+import logging
+import weakref
+from collections import Counter
+from flask import request, g, has_request_context
+from sqlalchemy import event
+import auth
+import serializers
+from models import db
+from replicas import replica_router
+
+
+# Profile every request (set PROFILING_ENABLED=true, or the PROFILING
+# setting of the app's config)
+PROFILING_ENABLED = os.environ.get(
+    'PROFILING_ENABLED', 'false').lower() in ('true', '1', 'yes')
+# If set, a request sending 'X-Profile: <PROFILING_TOKEN>' is profiled
+# even when profiling is disabled
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+PROFILING_HEADER = 'X-Profile'
+# Number of the slowest statements of a profiled request that are logged
+PROFILING_SLOW_QUERIES = int(os.environ.get('PROFILING_SLOW_QUERIES', 5))
+# A statement run this many times in one request is reported as N+1
+PROFILING_N_PLUS_ONE = int(os.environ.get('PROFILING_N_PLUS_ONE', 5))
+# Longest parameters (in characters) written to the log
+PROFILING_MAX_PARAMS = 500
+
+logger = logging.getLogger(__name__)
+
+
+'''
+Profiler
+Times the phases of a request (auth, db, serialize, total), sends them in
+the Server-Timing header with the number of SQL statements, logs the
+slowest statements with their parameters and warns about the statements
+repeated within one request (N+1 queries).
+'''
+
+
+def _profiling():
+    return has_request_context() and g.get('profile', False)
+
+
+def _observe_auth_phase(phase, seconds):
+    if _profiling():
+        g.profile_auth += seconds
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if _profiling():
+        conn.info.setdefault('profile_start', []).append(
+            time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    if _profiling() and conn.info.get('profile_start'):
+        elapsed = time.perf_counter() - conn.info['profile_start'].pop()
+        g.profile_queries.append((elapsed, statement, parameters))
+
+
+def _handle_error(context):
+    # A statement that raised never reaches after_cursor_execute: drop
+    # its start time
+    if context.connection is None or context.execution_context is None:
+        return
+    if _profiling() and context.connection.info.get('profile_start'):
+        context.connection.info['profile_start'].pop()
+
+
+# The engines that already have the listeners
+_instrumented = weakref.WeakSet()
+
+
+def instrument_engine(engine):
+    if engine in _instrumented:
+        return
+    _instrumented.add(engine)
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_error)
+
+
+def wants_profile(app):
+    # Profile if the app is configured to, or if the client sent the
+    # privileged header
+    if app.config.get('PROFILING', PROFILING_ENABLED):
+        return True
+    return bool(PROFILING_TOKEN) and \
+        request.headers.get(PROFILING_HEADER) == PROFILING_TOKEN
+
+
+def _observe_serialize(seconds):
+    if _profiling():
+        g.profile_serialize += seconds
+
+
+def _format_params(parameters):
+    text = repr(parameters)
+    if len(text) > PROFILING_MAX_PARAMS:
+        text = text[:PROFILING_MAX_PARAMS] + '...'
+    return text
+
+
+def report(queries, route):
+    # Log the slowest statements and the repeated ones (N+1)
+    for elapsed, statement, parameters in sorted(
+            queries, key=lambda query: query[0],
+            reverse=True)[:PROFILING_SLOW_QUERIES]:
+        logger.warning('%s: %.2f ms %s %s', route, elapsed * 1000,
+                       ' '.join(statement.split()), _format_params(parameters))
+
+    repeated = Counter(statement for _, statement, _ in queries)
+    for statement, count in repeated.items():
+        if count >= PROFILING_N_PLUS_ONE:
+            logger.warning('%s: possible N+1 query, run %d times: %s',
+                           route, count, ' '.join(statement.split()))
+    return [statement for statement, count in repeated.items()
+            if count >= PROFILING_N_PLUS_ONE]
+
+
+def _milliseconds(seconds):
+    return '%.2f' % (seconds * 1000)
+
+
+def init_app(app):
+    if 'profiler' in app.extensions:
+        return
+    app.extensions['profiler'] = True
+
+    @app.before_request
+    def start_profile():
+        g.profile = wants_profile(app)
+        if g.profile:
+            # setup_db() may have replaced the engine since init_app()
+            instrument_engine(db.engine)
+            g.profile_start = time.perf_counter()
+            g.profile_auth = 0.0
+            g.profile_serialize = 0.0
+            g.profile_queries = []
+
+    @app.after_request
+    def finish_profile(response):
+        if not g.get('profile'):
+            return response
+        total = time.perf_counter() - g.profile_start
+        queries = g.profile_queries
+        route = '%s %s' % (request.method, request.url_rule.rule
+                           if request.url_rule else request.path)
+        repeated = report(queries, route)
+        response.headers['Server-Timing'] = ', '.join([
+            'auth;dur=' + _milliseconds(g.profile_auth),
+            'db;dur=%s;desc="%d queries"' % (
+                _milliseconds(sum(query[0] for query in queries)),
+                len(queries)),
+            'serialize;dur=' + _milliseconds(g.profile_serialize),
+            'total;dur=' + _milliseconds(total),
+        ])
+        response.headers['X-Query-Count'] = str(len(queries))
+        if repeated:
+            response.headers['X-N-Plus-One'] = str(len(repeated))
+        return response
+
+    with app.app_context():
+        instrument_engine(db.engine)
+    for replica in replica_router.replicas:
+        instrument_engine(replica.engine)
+
+
+auth.phase_listeners.append(_observe_auth_phase)
+serializers.serialize_listeners.append(_observe_serialize)
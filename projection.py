@@ -0,0 +1,45 @@
+from flask import abort
+from models import db
+
+
+'''
+Sparse fieldsets
+?fields=id,title selects only some columns. The projection is pushed
+down to SQL (a plain column query, no ORM objects are built) and only
+the requested keys are sent back.
+'''
+
+
+def get_fields(args, model):
+    # Return the requested fields, or None if the client wants them all
+    if not args.get('fields'):
+        return None
+    fields = []
+    for field in args['fields'].split(','):
+        field = field.strip()
+        # If a field doesn't exist, send an error (bad request - 400)
+        if field not in model.public_fields:
+            abort(400)
+        if field not in fields:
+            fields.append(field)
+    return fields
+
+
+def project(model, fields, extra=()):
+    # Query the whole entity, or only the requested columns (plus the
+    # id and the extra columns, e.g. the sort key, which the pagination
+    # cursor needs)
+    if fields is None:
+        return model.query
+    names = list(fields)
+    for name in ['id'] + list(extra):
+        if name not in names:
+            names.append(name)
+    return db.session.query(*[getattr(model, name) for name in names])
+
+
+def row_formatter(fields):
+    # Return a function that turns a row into the response's dict
+    if fields is None:
+        return lambda row: row.format()
+    return lambda row: {field: getattr(row, field) for field in fields}
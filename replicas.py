@@ -0,0 +1,195 @@
+import os
+import time
+import logging
+import threading
+from flask import request, g, has_app_context, current_app
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DBAPIError
+
+
+# Comma-separated list of read replica database URLs (optional)
+REPLICA_DATABASE_URLS = os.environ.get('REPLICA_DATABASE_URLS', '')
+# 'round_robin' or 'least_loaded'
+REPLICA_STRATEGY = os.environ.get('REPLICA_STRATEGY', 'round_robin')
+# A replica more than this many seconds behind the primary isn't used
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+# How often (in seconds) the health and the lag of a replica are checked
+REPLICA_HEALTH_INTERVAL = float(
+    os.environ.get('REPLICA_HEALTH_INTERVAL', 5))
+
+# Clients that must read their own writes can send this header to
+# read from the primary
+CONSISTENT_READ_HEADER = 'X-Consistent-Read'
+
+logger = logging.getLogger(__name__)
+
+
+class Replica:
+    def __init__(self, url):
+        self.url = url
+        self.engine = create_engine(url, pool_pre_ping=True)
+        self.healthy = True
+        self.lag = 0.0
+        self.checked_at = 0
+        # Number of requests currently reading from this replica
+        self.in_flight = 0
+        self.reads = 0
+
+        # A failing connection takes the replica out until the next check
+        @event.listens_for(self.engine, 'handle_error')
+        def on_error(context):
+            if context.is_disconnect or context.connection is None:
+                self.healthy = False
+
+    def check(self, max_lag):
+        try:
+            with self.engine.connect() as connection:
+                if self.engine.dialect.name == 'postgresql':
+                    # No lag once everything received is replayed: the
+                    # time since the last replayed transaction only grows
+                    # while the primary has no writes. NULL on a server
+                    # that is not replaying WAL (no lag either)
+                    lag = connection.execute(text(
+                        'SELECT CASE WHEN pg_last_wal_receive_lsn() = '
+                        'pg_last_wal_replay_lsn() THEN 0 '
+                        'ELSE EXTRACT(EPOCH FROM now() - '
+                        'pg_last_xact_replay_timestamp()) END')).scalar()
+                else:
+                    connection.execute(text('SELECT 1'))
+                    lag = None
+            self.lag = float(lag or 0)
+            self.healthy = self.lag <= max_lag
+        except Exception:
+            logger.warning('Read replica %r is unavailable', self.engine.url)
+            self.healthy = False
+        self.checked_at = time.time()
+
+
+'''
+ReplicaRouter
+Sends the queries of GET requests to a healthy read replica (round-robin
+or least-loaded), while writes, and the reads of requests that must see
+their own writes, stay on the primary. Replicas that are down or lag
+behind by more than REPLICA_MAX_LAG are skipped, and the primary is
+used when no replica is left.
+
+The health of the replicas is checked by a thread of each worker, never
+by a request, so a replica that is down doesn't make the requests wait
+for its connection timeout. A request whose replica fails runs again on
+the primary.
+'''
+
+
+class ReplicaRouter:
+    def __init__(self, strategy=REPLICA_STRATEGY, max_lag=REPLICA_MAX_LAG,
+                 health_interval=REPLICA_HEALTH_INTERVAL):
+        self.strategy = strategy
+        self.max_lag = max_lag
+        self.health_interval = health_interval
+        self.replicas = []
+        self._next = 0
+        self._lock = threading.Lock()
+        self.primary_reads = 0
+        # The process whose thread checks the replicas (each worker
+        # starts its own after the fork)
+        self._checker_pid = None
+
+    def configure(self, urls):
+        for replica in self.replicas:
+            replica.engine.dispose()
+        self.replicas = [Replica(url) for url in urls if url]
+
+    def init_app(self, app):
+        # setup_db() may be called more than once for the same app
+        if 'replica_router' in app.extensions:
+            return
+        app.extensions['replica_router'] = self
+        if not self.replicas:
+            self.configure(REPLICA_DATABASE_URLS.split(','))
+        app.before_request(self.before_request)
+        app.teardown_request(self.teardown_request)
+        app.register_error_handler(DBAPIError, self.retry_on_primary)
+
+    def _start_checks(self):
+        with self._lock:
+            if self._checker_pid == os.getpid():
+                return
+            self._checker_pid = os.getpid()
+        threading.Thread(target=self._run_checks, daemon=True).start()
+
+    def _run_checks(self):
+        while True:
+            for replica in list(self.replicas):
+                replica.check(self.max_lag)
+            time.sleep(self.health_interval)
+
+    def choose(self):
+        # Return the replica to read from, or None for the primary
+        self._start_checks()
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        with self._lock:
+            if self.strategy == 'least_loaded':
+                replica = min(healthy, key=lambda replica: replica.in_flight)
+            else:
+                replica = healthy[self._next % len(healthy)]
+                self._next += 1
+            replica.in_flight += 1
+            replica.reads += 1
+        return replica
+
+    def before_request(self):
+        g.replica = None
+        if not self.replicas or request.method not in ('GET', 'HEAD'):
+            return
+        if request.headers.get(CONSISTENT_READ_HEADER, '').lower() in \
+                ('true', '1'):
+            self.primary_reads += 1
+            return
+        g.replica = self.choose()
+        if g.replica is None:
+            self.primary_reads += 1
+
+    def teardown_request(self, exception=None):
+        replica = g.pop('replica', None)
+        if replica is not None:
+            with self._lock:
+                replica.in_flight -= 1
+
+    def retry_on_primary(self, error):
+        # A query failed on the replica of the request: run the request
+        # again on the primary (errors of the primary are not retried)
+        replica = g.get('replica')
+        if replica is None:
+            raise error
+        logger.warning('Read replica %r failed, reading from the primary',
+                       replica.engine.url)
+        self.teardown_request()
+        g.replica = None
+        self.primary_reads += 1
+        # Drop the session's transaction on the replica
+        current_app.extensions['sqlalchemy'].db.session.rollback()
+        return current_app.dispatch_request()
+
+    def stats(self):
+        return {
+            'primary_reads': self.primary_reads,
+            'replicas': [{
+                'healthy': replica.healthy,
+                'lag': replica.lag,
+                'in_flight': replica.in_flight,
+                'reads': replica.reads
+            } for replica in self.replicas]
+        }
+
+
+replica_router = ReplicaRouter()
+
+
+def current_replica_engine():
+    # The engine of the replica chosen for this request (if any)
+    if not has_app_context():
+        return None
+    replica = g.get('replica')
+    return replica.engine if replica is not None else None
@@ -0,0 +1,207 @@
+import re
+import logging
+from flask import abort
+from sqlalchemy import func, text, or_, literal_column, sql
+from models import db, Movie, Actor, schema_listeners
+
+
+# The text search configuration of the PostgreSQL index ('simple' keeps
+# every word, names and titles are not stemmed)
+SEARCH_CONFIG = 'simple'
+# The types GET /search returns by default (?type= selects some of them)
+SEARCH_TYPES = ('movies', 'actors')
+
+logger = logging.getLogger(__name__)
+
+
+'''
+Search
+GET /search?q= matches the words of movies.title and actors.name through
+an index instead of scanning the tables:
+- PostgreSQL: a generated tsvector column with a GIN index (the words,
+  prefixes included), and a pg_trgm GIN index for the misspelled ones.
+  The results are ranked by ts_rank plus the trigram similarity.
+- SQLite: an FTS5 table kept in sync by triggers, ranked by bm25 (no
+  fuzzy matches).
+- Otherwise (SQLite without FTS5): LIKE, which scans the tables.
+The indexes are created by the migrations, or along with the tables of
+a new database (see create_schema). A database that doesn't have them
+yet is searched with LIKE until 'flask db upgrade' has run.
+'''
+
+# table -> (model, searched column)
+SEARCHED = {
+    'movies': (Movie, 'title'),
+    'actors': (Actor, 'name'),
+}
+
+
+def _postgresql_ddl(table, column):
+    return [
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        "ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('{config}', "
+        "coalesce({column}, ''))) STORED",
+        'CREATE INDEX IF NOT EXISTS ix_{table}_search_vector ON {table} '
+        'USING gin (search_vector)',
+        'CREATE INDEX IF NOT EXISTS ix_{table}_{column}_trgm ON {table} '
+        'USING gin ({column} gin_trgm_ops)',
+    ], dict(table=table, column=column, config=SEARCH_CONFIG)
+
+
+def _sqlite_ddl(table, column):
+    # An external content table: the index only, the rows stay in the
+    # table
+    return [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS {table}_search USING fts5("
+        "{column}, content='{table}', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')",
+        'CREATE TRIGGER IF NOT EXISTS {table}_search_insert '
+        'AFTER INSERT ON {table} BEGIN '
+        'INSERT INTO {table}_search (rowid, {column}) '
+        'VALUES (new.id, new.{column}); END',
+        'CREATE TRIGGER IF NOT EXISTS {table}_search_delete '
+        'AFTER DELETE ON {table} BEGIN '
+        "INSERT INTO {table}_search ({table}_search, rowid, {column}) "
+        "VALUES ('delete', old.id, old.{column}); END",
+        'CREATE TRIGGER IF NOT EXISTS {table}_search_update '
+        'AFTER UPDATE OF {column} ON {table} BEGIN '
+        "INSERT INTO {table}_search ({table}_search, rowid, {column}) "
+        "VALUES ('delete', old.id, old.{column}); "
+        'INSERT INTO {table}_search (rowid, {column}) '
+        'VALUES (new.id, new.{column}); END',
+        # Index the rows already in the table
+        "INSERT INTO {table}_search ({table}_search) VALUES ('rebuild')",
+    ], dict(table=table, column=column)
+
+
+def ddl(dialect, table, column):
+    # The statements creating the search index of a table
+    if dialect == 'postgresql':
+        statements, names = _postgresql_ddl(table, column)
+    else:
+        statements, names = _sqlite_ddl(table, column)
+    return [statement.format(**names) for statement in statements]
+
+
+def _has_index(connection, dialect, table):
+    if dialect == 'postgresql':
+        return connection.execute(text(
+            'SELECT 1 FROM information_schema.columns WHERE table_name = '
+            ":table AND column_name = 'search_vector'"),
+            table=table).first() is not None
+    return connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        name=table + '_search').first() is not None
+
+
+def create_indexes(connection):
+    # Create the indexes of a new database (see create_schema)
+    dialect = connection.dialect.name
+    if dialect not in ('postgresql', 'sqlite'):
+        return
+    for table, (_, column) in SEARCHED.items():
+        try:
+            for statement in ddl(dialect, table, column):
+                connection.execute(text(statement))
+        except Exception:
+            if dialect == 'postgresql':
+                raise
+            # SQLite compiled without FTS5
+            logger.warning('FTS5 is not available, searching with LIKE')
+            return
+
+
+schema_listeners.append(create_indexes)
+
+
+def get_backend(engine):
+    # The backend of the searches: the indexes, or LIKE if they are
+    # missing
+    dialect = engine.dialect.name
+    if dialect not in ('postgresql', 'sqlite'):
+        return 'like'
+    with engine.connect() as connection:
+        if not all(_has_index(connection, dialect, table)
+                   for table in SEARCHED):
+            logger.warning('The search indexes are missing, searching '
+                           'with LIKE until flask db upgrade has run')
+            return 'like'
+    return 'fts5' if dialect == 'sqlite' else dialect
+
+
+def terms(q):
+    # The words of the query (letters and digits only, so they can't
+    # change the syntax of the tsquery or the FTS5 query)
+    return re.findall(r'\w+', q.lower())
+
+
+def _search_postgresql(model, column, q, limit):
+    vector = literal_column(model.__tablename__ + '.search_vector')
+    # Every word must match, as a word or as the prefix of one
+    query = func.to_tsquery(SEARCH_CONFIG, ' & '.join(
+        word + ':*' for word in terms(q)))
+    rank = (func.ts_rank(vector, query) +
+            func.similarity(column, q)).label('rank')
+    return db.session.query(model, rank).filter(or_(
+        vector.op('@@')(query),
+        # Trigram match (the pg_trgm index), for the misspelled words
+        text('%s.%s %% :q' % (model.__tablename__, column.key)))) \
+        .params(q=q).order_by(rank.desc(), model.id).limit(limit)
+
+
+def _search_fts5(model, column, q, limit):
+    words = terms(q)
+    if not words:
+        return []
+    index = sql.table(model.__tablename__ + '_search', sql.column('rowid'))
+    # bm25 is lower for the better matches
+    rank = literal_column('-bm25(%s)' % index.name).label('rank')
+    return db.session.query(model, rank) \
+        .join(index, index.c.rowid == model.id) \
+        .filter(text('%s MATCH :match' % index.name)) \
+        .params(match=' '.join('"%s"*' % word for word in words)) \
+        .order_by(rank.desc(), model.id).limit(limit)
+
+
+def _search_like(model, column, q, limit):
+    words = terms(q)
+    if not words:
+        return []
+    query = db.session.query(model, literal_column('1').label('rank'))
+    for word in words:
+        query = query.filter(column.ilike('%' + word + '%'))
+    return query.order_by(model.id).limit(limit)
+
+
+BACKENDS = {
+    'postgresql': _search_postgresql,
+    'fts5': _search_fts5,
+    'like': _search_like,
+}
+
+
+def search(backend, table, q, limit):
+    # [(row, rank)] of the table matching q, the most relevant first
+    model, column = SEARCHED[table]
+    return list(BACKENDS[backend](model, getattr(model, column), q, limit))
+
+
+def get_types(args):
+    # The requested types (?type=movies,actors), or send an error (bad
+    # request - 400) if one of them doesn't exist
+    requested = args.get('type')
+    if not requested:
+        return SEARCH_TYPES
+    types = tuple(name.strip() for name in requested.split(',')
+                  if name.strip())
+    if not types or any(name not in SEARCH_TYPES for name in types):
+        abort(400)
+    return types
+
+
+def init_app(app):
+    if 'search' in app.extensions:
+        return
+    with app.app_context():
+        app.extensions['search'] = get_backend(db.engine)
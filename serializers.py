@@ -0,0 +1,103 @@
+import time
+import datetime
+from functools import lru_cache
+from flask import request, has_request_context, Response, json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+# Called with the number of seconds each serialization took (see
+# profiler.py)
+serialize_listeners = []
+
+
+'''
+Serializers
+Every response body (the routes, the error handlers and AuthError) is
+encoded here: JSON with orjson when it is installed (Flask's encoder
+otherwise), or MessagePack for the clients that prefer it in their
+Accept header. Dates keep the format of Flask's encoder
+('Thu, 01 Apr 2021 00:00:00 GMT') in both.
+'''
+
+
+_DAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep',
+           'Oct', 'Nov', 'Dec')
+
+
+@lru_cache(maxsize=65536)
+def _format_date(value):
+    # The same dates come back on every page, format each one once
+    return '%s, %02d %s %04d 00:00:00 GMT' % (
+        _DAYS[value.weekday()], value.day, _MONTHS[value.month - 1],
+        value.year)
+
+
+def _default(value):
+    # The types neither orjson nor msgpack encode the way the API does
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%a, %d %b %Y %H:%M:%S GMT')
+    if isinstance(value, datetime.date):
+        return _format_date(value)
+    raise TypeError('%r is not serializable' % (value,))
+
+
+if orjson is not None:
+    def _dumps_json(data):
+        return orjson.dumps(data, default=_default,
+                            option=orjson.OPT_PASSTHROUGH_DATETIME)
+else:
+    def _dumps_json(data):
+        return json.dumps(data).encode('utf-8')
+
+
+def _dumps_msgpack(data):
+    return msgpack.packb(data, default=_default, use_bin_type=True)
+
+
+def _timed(encode, data):
+    if not serialize_listeners:
+        return encode(data)
+    start = time.perf_counter()
+    try:
+        return encode(data)
+    finally:
+        elapsed = time.perf_counter() - start
+        for listener in serialize_listeners:
+            listener(elapsed)
+
+
+def dumps(data):
+    # JSON bytes (also used for the streamed rows)
+    return _timed(_dumps_json, data)
+
+
+def negotiate():
+    # The mimetype of the response: MessagePack only if the client
+    # prefers it over JSON
+    if msgpack is None or not has_request_context():
+        return JSON_MIMETYPE
+    return request.accept_mimetypes.best_match(
+        [JSON_MIMETYPE, MSGPACK_MIMETYPE], default=JSON_MIMETYPE)
+
+
+def respond(data, status=200):
+    mimetype = negotiate()
+    if mimetype == MSGPACK_MIMETYPE:
+        body = _timed(_dumps_msgpack, data)
+    else:
+        body = dumps(data)
+    response = Response(body, status=status, mimetype=mimetype)
+    # The body depends on the Accept header
+    response.vary.add('Accept')
+    return response
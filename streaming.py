@@ -0,0 +1,84 @@
+import os
+from flask import Response, stream_with_context
+from serializers import dumps
+
+
+# Number of rows fetched from the server-side cursor at a time
+STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', 1000))
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def wants_stream(request):
+    '''
+    Return 'ndjson' (one JSON object per line), 'json' (a chunked JSON
+    document with the usual shape) or None (no streaming)
+    '''
+    if request.args.get('format') == 'ndjson':
+        return 'ndjson'
+    # Only stream NDJSON if the client prefers it over plain JSON
+    best = request.accept_mimetypes.best_match(
+        ['application/json', NDJSON_MIMETYPE])
+    if best == NDJSON_MIMETYPE:
+        return 'ndjson'
+    if request.args.get('stream', '').lower() in ('true', '1'):
+        return 'json'
+    return None
+
+
+def iter_rows(query, batch_size=STREAM_BATCH_SIZE):
+    # Read the rows from a server-side cursor, batch_size rows at a
+    # time, so only one batch is held in memory
+    return query.execution_options(stream_results=True).yield_per(batch_size)
+
+
+def _format(rows):
+    return [row.format() for row in rows]
+
+
+def iter_items(query, format_rows=_format, batch_size=STREAM_BATCH_SIZE):
+    # Format the rows a batch at a time (the includes load the related
+    # rows of a whole batch with one query)
+    batch = []
+    for row in iter_rows(query, batch_size):
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield from format_rows(batch)
+            batch = []
+    if batch:
+        yield from format_rows(batch)
+
+
+def stream_ndjson(query, format_rows=_format):
+    def generate():
+        for item in iter_items(query, format_rows):
+            yield dumps(item) + b'\n'
+
+    return Response(stream_with_context(generate()),
+                    mimetype=NDJSON_MIMETYPE)
+
+
+def stream_json(query, key, nested=False, format_rows=_format):
+    '''
+    Stream {"success": true, "<key>": [...]} without building the list.
+    nested wraps the rows in one more list (the shape of GET /actors).
+    '''
+    opening = '[[' if nested else '['
+    closing = ']]' if nested else ']'
+
+    def generate():
+        yield ('{"success":true,"%s":%s' % (key, opening)).encode('ascii')
+        separator = b''
+        for item in iter_items(query, format_rows):
+            yield separator + dumps(item)
+            separator = b','
+        yield closing.encode('ascii') + b'}\n'
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/json')
+
+
+def stream_rows(mode, query, key, nested=False, format_rows=_format):
+    if mode == 'ndjson':
+        return stream_ndjson(query, format_rows)
+    return stream_json(query, key, nested, format_rows)
@@ -0,0 +1,105 @@
+from flask import abort
+from sqlalchemy import tuple_
+from models import Tombstone, last_change_seq, first_change_seq
+from pagination import encode_cursor, decode_cursor
+from projection import project, row_formatter
+
+
+'''
+Delta sync
+GET /movies?since=<watermark> and GET /actors?since=<watermark> return
+only the rows written and deleted after the watermark, and the watermark
+to send next time, so a client that keeps a copy of a table downloads
+what changed instead of the whole table. ?since=0 returns every row.
+
+Every write stamps its rows with the id of its change event (change_seq,
+see record_change) and leaves a tombstone for each deleted row. The
+change events are numbered in the order of their commits, so the rows
+and the tombstones after a watermark are read in (change_seq, id) order
+through an index, and nothing committed before the new watermark can be
+missed. A watermark is an opaque cursor: the (change_seq, id) of the
+last change returned, or only the change_seq once the client is up to
+date.
+
+The old change events and their tombstones are deleted (see
+changes.prune_changes): when a watermark is older than the oldest event
+left, the deletions after it may be gone, so every row is returned with
+reset: the client replaces its copy.
+'''
+
+
+def get_since(args):
+    # Read ?since=, or send an error (bad request - 400)
+    since = args['since']
+    if since == '0':
+        return [0, None]
+    seq, last_id = decode_cursor(since)
+    if not isinstance(seq, int) or not (
+            last_id is None or isinstance(last_id, int)):
+        abort(400)
+    return [seq, last_id]
+
+
+def _after(seq_column, id_column, since):
+    seq, last_id = since
+    if last_id is None:
+        return seq_column > seq
+    return tuple_(seq_column, id_column) > tuple_(seq, last_id)
+
+
+def _expired(since):
+    # Whether tombstones after the watermark may have been deleted. The
+    # last event is never deleted, so a client that is up to date isn't
+    seq, last_id = since
+    if seq == 0:
+        return False
+    oldest = first_change_seq()
+    if oldest is None:
+        return False
+    return (seq + 1 if last_id is None else seq) < oldest
+
+
+def changes_since(model, since, limit, fields=None):
+    '''
+    Return the rows written (formatted, with their updated_at) and the
+    ids of the rows deleted after the watermark, at most `limit` changes
+    in all, the next watermark, whether there are more changes, and
+    whether the client has to replace its copy (reset)
+    '''
+    reset = _expired(since)
+    if reset:
+        since = [0, None]
+    if fields is not None and 'id' not in fields:
+        # The client needs the ids to apply the changes
+        fields = ['id'] + fields
+    # Read first: every change up to it is committed, so the changes
+    # read next can't skip one that commits later
+    last = last_change_seq()
+    query = project(model, fields, ['change_seq', 'updated_at']).filter(
+        _after(model.change_seq, model.id, since),
+        model.change_seq <= last).order_by(model.change_seq, model.id)
+    tombstones = Tombstone.query.filter(
+        Tombstone.table_name == model.__tablename__,
+        _after(Tombstone.change_seq, Tombstone.row_id, since),
+        Tombstone.change_seq <= last).order_by(
+        Tombstone.change_seq, Tombstone.row_id)
+
+    # One extra change of each kind, to know if there are more
+    changes = sorted(
+        [(row.change_seq, row.id, row) for row in
+         query.limit(limit + 1)] +
+        [(tombstone.change_seq, tombstone.row_id, None) for tombstone in
+         tombstones.limit(limit + 1)],
+        key=lambda change: change[:2])
+    more = len(changes) > limit
+    changes = changes[:limit]
+    if more:
+        watermark = encode_cursor(list(changes[-1][:2]))
+    else:
+        watermark = encode_cursor([max(last, since[0]), None])
+
+    format_row = row_formatter(fields)
+    rows = [dict(format_row(row), updated_at=row.updated_at)
+            for _, _, row in changes if row is not None]
+    deleted = [id for _, id, row in changes if row is None]
+    return rows, deleted, watermark, more, reset
@@ -1,10 +1,28 @@
 import os
 import unittest
+import gzip
 import json
+import tempfile
+import sqlite3
+import msgpack
+from datetime import date
+from flask import g
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
 
 from app import create_app
-from models import setup_db, Movie, Actor
+from models import setup_db, db, Movie, Actor, get_stats, rebuild_stats, \
+    begin_change, record_change
+from auth import jwks_store, token_cache
+from replicas import replica_router
+import compression
+import importer
+import admission
+import metrics
+import profiler
+import changes
+from benchmark.driver import default_scenarios, uncovered_routes
 
 
 class AgencyTestCase(unittest.TestCase):
@@ -416,6 +434,1261 @@ class AgencyTestCase(unittest.TestCase):
             data['message'],
             'Resource Not Found')
 
+    # TEST (Successful Operation): the JWKS keys are downloaded once
+    # and reused by the following requests
+    def test_jwks_keys_are_cached(self):
+        # Make a first request to load the keys
+        self.client().get('/movies', headers=self.casting_assistant)
+        fetches = jwks_store.fetches
+
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/actors', headers=self.casting_assistant)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the JWKS document was not downloaded again
+        self.assertEqual(jwks_store.fetches, fetches)
+
+    # TEST (Successful Operation): a token is verified once and then
+    # served from the token cache
+    def test_verified_token_is_cached(self):
+        # Make a first request to verify the token
+        self.client().get('/movies', headers=self.casting_director)
+        hits = token_cache.hits
+
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/movies', headers=self.casting_director)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the second request was a cache hit
+        self.assertEqual(token_cache.hits, hits + 1)
+
+    # TEST (Expected Error): a cached token still needs the permission
+    def test_403_if_cached_token_lacks_permission(self):
+        # Make a first request to cache the token
+        self.client().get('/movies', headers=self.casting_assistant)
+        # Store the response in the 'res' variable
+        res = self.client().delete(
+            '/movies/1', headers=self.casting_assistant)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 403
+        self.assertEqual(res.status_code, 403)
+        # Check the message body
+        self.assertEqual(data['message'], 'Permission not found.')
+
+    # TEST (Successful Operation): GET /movies?limit=2 and the next page
+    def test_get_movies_paginated(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/movies?limit=2', headers=self.casting_assistant)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check only one page of movies is returned
+        self.assertEqual(len(data['movies']), 2)
+        # Assert true that there is a next page
+        self.assertTrue(data['next_cursor'])
+
+        # Get the next page using the cursor
+        res = self.client().get(
+            '/movies?limit=2&cursor=' + data['next_cursor'],
+            headers=self.casting_assistant)
+        next_data = json.loads(res.data)
+
+        # Check the next page starts after the first one
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(
+            next_data['movies'][0]['id'] > data['movies'][-1]['id'])
+
+    # TEST (Successful Operation): GET /actors?limit=2
+    def test_get_actors_paginated(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/actors?limit=2', headers=self.casting_assistant)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check only one page of actors is returned
+        self.assertEqual(len(data['actors'][0]), 2)
+        # Assert true that there is a next page
+        self.assertTrue(data['next_cursor'])
+
+    # TEST (Expected Error): GET /movies with a broken cursor (400:
+    # Bad Request)
+    def test_400_if_movies_cursor_is_invalid(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/movies?cursor=not-a-cursor',
+            headers=self.casting_assistant)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 400
+        self.assertEqual(res.status_code, 400)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+        # Check the message body
+        self.assertEqual(data['message'], 'Bad Request')
+
+    # TEST (Successful Operation): GET /movies streamed as NDJSON
+    def test_get_movies_ndjson(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/movies',
+            headers=dict(self.casting_assistant,
+                         Accept='application/x-ndjson'))
+        # Load every line of the response as a movie
+        movies = [json.loads(line)
+                  for line in res.data.decode().splitlines()]
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the response is NDJSON
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        # Assert true that there are movies
+        self.assertTrue(movies)
+        self.assertTrue(movies[0]['title'])
+
+    # TEST (Successful Operation): GET /actors?stream=true
+    def test_get_actors_streamed(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/actors?stream=true', headers=self.casting_assistant)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the success body is true
+        self.assertEqual(data['success'], True)
+        # Assert true that there are actors (in the usual shape)
+        self.assertTrue(data['actors'][0])
+
+    # TEST (Successful Operation): GET /movies?fields=id,title
+    def test_get_movies_with_fields(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/movies?fields=id,title', headers=self.casting_assistant)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check only the requested fields are returned
+        self.assertEqual(
+            sorted(data['movies'][0].keys()), ['id', 'title'])
+
+    # TEST (Successful Operation): GET /actors?fields=name
+    def test_get_actors_with_fields(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/actors?fields=name&limit=2',
+            headers=self.casting_assistant)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check only the requested field is returned
+        self.assertEqual(list(data['actors'][0][0].keys()), ['name'])
+        # Assert true that the pagination still works
+        self.assertTrue(data['next_cursor'])
+
+    # TEST (Expected Error): GET /movies with an unknown field (400:
+    # Bad Request)
+    def test_400_if_movie_field_does_not_exist(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/movies?fields=id,budget', headers=self.casting_assistant)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 400
+        self.assertEqual(res.status_code, 400)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+
+    # TEST (Successful Operation): POST /movies/bulk
+    def test_create_movies_bulk(self):
+        # Store the response in the 'res' variable
+        res = self.client().post(
+            '/movies/bulk',
+            headers=self.executive_producer,
+            json=[self.new_movie, self.update_movie])
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the success body is true
+        self.assertEqual(data['success'], True)
+        # Check both movies were created
+        self.assertEqual(data['created'], 2)
+        # Check the created movies exist
+        self.assertTrue(Movie.query.get(data['results'][1]['id']))
+
+    # TEST (Successful Operation): POST /actors/bulk with NDJSON
+    def test_create_actors_bulk_ndjson(self):
+        # Store the response in the 'res' variable
+        res = self.client().post(
+            '/actors/bulk',
+            headers=self.casting_director,
+            content_type='application/x-ndjson',
+            data='\n'.join(json.dumps(actor) for actor in
+                           [self.new_actor, self.update_actor]))
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check both actors were created
+        self.assertEqual(data['created'], 2)
+
+    # TEST (Expected Error): POST /actors/bulk with an invalid row (422:
+    # Unprocessable)
+    def test_422_if_bulk_actor_data_is_missing(self):
+        actors_count = Actor.query.count()
+        # Store the response in the 'res' variable
+        res = self.client().post(
+            '/actors/bulk',
+            headers=self.casting_director,
+            json=[self.new_actor, self.new_missing_actor])
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 422
+        self.assertEqual(res.status_code, 422)
+        # Check the error is reported for the second row
+        self.assertEqual(data['results'][0]['index'], 1)
+        # Check no actor was inserted
+        self.assertEqual(Actor.query.count(), actors_count)
+
+    # TEST (Expected Error): POST /movies/bulk (403: Permission
+    # not found.)
+    def test_403_if_bulk_movie_creation_not_authorized(self):
+        # Store the response in the 'res' variable
+        res = self.client().post(
+            '/movies/bulk',
+            headers=self.casting_director,
+            json=[self.new_movie])
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 403
+        self.assertEqual(res.status_code, 403)
+        # Check the message body
+        self.assertEqual(data['message'], 'Permission not found.')
+
+    # TEST (Successful Operation): PATCH /actors/bulk by ids
+    def test_update_actors_bulk(self):
+        # Store the response in the 'res' variable
+        res = self.client().patch(
+            '/actors/bulk',
+            headers=self.casting_director,
+            json={'ids': [1, 3, 1000], 'changes': {'age': 30}})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the two existing actors were updated
+        self.assertEqual(data['updated'], 2)
+        # Check the missing id is reported
+        self.assertEqual(data['not_found'], [1000])
+        # Check the new age was saved
+        self.assertEqual(Actor.query.get(3).age, 30)
+
+    # TEST (Successful Operation): PATCH /actors/bulk with more ids than
+    # one IN list takes
+    def test_update_actors_bulk_many_ids(self):
+        first, second = [actor.id for actor in Actor.query.limit(2)]
+        ids = [first, second, first] + list(range(100000, 101000))
+        # Store the response in the 'res' variable
+        res = self.client().patch(
+            '/actors/bulk',
+            headers=self.casting_director,
+            json={'ids': ids, 'changes': {'age': 31}})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the two existing actors were updated once
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['updated'], 2)
+        self.assertEqual(len(data['not_found']), 1000)
+        self.assertEqual(Actor.query.get(second).age, 31)
+
+    # TEST (Expected Error): PATCH /movies/bulk without ids or filter
+    # (422: Unprocessable)
+    def test_422_if_bulk_movie_update_has_no_selection(self):
+        # Store the response in the 'res' variable
+        res = self.client().patch(
+            '/movies/bulk',
+            headers=self.executive_producer,
+            json={'changes': {'title': 'Split'}})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 422
+        self.assertEqual(res.status_code, 422)
+        # Check the message body
+        self.assertEqual(data['message'], 'Not Processable')
+
+    # TEST (Successful Operation): DELETE /movies/bulk by ids
+    def test_delete_movies_bulk(self):
+        # Create two movies to delete
+        ids = Movie.bulk_insert([
+            {'title': 'Old Movie', 'release_date': date(2000, 1, 1)},
+            {'title': 'Old Movie', 'release_date': date(2000, 1, 2)}])
+        # Store the response in the 'res' variable
+        res = self.client().delete(
+            '/movies/bulk',
+            headers=self.executive_producer,
+            json={'ids': ids + [1000]})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check both movies were deleted
+        self.assertEqual(data['deleted'], 2)
+        self.assertEqual(data['not_found'], [1000])
+        # Check the movies no longer exist
+        self.assertEqual(Movie.query.get(ids[0]), None)
+
+    # TEST (Expected Error): DELETE /actors/bulk (403: Permission
+    # not found.)
+    def test_403_if_bulk_actor_deletion_not_authorized(self):
+        # Store the response in the 'res' variable
+        res = self.client().delete(
+            '/actors/bulk',
+            headers=self.casting_assistant,
+            json={'ids': [1]})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 403
+        self.assertEqual(res.status_code, 403)
+        # Check the message body
+        self.assertEqual(data['message'], 'Permission not found.')
+
+    # TEST (Successful Operation): GET /movies with a matching ETag
+    # (304: Not Modified)
+    def test_304_if_movies_not_modified(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/movies', headers=self.casting_assistant)
+        etag = res.headers['ETag']
+
+        # Send the ETag back
+        res = self.client().get(
+            '/movies',
+            headers=dict(self.casting_assistant, **{'If-None-Match': etag}))
+
+        # Check the status code is 304
+        self.assertEqual(res.status_code, 304)
+        # Check the body is empty
+        self.assertEqual(res.data, b'')
+
+    # TEST (Successful Operation): a write in the same second as the
+    # client's If-Modified-Since is not answered 304
+    def test_if_modified_since_after_write_in_same_second(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/actors', headers=self.casting_assistant)
+        last_modified = res.headers['Last-Modified']
+
+        # Update an actor (most likely in the same second)
+        self.client().patch(
+            '/actors/1',
+            headers=self.casting_director,
+            json=self.update_actor)
+        # Send the date back
+        res = self.client().get(
+            '/actors',
+            headers=dict(self.casting_assistant,
+                         **{'If-Modified-Since': last_modified}))
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+
+    # TEST (Successful Operation): a write to the actors changes the
+    # ETag of GET /actors
+    def test_actors_etag_changes_after_update(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/actors', headers=self.casting_assistant)
+        etag = res.headers['ETag']
+
+        # Update an actor
+        self.client().patch(
+            '/actors/1',
+            headers=self.casting_director,
+            json=self.update_actor)
+        # Send the old ETag back
+        res = self.client().get(
+            '/actors',
+            headers=dict(self.casting_assistant, **{'If-None-Match': etag}))
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the ETag changed
+        self.assertNotEqual(res.headers['ETag'], etag)
+
+    # TEST (Successful Operation): the second identical GET /movies is
+    # served from the response cache
+    def test_get_movies_cached(self):
+        # Make a first request to cache the response
+        res = self.client().get(
+            '/movies?limit=3', headers=self.casting_assistant)
+        # Store the second response in the 'res' variable
+        cached_res = self.client().get(
+            '/movies?limit=3', headers=self.casting_assistant)
+
+        # Check the status code is 200
+        self.assertEqual(cached_res.status_code, 200)
+        # Check the response came from the cache
+        self.assertEqual(cached_res.headers['X-Cache'], 'HIT')
+        # Check the body is the same
+        self.assertEqual(cached_res.data, res.data)
+
+    # TEST (Successful Operation): creating an actor invalidates the
+    # cached GET /actors responses
+    def test_actors_cache_invalidated_after_insert(self):
+        # Make a first request to cache the response
+        self.client().get('/actors', headers=self.casting_assistant)
+        # Create a new actor
+        self.client().post(
+            '/actors', headers=self.casting_director, json=self.new_actor)
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/actors', headers=self.casting_assistant)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the response was not served from the cache
+        self.assertEqual(res.headers['X-Cache'], 'MISS')
+
+    # TEST (Successful Operation): GET /cache/stats
+    def test_get_cache_stats(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/cache/stats', headers=self.casting_assistant)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the hit and miss counters are returned
+        self.assertIn('hits', data['responses'])
+        self.assertIn('misses', data['tokens'])
+
+    # TEST (Successful Operation): GET /movies filtered by release date
+    # and sorted by title
+    def test_get_movies_filtered_and_sorted(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/movies?release_date_from=2020-01-01&sort=-title',
+            headers=self.casting_assistant)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+        titles = [movie['title'] for movie in data['movies']]
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the movies are sorted by title, descending
+        self.assertEqual(titles, sorted(titles, reverse=True))
+        # Check only the movies released since 2020 are returned
+        for movie in Movie.query.filter(Movie.title.in_(titles)):
+            self.assertTrue(movie.release_date >= date(2020, 1, 1))
+
+    # TEST (Successful Operation): GET /actors filtered by age range
+    # and paginated by age
+    def test_get_actors_filtered_by_age(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/actors?min_age=20&max_age=60&sort=age&limit=1',
+            headers=self.casting_assistant)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+        first = data['actors'][0][0]
+
+        # Get the next page using the cursor
+        res = self.client().get(
+            '/actors?min_age=20&max_age=60&sort=age&limit=1&cursor=' +
+            data['next_cursor'], headers=self.casting_assistant)
+        second = json.loads(res.data)['actors'][0][0]
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the pages follow the age order
+        self.assertTrue(
+            (second['age'], second['id']) > (first['age'], first['id']))
+        self.assertTrue(20 <= second['age'] <= 60)
+
+    # TEST (Expected Error): GET /actors with an unknown sort (400:
+    # Bad Request)
+    def test_400_if_actors_sort_is_invalid(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/actors?sort=password', headers=self.casting_assistant)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 400
+        self.assertEqual(res.status_code, 400)
+        # Check the success body is false
+        self.assertEqual(data['success'], False)
+
+    # TEST (Successful Operation): GET /movies reads from a replica
+    def test_get_movies_from_replica(self):
+        # Use the test database as a (second) read replica
+        replica_router.configure([self.database_path])
+        try:
+            # Store the response in the 'res' variable
+            res = self.client().get(
+                '/movies', headers=self.casting_assistant)
+            stats = replica_router.stats()
+        finally:
+            replica_router.configure([])
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the replica was used
+        self.assertEqual(stats['replicas'][0]['reads'], 1)
+
+    # TEST (Successful Operation): GET /actors falls back to the primary
+    # when the replica is down
+    def test_get_actors_when_replica_is_down(self):
+        # Use a database that doesn't exist as the read replica
+        replica_router.configure(['sqlite:////nonexistent/replica.db'])
+        primary_reads = replica_router.primary_reads
+        try:
+            # Store the response in the 'res' variable
+            res = self.client().get(
+                '/actors', headers=self.casting_assistant)
+            stats = replica_router.stats()
+        finally:
+            replica_router.configure([])
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the replica was skipped and the primary was used
+        self.assertEqual(stats['replicas'][0]['healthy'], False)
+        self.assertEqual(stats['primary_reads'], primary_reads + 1)
+
+    # TEST (Successful Operation): GET /movies runs again on the primary
+    # when its query fails on the replica
+    def test_get_movies_when_replica_query_fails(self):
+        # A replica that is up but has no tables
+        replica_path = os.path.join(tempfile.mkdtemp(), 'replica.db')
+        sqlite3.connect(replica_path).close()
+        replica_router.configure(['sqlite:///' + replica_path])
+        primary_reads = replica_router.primary_reads
+        try:
+            # Store the response in the 'res' variable
+            res = self.client().get(
+                '/movies?limit=7', headers=self.casting_assistant)
+            stats = replica_router.stats()
+        finally:
+            replica_router.configure([])
+
+        # Check the status code is 200, read from the primary
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(stats['replicas'][0]['reads'], 1)
+        self.assertEqual(stats['primary_reads'], primary_reads + 1)
+
+    # TEST (Successful Operation): GET /metrics
+    def test_get_metrics(self):
+        # Make a request to measure
+        self.client().get('/movies', headers=self.casting_assistant)
+        # Store the response in the 'res' variable
+        res = self.client().get('/metrics')
+        body = res.data.decode()
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the route latency, auth phases and SQL metrics are there
+        self.assertIn(
+            'http_request_duration_seconds_count{method="GET",'
+            'route="/movies"}', body)
+        self.assertIn('auth_phase_duration_seconds_count{phase="header"}',
+                      body)
+        self.assertIn('db_queries_per_request_count', body)
+        self.assertIn('db_pool_checkouts_total', body)
+        self.assertIn('db_pool_wait_seconds_count{database="primary"}', body)
+
+    # TEST: a statement that fails doesn't leave its start time behind
+    def test_failed_statement_timing_is_dropped(self):
+        with self.app.app_context():
+            metrics.instrument_engine(db.engine, 'primary')
+            with db.engine.connect() as connection:
+                with self.assertRaises(DBAPIError):
+                    connection.execute(text('SELECT missing_column'))
+                # Check nothing is left to time
+                self.assertEqual(connection.info.get('query_start'), [])
+
+    # TEST: the profiler drops the start time of a failed statement
+    def test_failed_statement_profile_is_dropped(self):
+        with self.app.test_request_context('/movies'):
+            profiler.instrument_engine(db.engine)
+            g.profile = True
+            g.profile_queries = []
+            with db.engine.connect() as connection:
+                with self.assertRaises(DBAPIError):
+                    connection.execute(text('SELECT missing_column'))
+                # Check nothing is left to time
+                self.assertEqual(connection.info.get('profile_start'), [])
+
+    # TEST (Successful Operation): Server-Timing header when profiling
+    def test_get_movies_with_server_timing(self):
+        self.app.config['PROFILING'] = True
+        # Store the response in the 'res' variable (the slowest
+        # statements are logged as warnings)
+        with self.assertLogs('profiler', level='WARNING'):
+            res = self.client().get('/movies',
+                                    headers=self.casting_assistant)
+        timing = res.headers.get('Server-Timing', '')
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check every phase is timed and the statements are counted
+        for phase in ('auth;dur=', 'db;dur=', 'serialize;dur=',
+                      'total;dur='):
+            self.assertIn(phase, timing)
+        self.assertGreater(int(res.headers['X-Query-Count']), 0)
+
+    # TEST: no Server-Timing header unless profiling is asked for
+    def test_get_movies_without_server_timing(self):
+        # Store the response in the 'res' variable
+        res = self.client().get('/movies', headers=self.casting_assistant)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the request wasn't profiled
+        self.assertNotIn('Server-Timing', res.headers)
+
+    # TEST (Successful Operation): GET /movies in MessagePack
+    def test_get_movies_as_msgpack(self):
+        # Store the response in the 'res' variable
+        res = self.client().get('/movies', headers=dict(
+            self.casting_assistant, Accept='application/msgpack'))
+        data = msgpack.unpackb(res.data, raw=False)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'application/msgpack')
+        # Check the movies are there, with the dates of the JSON responses
+        self.assertEqual(data['success'], True)
+        self.assertTrue(data['movies'][0]['release_date'].endswith('GMT'))
+
+    # TEST (Unsuccessful Operation): AuthError in MessagePack
+    def test_401_as_msgpack(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/movies', headers={'Accept': 'application/msgpack'})
+        data = msgpack.unpackb(res.data, raw=False)
+
+        # Check the status code is 401
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(res.mimetype, 'application/msgpack')
+        self.assertEqual(data['success'], False)
+
+    # TEST (Successful Operation): GET /movies compressed with gzip
+    def test_get_movies_gzip(self):
+        min_size = compression.COMPRESSION_MIN_SIZE
+        compression.COMPRESSION_MIN_SIZE = 0
+        try:
+            # Store the response in the 'res' variable
+            res = self.client().get('/movies', headers=dict(
+                self.casting_assistant, **{'Accept-Encoding': 'gzip'}))
+        finally:
+            compression.COMPRESSION_MIN_SIZE = min_size
+        data = json.loads(gzip.decompress(res.data))
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(data['success'], True)
+
+    # TEST (Successful Operation): streamed GET /movies compressed with gzip
+    def test_get_movies_stream_gzip(self):
+        # Store the response in the 'res' variable
+        res = self.client().get('/movies?format=ndjson', headers=dict(
+            self.casting_assistant, **{'Accept-Encoding': 'gzip'}))
+        lines = gzip.decompress(res.data).decode().splitlines()
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        # Check every line is a movie
+        self.assertTrue(len(lines) > 0)
+        self.assertIn('title', json.loads(lines[0]))
+
+    # TEST: small responses aren't compressed
+    def test_index_not_compressed(self):
+        # Store the response in the 'res' variable
+        res = self.client().get('/', headers={'Accept-Encoding': 'gzip'})
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('Content-Encoding', res.headers)
+
+    # Create a movie and two actors, and cast them
+    def cast_movie(self):
+        movie_ids = Movie.bulk_insert(
+            [{'title': 'Cast Movie', 'release_date': date(2001, 1, 1)}])
+        actor_ids = Actor.bulk_insert([
+            {'name': 'Cast Actor', 'age': 30, 'gender': 'Female'},
+            {'name': 'Cast Actor', 'age': 40, 'gender': 'Male'}])
+        res = self.client().post(
+            '/castings/bulk',
+            headers=self.casting_director,
+            json=[{'movie_id': movie_ids[0], 'actor_id': actor_id,
+                   'role': 'Role %d' % index}
+                  for index, actor_id in enumerate(actor_ids)])
+        self.assertEqual(res.status_code, 200)
+        return movie_ids[0], actor_ids
+
+    # TEST (Successful Operation): POST /castings/bulk and
+    # GET /movies/<id>/cast
+    def test_get_movie_cast(self):
+        movie_id, actor_ids = self.cast_movie()
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/movies/%d/cast' % movie_id, headers=self.casting_assistant)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check both actors are cast, with their roles
+        self.assertEqual([actor['id'] for actor in data['cast']], actor_ids)
+        self.assertEqual(data['cast'][0]['role'], 'Role 0')
+
+    # TEST (Successful Operation): GET /actors/<id>/movies
+    def test_get_actor_movies(self):
+        movie_id, actor_ids = self.cast_movie()
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/actors/%d/movies' % actor_ids[1],
+            headers=self.casting_assistant)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['movies'][0]['id'], movie_id)
+        self.assertEqual(data['movies'][0]['role'], 'Role 1')
+
+    # TEST (Expected Error): GET /movies/<id>/cast (404: Not Found)
+    def test_404_if_movie_cast_not_found(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/movies/1000000/cast', headers=self.casting_assistant)
+
+        # Check the status code is 404
+        self.assertEqual(res.status_code, 404)
+
+    # TEST (Successful Operation): GET /movies?include=cast loads the
+    # cast of the whole page with one more query
+    def test_get_movies_include_cast(self):
+        movie_id, actor_ids = self.cast_movie()
+        self.app.config['PROFILING'] = True
+        res = self.client().get(
+            '/movies?limit=500', headers=self.casting_assistant)
+        # Store the response in the 'res' variable
+        res_cast = self.client().get(
+            '/movies?limit=500&include=cast',
+            headers=self.casting_assistant)
+        # Load the data using json.loads of the response
+        data = json.loads(res_cast.data)
+
+        # Check the status code is 200
+        self.assertEqual(res_cast.status_code, 200)
+        # Check every movie has its cast
+        movies = {movie['id']: movie for movie in data['movies']}
+        self.assertEqual(len(movies[movie_id]['cast']), 2)
+        self.assertTrue(all('cast' in movie for movie in data['movies']))
+        # Check the cast costs one query (plus the two more versions read
+        # for the ETag) whatever the number of movies
+        self.assertEqual(int(res_cast.headers['X-Query-Count']),
+                         int(res.headers['X-Query-Count']) + 3)
+
+    # TEST (Expected Error): POST /castings/bulk (422: unknown actor)
+    def test_422_if_casting_actor_not_found(self):
+        movie_id, actor_ids = self.cast_movie()
+        # Store the response in the 'res' variable
+        res = self.client().post(
+            '/castings/bulk',
+            headers=self.casting_director,
+            json=[{'movie_id': movie_id, 'actor_id': 1000000}])
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 422
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['results'][0]['errors'], ['actor not found'])
+
+    # TEST (Successful Operation): DELETE /castings/bulk
+    def test_delete_castings_bulk(self):
+        movie_id, actor_ids = self.cast_movie()
+        # Store the response in the 'res' variable
+        res = self.client().delete(
+            '/castings/bulk',
+            headers=self.casting_director,
+            json={'pairs': [[movie_id, actor_ids[0]],
+                            [movie_id, 1000000]]})
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['unassigned'], 1)
+        self.assertEqual(data['not_found'], [[movie_id, 1000000]])
+        # Check only the other actor is left in the cast
+        self.assertEqual(
+            [casting.actor_id for casting in Movie.query.get(movie_id).cast],
+            [actor_ids[1]])
+
+    # Check the statistics kept by the writes are the ones computed from
+    # the tables
+    def assert_stats_match_tables(self):
+        # Store the response in the 'res' variable
+        res = self.client().get('/stats', headers=self.casting_assistant)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+        self.assertEqual(res.status_code, 200)
+        with self.app.app_context():
+            rebuild_stats()
+            rebuilt = get_stats()
+        self.assertEqual(data['actors'], rebuilt['actors'])
+        self.assertEqual(data['movies'], rebuilt['movies'])
+        return data
+
+    # TEST (Successful Operation): GET /stats
+    def test_get_stats(self):
+        data = self.assert_stats_match_tables()
+
+        # Check the success body is true
+        self.assertEqual(data['success'], True)
+        # Check the totals and the buckets count every row
+        self.assertEqual(data['actors']['total'], Actor.query.count())
+        self.assertEqual(sum(data['actors']['by_gender'].values()),
+                         Actor.query.count())
+        self.assertEqual(sum(data['movies']['by_release_year'].values()),
+                         Movie.query.count())
+
+    # TEST (Successful Operation): the writes update GET /stats
+    def test_stats_follow_writes(self):
+        before = self.assert_stats_match_tables()['actors']
+
+        # Add an actor
+        res = self.client().post(
+            '/actors', headers=self.casting_director,
+            json={'name': 'Stats Actor', 'age': 101, 'gender': 'Stats'})
+        actor_id = json.loads(res.data)['actor']['id']
+        after = self.assert_stats_match_tables()['actors']
+        self.assertEqual(after['total'], before['total'] + 1)
+        self.assertEqual(after['by_gender']['Stats'], 1)
+        self.assertEqual(after['by_age']['100-109'], 1)
+
+        # Move it to another age range, then delete it
+        self.client().patch(
+            '/actors/bulk', headers=self.casting_director,
+            json={'ids': [actor_id], 'changes': {'age': 111}})
+        after = self.assert_stats_match_tables()['actors']
+        self.assertNotIn('100-109', after['by_age'])
+        self.assertEqual(after['by_age']['110-119'], 1)
+        self.client().delete(
+            '/actors/%d' % actor_id, headers=self.casting_director)
+        after = self.assert_stats_match_tables()['actors']
+        self.assertEqual(after['total'], before['total'])
+        self.assertNotIn('Stats', after['by_gender'])
+
+    # TEST (Expected Error): GET /stats without a token (401: Unauthorized)
+    def test_401_if_stats_not_authorized(self):
+        # Store the response in the 'res' variable
+        res = self.client().get('/stats')
+
+        # Check the status code is 401
+        self.assertEqual(res.status_code, 401)
+
+    # TEST (Successful Operation): GET /search finds the new actors by
+    # the prefix of their names, and no longer finds the deleted ones
+    def test_search_actors(self):
+        res = self.client().post(
+            '/actors', headers=self.casting_director,
+            json={'name': 'Searchable Zendaya', 'age': 25,
+                  'gender': 'Female'})
+        actor_id = json.loads(res.data)['actor']['id']
+
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/search?q=zenda searchable&type=actors',
+            headers=self.casting_assistant)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        # Check the actor is found, and only the actors were searched
+        self.assertEqual(data['actors'][0]['id'], actor_id)
+        self.assertNotIn('movies', data)
+
+        self.client().delete(
+            '/actors/%d' % actor_id, headers=self.casting_director)
+        res = self.client().get(
+            '/search?q=zenda searchable&type=actors',
+            headers=self.casting_assistant)
+        self.assertNotIn(actor_id, [
+            actor['id'] for actor in json.loads(res.data)['actors']])
+
+    # TEST (Expected Error): GET /search without q (400: Bad Request)
+    def test_400_if_search_query_missing(self):
+        # Store the response in the 'res' variable
+        res = self.client().get('/search', headers=self.casting_assistant)
+
+        # Check the status code is 400
+        self.assertEqual(res.status_code, 400)
+
+    # TEST (Expected Error): GET /search without a token (401:
+    # Unauthorized)
+    def test_401_if_search_not_authorized(self):
+        # Store the response in the 'res' variable
+        res = self.client().get('/search?q=movie')
+
+        # Check the status code is 401
+        self.assertEqual(res.status_code, 401)
+
+    # TEST (Successful Operation): GET /export (CSV)
+    def test_export_movies_csv(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/export?table=movies', headers=self.casting_assistant)
+        lines = res.data.decode('utf-8').splitlines()
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'text/csv')
+        # Check the header and one line per movie
+        self.assertEqual(lines[0], 'id,title,release_date')
+        self.assertEqual(len(lines) - 1, Movie.query.count())
+
+    # TEST (Successful Operation): GET /export (gzipped JSONL)
+    def test_export_actors_jsonl_gzip(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/export?table=actors&format=jsonl&gzip=true',
+            headers=self.casting_assistant)
+        rows = [json.loads(line)
+                for line in gzip.decompress(res.data).splitlines()]
+
+        # Check the status code is 200
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('actors.jsonl.gz',
+                      res.headers['Content-Disposition'])
+        # Check every actor is exported, in the order of the ids
+        self.assertEqual(len(rows), Actor.query.count())
+        self.assertEqual(rows, sorted(rows, key=lambda row: row['id']))
+        self.assertEqual(set(rows[0]), {'id', 'name', 'age', 'gender'})
+
+    # TEST (Expected Error): GET /export of an unknown table (400: Bad
+    # Request)
+    def test_400_if_export_table_unknown(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/export?table=castings', headers=self.casting_assistant)
+
+        # Check the status code is 400
+        self.assertEqual(res.status_code, 400)
+
+    # TEST (Successful Operation): flask import writes the valid rows, the
+    # rejects, and resumes from its checkpoint
+    def test_import_actors(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'actors.csv')
+        with open(path, 'w') as source:
+            source.write('name,age,gender\n'
+                         'Imported One,30,Male\n'
+                         'Imported Two,old,Female\n'
+                         'Imported Three,45,Female\n')
+        rejects = os.path.join(directory, 'rejects.jsonl')
+        checkpoint = os.path.join(directory, 'checkpoint.json')
+        count = Actor.query.count()
+
+        with self.app.app_context():
+            indexes = {name for name, definition
+                       in importer.secondary_indexes('actors')}
+            state = importer.import_file(
+                'actors', path, batch_size=1, rejects=rejects,
+                checkpoint=checkpoint, defer_indexes=True,
+                progress=lambda message: None)
+            # Check the valid rows are imported and the other one rejected
+            self.assertEqual((state['imported'], state['rejected']), (2, 1))
+            self.assertEqual(Actor.query.count(), count + 2)
+            with open(rejects) as lines:
+                reject = json.loads(lines.readline())
+            self.assertEqual(reject['line'], 2)
+            self.assertEqual(reject['errors'], ['age must be a number'])
+            # Check the indexes are built again
+            self.assertEqual({name for name, definition
+                              in importer.secondary_indexes('actors')},
+                             indexes)
+
+            # Check a second run resumes after the imported rows
+            importer.import_file('actors', path, checkpoint=checkpoint,
+                                 progress=lambda message: None)
+            self.assertEqual(Actor.query.count(), count + 2)
+
+    # TEST (Expected Error): the reads are shed while the pool wait is
+    # too long (503: Service Unavailable), the writes and / are served
+    def test_503_if_overloaded(self):
+        admission.pool_waits.clear()
+        admission.pool_waits.add(
+            admission.ADMISSION_POOL_WAIT_THRESHOLD + 1)
+        try:
+            # Store the response in the 'res' variable
+            res = self.client().get('/movies',
+                                    headers=self.casting_assistant)
+            # Load the data using json.loads of the response
+            data = json.loads(res.data)
+            res_write = self.client().delete(
+                '/actors/1000000', headers=self.casting_director)
+            res_index = self.client().get('/')
+        finally:
+            admission.pool_waits.clear()
+
+        # Check the status code is 503, with the time to wait
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(res.headers['Retry-After'],
+                         str(admission.ADMISSION_RETRY_AFTER))
+        # Check the write and the exempt route are still served
+        self.assertEqual(res_write.status_code, 404)
+        self.assertEqual(res_index.status_code, 200)
+
+    # TEST (Expected Error): a request that gets no slot in time (503:
+    # Service Unavailable), while the reserved slots still admit writes
+    def test_503_if_no_slot(self):
+        limiter = admission.limiter
+        limiter.active = limiter.read_limit
+        try:
+            # Store the response in the 'res' variable
+            res = self.client().get('/actors',
+                                    headers=self.casting_assistant)
+            res_write = self.client().delete(
+                '/actors/1000000', headers=self.casting_director)
+        finally:
+            limiter.active = 0
+
+        # Check the status code is 503
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res_write.status_code, 404)
+
+    # TEST: the event of a write that commits after a later one is moved
+    # after it, with the rows it stamped
+    def test_change_committed_late_moves_after_later_one(self):
+        with self.app.app_context():
+            actor = Actor.query.first()
+            change = begin_change('actors', 'update')
+            actor.name = 'Late Actor'
+            actor.change_seq, actor.updated_at = change.seq, change.at
+            db.session.flush()
+            # An event allocated after it (and committed first)
+            later = begin_change('movies', 'update')
+            seq = record_change(change, [actor.id])
+            db.session.commit()
+
+            # Check the event and the row are after the later event
+            self.assertGreater(seq, later.seq)
+            self.assertEqual(Actor.query.get(actor.id).change_seq, seq)
+
+    # TEST (Successful Operation): GET /actors?since= returns only the
+    # actors written and deleted after the watermark
+    def test_sync_actors(self):
+        # Stamp the actors inserted without a change event (flask
+        # stamp-changes)
+        result = self.app.test_cli_runner().invoke(args=['stamp-changes'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Stamped', result.output)
+        # Store the response in the 'res' variable
+        res = self.client().get('/actors?since=0&limit=500',
+                                headers=self.casting_assistant)
+        # Load the data using json.loads of the response
+        data = json.loads(res.data)
+
+        # Check the status code is 200 and every actor is returned
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data['actors']), Actor.query.count())
+        self.assertEqual(data['more'], False)
+
+        res = self.client().post('/actors', headers=self.casting_director,
+                                 json={'name': 'Synced Actor', 'age': 40,
+                                       'gender': 'Male'})
+        created_id = json.loads(res.data)['actor']['id']
+        res = self.client().post('/actors', headers=self.casting_director,
+                                 json={'name': 'Deleted Actor', 'age': 41,
+                                       'gender': 'Male'})
+        deleted_id = json.loads(res.data)['actor']['id']
+        self.client().delete('/actors/%d' % deleted_id,
+                             headers=self.casting_director)
+
+        res = self.client().get('/actors?since=' + data['watermark'],
+                                headers=self.casting_assistant)
+        delta = json.loads(res.data)
+        # Check only the changes are returned
+        self.assertEqual([actor['id'] for actor in delta['actors']],
+                         [created_id])
+        self.assertIn('updated_at', delta['actors'][0])
+        self.assertEqual(delta['deleted'], [deleted_id])
+
+        # Check the pages of a delta, then nothing after the watermark
+        res = self.client().get(
+            '/actors?limit=1&since=' + data['watermark'],
+            headers=self.casting_assistant)
+        page = json.loads(res.data)
+        self.assertEqual(page['more'], True)
+        res = self.client().get('/actors?since=' + page['watermark'],
+                                headers=self.casting_assistant)
+        self.assertEqual(json.loads(res.data)['deleted'], [deleted_id])
+        res = self.client().get('/actors?since=' + delta['watermark'],
+                                headers=self.casting_assistant)
+        self.assertEqual(json.loads(res.data)['actors'], [])
+
+    # TEST (Successful Operation): GET /actors?since= with a watermark
+    # older than the events left (flask prune-changes) returns every
+    # actor with reset
+    def test_sync_actors_reset_after_prune(self):
+        res = self.client().get('/actors?since=0&limit=500',
+                                headers=self.casting_assistant)
+        watermark = json.loads(res.data)['watermark']
+        res = self.client().post('/actors', headers=self.casting_director,
+                                 json={'name': 'Pruned Actor', 'age': 50,
+                                       'gender': 'Male'})
+        deleted_id = json.loads(res.data)['actor']['id']
+        self.client().delete('/actors/%d' % deleted_id,
+                             headers=self.casting_director)
+        res = self.client().post('/actors', headers=self.casting_director,
+                                 json={'name': 'Kept Actor', 'age': 51,
+                                       'gender': 'Male'})
+        created_id = json.loads(res.data)['actor']['id']
+
+        # Delete every event but the last one, with the tombstone
+        result = self.app.test_cli_runner().invoke(
+            args=['prune-changes', '--days', '0'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Deleted', result.output)
+
+        res = self.client().get('/actors?since=' + watermark + '&limit=500',
+                                headers=self.casting_assistant)
+        data = json.loads(res.data)
+        # Check the client is told to replace its copy
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['reset'], True)
+        self.assertEqual(data['deleted'], [])
+        self.assertIn(created_id, [actor['id'] for actor in data['actors']])
+        res = self.client().get('/actors?since=' + data['watermark'],
+                                headers=self.casting_assistant)
+        self.assertEqual(json.loads(res.data)['reset'], False)
+
+    # TEST (Expected Error): GET /movies?since= with a bad watermark (400:
+    # Bad Request)
+    def test_400_if_sync_watermark_invalid(self):
+        # Store the response in the 'res' variable
+        res = self.client().get('/movies?since=yesterday',
+                                headers=self.casting_assistant)
+
+        # Check the status code is 400
+        self.assertEqual(res.status_code, 400)
+
+    # TEST (Successful Operation): GET /changes/stream sends the change
+    # of a POST /actors after the client's Last-Event-ID
+    def test_stream_changes(self):
+        changes.hub.start(self.app)
+        position = changes.hub.position()
+        res = self.client().post('/actors', headers=self.casting_director,
+                                 json={'name': 'Streamed Actor', 'age': 33,
+                                       'gender': 'Female'})
+        actor_id = json.loads(res.data)['actor']['id']
+
+        # Store the response in the 'res' variable (not buffered, the
+        # stream ends after 5 seconds)
+        res = self.client().get(
+            '/changes/stream?tables=actors&duration=5',
+            headers=dict(self.casting_assistant,
+                         **{'Last-Event-ID': str(position)}),
+            buffered=False)
+        events = []
+        try:
+            for chunk in res.response:
+                if chunk.startswith(b'id: '):
+                    events.append(chunk)
+                    break
+        finally:
+            res.close()
+
+        # Check the status code is 200, and the event of the new actor
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'text/event-stream')
+        lines = events[0].decode('utf-8').splitlines()
+        self.assertEqual(lines[1], 'event: change')
+        data = json.loads(lines[2][len('data: '):])
+        self.assertEqual((data['table'], data['action'], data['ids']),
+                         ('actors', 'create', [actor_id]))
+        self.assertGreater(int(lines[0][len('id: '):]), position)
+
+    # TEST (Successful Operation): GET /changes/stream on a sync worker
+    # sends the pending events and ends instead of holding the worker
+    @unittest.skipIf(changes.GEVENT_WORKERS, 'gevent workers')
+    def test_stream_changes_ends_on_sync_workers(self):
+        # Store the response in the 'res' variable (buffered: it only
+        # returns once the stream has ended)
+        res = self.client().get('/changes/stream',
+                                headers=self.casting_assistant)
+
+        # Check the status code is 200 and the stream ended
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.data.startswith(b'retry: 3000\n\n'))
+        self.assertNotIn(b'keep-alive', res.data)
+        # Check it ends with the position the client resumes from
+        self.assertTrue(res.data.endswith(
+            ('id: %d\n\n' % changes.hub.position()).encode('ascii')))
+
+    # TEST (Expected Error): GET /changes/stream with a bad Last-Event-ID
+    # (400: Bad Request)
+    def test_400_if_last_event_id_invalid(self):
+        # Store the response in the 'res' variable
+        res = self.client().get(
+            '/changes/stream',
+            headers=dict(self.casting_assistant,
+                         **{'Last-Event-ID': 'yesterday'}))
+
+        # Check the status code is 400
+        self.assertEqual(res.status_code, 400)
+
+    # TEST (Expected Error): GET /changes/stream without a token (401:
+    # Unauthorized)
+    def test_401_if_change_stream_not_authorized(self):
+        # Store the response in the 'res' variable
+        res = self.client().get('/changes/stream')
+
+        # Check the status code is 401
+        self.assertEqual(res.status_code, 401)
+
+    # TEST: every route has a benchmark scenario
+    def test_benchmark_covers_every_route(self):
+        self.assertEqual(
+            uncovered_routes(self.app, default_scenarios()), [])
+
 
 # Make the tests conveniently executable
 if __name__ == "__main__":